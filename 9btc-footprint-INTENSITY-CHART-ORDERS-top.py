@@ -876,6 +876,7 @@ def index():
         let currentData = null, orderBookData = null, viewStart = 0, viewCount = 22, isFirstLoad = true;
         let autoRefreshInterval = null, obRefreshInterval = null;
         let currentInterval = '1m', currentStep = '10';
+        let depthLadder = null, serverSignal = null, signalHistory = null;
         const refreshIntervals = {'1m': 15000, '5m': 30000, '15m': 60000, '30m': 60000, '1h': 60000, '1d': 300000};
         
         
@@ -943,7 +944,7 @@ def index():
             currentInterval = interval;
             currentStep = step;
             
-            fetch('/api/data?interval=' + interval + '&step=' + step + '&filter_mode=' + (filterEnabled ? 'percentile' : 'none') + '&filter_percentile=' + currentPercentile)
+            fetch('/api/data?interval=' + interval + '&step=' + step + '&delta_mode=kline' + '&filter_mode=' + (filterEnabled ? 'percentile' : 'none') + '&filter_percentile=' + currentPercentile)
                 .then(r => r.json())
                 .then(data => {
                     if (!data || !data.bars || data.bars.length === 0) {
@@ -960,6 +961,9 @@ def index():
                     orderBookData = obData || {bids: [], asks: []};
                     updateObDisplay();
                     startObRefresh();
+                    return Promise.all([loadDepthLadder(), loadSignal()]);
+                })
+                .then(() => {
                     resetView();
                     document.getElementById('loading').classList.remove('active');
                 })
@@ -974,8 +978,10 @@ def index():
             const step = document.getElementById('step').value;
 
             Promise.all([
-                fetch('/api/data?interval=' + interval + '&step=' + step + '&update_last=true' + '&filter_mode=' + (filterEnabled ? 'percentile' : 'none') + '&filter_percentile=' + currentPercentile).then(r => r.json()),
-                fetch('/api/orderbook').then(r => r.json())
+                fetch('/api/data?interval=' + interval + '&step=' + step + '&delta_mode=kline' + '&update_last=true' + '&filter_mode=' + (filterEnabled ? 'percentile' : 'none') + '&filter_percentile=' + currentPercentile).then(r => r.json()),
+                fetch('/api/orderbook').then(r => r.json()),
+                loadDepthLadder(),
+                loadSignal()
             ])
             .then(([data, obData]) => {
                 if (data && data.bars && data.bars.length > 0) {
@@ -1017,6 +1023,14 @@ def index():
 
 
         
+        function loadDepthLadder() {
+            // Ladder gia' aggregato dal server (se disponibile), altrimenti obMap lato client
+            return fetch('/api/depth_ladder?step=' + currentStep)
+                .then(r => r.ok ? r.json() : null)
+                .then(d => { depthLadder = (d && d.levels) ? d : null; })
+                .catch(() => { depthLadder = null; });
+        }
+
         function startObRefresh() {
             if (obRefreshInterval) clearInterval(obRefreshInterval);
             obRefreshInterval = setInterval(() => {
@@ -1026,7 +1040,7 @@ def index():
                         if (obData && obData.bids) {
                             orderBookData = obData;
                             updateObDisplay();
-                            renderChart();
+                            Promise.all([loadDepthLadder(), loadSignal()]).then(renderChart);
                             
                         }
                     })
@@ -1051,7 +1065,7 @@ def index():
             }
         }
 
-        function calculateTradingSignal() {
+        function computeLocalSignal() {
             if (!currentData || !currentData.stats || !orderBookData) {
                 return { signal: 'neutral', strength: 0, obDelta: 0, footprintDelta: 0, volumeRatio: 0 };
             }
@@ -1178,6 +1192,28 @@ def index():
             }
 
 
+            return {
+                signal: signal,
+                strength: Math.min(100, strength),
+                weightedObDelta: weightedObDelta,
+                totalObDelta: totalObDelta,
+                footprintDelta: footprintDelta,
+                volumeRatio: volumeRatio.toFixed(2),
+                compositeScore: compositeScore.toFixed(4),
+                normalizedObDelta: normalizedObDelta.toFixed(4),
+                normalizedFpDelta: normalizedFpDelta.toFixed(4)
+            };
+        }
+
+
+
+        function calculateTradingSignal() {
+            // Segnale e storico fasi/intensita' mantenuti dal server, fallback locale
+            if (serverSignal) return serverSignal;
+            const result = computeLocalSignal();
+            if (!currentData || !currentData.stats || !orderBookData) return result;
+            const signal = result.signal, strength = result.strength;
+
         // ============================================
         // TRACKING FASI STRATEGIA
         // ============================================
@@ -1252,21 +1288,20 @@ def index():
             intensityHistory.signals.shift();
         }
 
-
-            return {
-                signal: signal,
-                strength: Math.min(100, strength),
-                weightedObDelta: weightedObDelta,
-                totalObDelta: totalObDelta,
-                footprintDelta: footprintDelta,
-                volumeRatio: volumeRatio.toFixed(2),
-                compositeScore: compositeScore.toFixed(4),
-                normalizedObDelta: normalizedObDelta.toFixed(4),
-                normalizedFpDelta: normalizedFpDelta.toFixed(4)
-            };
+            return result;
         }
 
-
+        function loadSignal() {
+            const history = fetch('/api/signal_history?minutes=120')
+                .then(r => r.ok ? r.json() : null)
+                .then(d => { signalHistory = (d && d.intensity) ? d : null; })
+                .catch(() => { signalHistory = null; });
+            const signal = fetch('/api/signal?interval=' + currentInterval + '&step=' + currentStep)
+                .then(r => r.ok ? r.json() : null)
+                .then(d => { serverSignal = (d && d.signal) ? d : null; })
+                .catch(() => { serverSignal = null; });
+            return Promise.all([signal, history]);
+        }
 
         function renderTradingSignal() {
             const signalData = calculateTradingSignal();
@@ -1332,6 +1367,7 @@ def index():
         // ============================================
 
         function calculateWeightedDistribution() {
+            if (signalHistory) return signalHistory.distribution;
             if (!window.strategyPhaseTracker) return null;
 
             const tracker = window.strategyPhaseTracker;
@@ -1507,11 +1543,11 @@ def index():
             const canvas = document.getElementById('avgIntensityCanvas');
             const timeWindowSelect = document.getElementById('intensityTimeWindow');
 
-            if (!canvas || !timeWindowSelect || !window.avgIntensityHistory) return;
+            const history = signalHistory ? signalHistory.intensity : window.avgIntensityHistory;
+            if (!canvas || !timeWindowSelect || !history) return;
 
             const timeWindow = parseInt(timeWindowSelect.value);
             const ctx = canvas.getContext('2d');
-            const history = window.avgIntensityHistory;
 
             if (history.timestamps.length === 0) return;
 
@@ -1771,7 +1807,11 @@ def index():
             const sortedPrices = Array.from(allPrices).sort((a, b) => b - a);
             
             const obMap = {};
-            if (orderBookData && orderBookData.bids) {
+            let maxObVol = 0;
+            if (depthLadder && depthLadder.step === parseFloat(currentStep)) {
+                depthLadder.levels.forEach(l => { obMap[l.price] = {bid: l.bid, ask: l.ask}; });
+                maxObVol = depthLadder.max_vol;
+            } else if (orderBookData && orderBookData.bids) {
                 const step = parseFloat(currentStep);
                 (orderBookData.bids || []).forEach(pair => {
                     const p = Math.round(parseFloat(pair[0] || 0) / step) * step;
@@ -1783,11 +1823,9 @@ def index():
                     if (!obMap[p]) obMap[p] = {bid: 0, ask: 0};
                     obMap[p].ask += parseFloat(pair[1] || 0);
                 });
+                Object.keys(obMap).forEach(k => { maxObVol = Math.max(maxObVol, obMap[k].bid, obMap[k].ask); });
             }
             
-            let maxObVol = 0;
-            Object.keys(obMap).forEach(k => { maxObVol = Math.max(maxObVol, obMap[k].bid, obMap[k].ask); });
-            
             let html = '<div style="display: flex;"><table class="footprint-table" style="width: 100%; border-collapse: collapse;"><tr>';
             displayBars.forEach(bar => {
                 html += '<td class="bar-column time-header"><div class="time-text">' + bar.time + '</div><div class="ohlc-text">O:' + bar.open + ' H:' + bar.high + ' L:' + bar.low + ' C:' + bar.close + '</div></td>';
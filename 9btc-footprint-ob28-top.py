@@ -342,6 +342,7 @@ def index():
         let currentData = null, orderBookData = null, viewStart = 0, viewCount = 22, isFirstLoad = true;
         let autoRefreshInterval = null, obRefreshInterval = null;
         let currentInterval = '1m', currentStep = '10';
+        let depthLadder = null;
         const refreshIntervals = {'1m': 15000, '5m': 30000, '15m': 60000, '30m': 60000, '1h': 60000, '1d': 300000};
         
         function changeTimeframe() {
@@ -374,7 +375,7 @@ def index():
             currentInterval = interval;
             currentStep = step;
             
-            fetch('/api/data?interval=' + interval + '&step=' + step)
+            fetch('/api/data?interval=' + interval + '&step=' + step + '&delta_mode=kline')
                 .then(r => r.json())
                 .then(data => {
                     if (!data || !data.bars || data.bars.length === 0) {
@@ -391,6 +392,9 @@ def index():
                     orderBookData = obData || {bids: [], asks: []};
                     updateObDisplay();
                     startObRefresh();
+                    return loadDepthLadder();
+                })
+                .then(() => {
                     resetView();
                     document.getElementById('loading').classList.remove('active');
                 })
@@ -405,8 +409,9 @@ def index():
             const step = document.getElementById('step').value;
 
             Promise.all([
-                fetch('/api/data?interval=' + interval + '&step=' + step + '&update_last=true').then(r => r.json()),
-                fetch('/api/orderbook').then(r => r.json())
+                fetch('/api/data?interval=' + interval + '&step=' + step + '&delta_mode=kline' + '&update_last=true').then(r => r.json()),
+                fetch('/api/orderbook').then(r => r.json()),
+                loadDepthLadder()
             ])
             .then(([data, obData]) => {
                 if (data && data.bars && data.bars.length > 0) {
@@ -448,6 +453,14 @@ def index():
 
 
         
+        function loadDepthLadder() {
+            // Ladder gia' aggregato dal server (se disponibile), altrimenti obMap lato client
+            return fetch('/api/depth_ladder?step=' + currentStep)
+                .then(r => r.ok ? r.json() : null)
+                .then(d => { depthLadder = (d && d.levels) ? d : null; })
+                .catch(() => { depthLadder = null; });
+        }
+
         function startObRefresh() {
             if (obRefreshInterval) clearInterval(obRefreshInterval);
             obRefreshInterval = setInterval(() => {
@@ -457,7 +470,7 @@ def index():
                         if (obData && obData.bids) {
                             orderBookData = obData;
                             updateObDisplay();
-                            renderChart();
+                            loadDepthLadder().then(renderChart);
                             
                         }
                     })
@@ -653,7 +666,11 @@ def index():
             const sortedPrices = Array.from(allPrices).sort((a, b) => b - a);
             
             const obMap = {};
-            if (orderBookData && orderBookData.bids) {
+            let maxObVol = 0;
+            if (depthLadder && depthLadder.step === parseFloat(currentStep)) {
+                depthLadder.levels.forEach(l => { obMap[l.price] = {bid: l.bid, ask: l.ask}; });
+                maxObVol = depthLadder.max_vol;
+            } else if (orderBookData && orderBookData.bids) {
                 const step = parseFloat(currentStep);
                 (orderBookData.bids || []).forEach(pair => {
                     const p = Math.round(parseFloat(pair[0] || 0) / step) * step;
@@ -665,11 +682,9 @@ def index():
                     if (!obMap[p]) obMap[p] = {bid: 0, ask: 0};
                     obMap[p].ask += parseFloat(pair[1] || 0);
                 });
+                Object.keys(obMap).forEach(k => { maxObVol = Math.max(maxObVol, obMap[k].bid, obMap[k].ask); });
             }
             
-            let maxObVol = 0;
-            Object.keys(obMap).forEach(k => { maxObVol = Math.max(maxObVol, obMap[k].bid, obMap[k].ask); });
-            
             let html = '<table class="footprint-table" style="width: 100%; border-collapse: collapse;"><tr>';
             displayBars.forEach(bar => {
                 html += '<td class="bar-column time-header"><div class="time-text">' + bar.time + '</div><div class="ohlc-text">O:' + bar.open + ' H:' + bar.high + ' L:' + bar.low + ' C:' + bar.close + '</div></td>';
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - ASSORBIMENTI E ICEBERG
+Rilevatore in streaming che unisce gli aggTrade alle variazioni di quantita'
+per prezzo del book locale: muri che assorbono flusso aggressivo senza
+essere consumati e livelli che si ricaricano dopo essere stati colpiti
+"""
+
+import time
+from collections import OrderedDict, deque
+
+ABSORPTION_MIN_VOLUME = {"BTCUSDT": 5.0, "ETHUSDT": 100.0, "SOLUSDT": 2000.0}  # eseguito sul livello
+ABSORPTION_RATIO = 1.0        # eseguito >= 1x la quantita' esposta al primo trade
+ABSORPTION_HOLD_PCT = 50.0    # ...e il livello mostra ancora almeno il 50% di quella quantita'
+LEVEL_WINDOW_MS = 10000       # un episodio su un livello si chiude dopo 10s senza trade
+REFILL_WINDOW_MS = 1000       # ricarica: quantita' che risale entro 1s dall'ultimo trade
+MAX_TRACKED_LEVELS = 500      # livelli colpiti seguiti contemporaneamente
+MAX_EVENTS = 200              # eventi recenti tenuti per lo stream e /api/absorption
+
+
+class AbsorptionDetector:
+    """
+    Listener del book (reset/update) alimentato anche dai trade. Per ogni
+    livello colpito tiene un episodio indicizzato per (lato, prezzo):
+    quantita' esposta iniziale, di picco e corrente, volume eseguito,
+    ricariche. L'assorbimento si valuta al primo aggiornamento depth
+    successivo ai trade (il book non e' mai in anticipo sullo stream trade),
+    quindi l'evento arriva al piu' un intervallo depth dopo.
+    """
+
+    def __init__(self, min_volume, ratio=ABSORPTION_RATIO, hold_pct=ABSORPTION_HOLD_PCT):
+        self.min_volume = min_volume
+        self.ratio = ratio
+        self.hold = hold_pct / 100
+        self.book = None
+        self.levels = OrderedDict()   # (is_bid, prezzo) -> episodio, dal meno recente
+        self.pending = set()          # livelli con trade non ancora confrontati col book
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.seq = 0
+        self.clock = 0                # ms dell'ultimo trade visto
+
+    # ------------------------------------------------------------------
+    # Listener del book
+    # ------------------------------------------------------------------
+
+    def reset(self, book):
+        self.book = book
+        self.levels.clear()
+        self.pending.clear()
+
+    def update(self, is_bid, price, old_qty, new_qty):
+        level = self.levels.get((is_bid, price))
+        if level is None:
+            return
+        level['qty'] = new_qty
+        if new_qty > old_qty and level['low'] < level['peak'] and self.clock - level['last_trade'] <= REFILL_WINDOW_MS:
+            level['refills'] += 1
+            level['refilled'] += new_qty - old_qty
+            self._emit('refill', is_bid, price, level, added=round(new_qty - old_qty, 8))
+        level['low'] = min(level['low'], new_qty)
+        level['peak'] = max(level['peak'], new_qty)
+
+    # ------------------------------------------------------------------
+    # Trade e confronto col book
+    # ------------------------------------------------------------------
+
+    def on_trade(self, trade):
+        """Un aggTrade colpisce il bid se il compratore e' maker, altrimenti l'ask"""
+        if self.book is None or not self.book.synced:
+            return
+        is_bid, price, qty = bool(trade.get('m')), float(trade['p']), float(trade['q'])
+        ts = int(trade['T'])
+        self.clock = max(self.clock, ts)
+        key = (is_bid, price)
+        level = self.levels.get(key)
+        if level is None:
+            shown = self.book.side(is_bid).levels.get(price, 0.0)
+            level = self.levels[key] = {'first_trade': ts, 'last_trade': ts, 'start_qty': shown, 'qty': shown,
+                                        'peak': shown, 'low': shown, 'traded': 0.0, 'trades': 0,
+                                        'refills': 0, 'refilled': 0.0, 'absorbed': False}
+            while len(self.levels) > MAX_TRACKED_LEVELS:
+                old_key, _ = self.levels.popitem(last=False)
+                self.pending.discard(old_key)
+        self.levels.move_to_end(key)
+        level['traded'] += qty
+        level['trades'] += 1
+        level['last_trade'] = ts
+        self.pending.add(key)
+
+    def on_book(self, event_ms):
+        """Dopo ogni evento depth applicato: valuta i livelli colpiti e chiude gli episodi scaduti"""
+        for key in self.pending:
+            level = self.levels.get(key)
+            if level is not None and not level['absorbed'] and self._absorbing(level):
+                level['absorbed'] = True
+                self._emit('absorption', key[0], key[1], level)
+        self.pending.clear()
+        expired = event_ms - LEVEL_WINDOW_MS
+        while self.levels:
+            key, level = next(iter(self.levels.items()))
+            if level['last_trade'] >= expired:
+                break
+            del self.levels[key]
+
+    def _absorbing(self, level):
+        start = level['start_qty'] or level['peak']   # livello non ancora nel book al primo trade
+        return (level['traded'] >= self.min_volume and level['traded'] >= self.ratio * start
+                and level['qty'] > 0 and level['qty'] >= self.hold * start)
+
+    def _emit(self, kind, is_bid, price, level, **extra):
+        self.seq += 1
+        now = int(time.time() * 1000)
+        self.events.append(dict({
+            'seq': self.seq, 'type': kind, 'side': 'bid' if is_bid else 'ask', 'price': price,
+            'traded': round(level['traded'], 8), 'trades': level['trades'], 'displayed': level['qty'],
+            'start_qty': level['start_qty'], 'peak_qty': level['peak'], 'refills': level['refills'],
+            # Iceberg: eseguito piu' di quanto il livello abbia mai mostrato
+            'iceberg': level['traded'] > level['peak'],
+            'first_trade': level['first_trade'], 'last_trade': level['last_trade'],
+            'timestamp': now, 'latency_ms': max(0, now - level['last_trade']),
+        }, **extra))
+
+    def recent(self, after=0, limit=50):
+        """Eventi con seq > after, i piu' recenti per ultimi"""
+        events = [e for e in self.events if e['seq'] > after]
+        return {'seq': self.seq, 'events': events[-limit:] if limit else []}
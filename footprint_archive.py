@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - ARCHIVIO STORICO DEL BOOK
+Keyframe periodici del book completo piu' log dei diff per evento depth,
+in segmenti orari con indice dei keyframe: il book a un istante qualsiasi
+si ricostruisce leggendo un keyframe e al massimo ARCHIVE_KEYFRAME_SECONDS
+di diff
+"""
+
+import json
+import os
+import zlib
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+import numpy as np
+
+from footprint_bars import TICK_SIZES
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book_archive")
+ARCHIVE_KEYFRAME_SECONDS = 60    # distanza massima tra keyframe (limita i diff da riapplicare)
+ARCHIVE_FLUSH_SECONDS = 1        # scrittura su disco del buffer (ritardo visibile ai worker)
+ARCHIVE_RETENTION_HOURS = 72     # segmenti orari tenuti per simbolo
+ARCHIVE_MAX_MB = 2048            # spazio massimo per simbolo, i segmenti piu' vecchi vengono cancellati
+QTY_LOT = 1e-8                   # quantita' salvate come interi di lotti
+
+KEYFRAME, DIFF, GAP = 0, 1, 2
+RECORD = np.dtype([('kind', 'u1'), ('ts', '<i8'), ('n', '<u4'), ('size', '<u4')])   # intestazione di ogni record
+INDEX = np.dtype([('ts', '<i8'), ('offset', '<i8')])                                # keyframe del segmento
+
+
+def segment_name(ts):
+    return datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d_%H")
+
+
+def encode(sides, ticks, qty):
+    """
+    Colonne lato (1 bid, 0 ask), tick e lotti ordinate per (lato, tick): i
+    tick sono salvati come differenza dal precedente, poi zlib
+    """
+    ticks = np.diff(ticks, prepend=0)
+    return zlib.compress(np.concatenate([sides, ticks, qty]).astype('<i8').tobytes())
+
+
+def decode(payload, n):
+    cols = np.frombuffer(zlib.decompress(payload), dtype='<i8').reshape(3, n)
+    return cols[0], np.cumsum(cols[1]), cols[2]
+
+
+def columns(entries):
+    """Colonne ordinate da (is_bid, tick, lotti)"""
+    if not entries:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.int64)
+    arr = np.array(entries, dtype=np.int64).reshape(-1, 3)
+    order = np.lexsort((arr[:, 1], arr[:, 0]))
+    return arr[order, 0], arr[order, 1], arr[order, 2]
+
+
+class BookArchive:
+    """
+    Listener del book (reset / update come gli altri indici): gli update di
+    un evento depth si accumulano come variazioni di lotti per livello e
+    flush() li scrive come un record DIFF con il tempo dell'evento. Dopo un
+    nuovo snapshot, a ogni cambio di segmento e ogni ARCHIVE_KEYFRAME_SECONDS
+    si scrive invece un KEYFRAME con il book intero; la perdita della
+    sincronizzazione scrive un GAP. Solo il processo che possiede gli engine
+    scrive (start(), con il tick di exchangeInfo), gli altri leggono i file.
+    Ogni segmento ha un {nome}.meta con tick e lotto con cui e' scritto: la
+    ricostruzione usa quelli, e un segmento scritto con un altro tick non
+    viene piu' aggiornato.
+    """
+
+    def __init__(self, symbol, directory=ARCHIVE_DIR, tick_size=None):
+        self.symbol = symbol
+        self.tick_size = tick_size if tick_size is not None else TICK_SIZES.get(symbol)
+        self.path = os.path.join(directory, symbol.lower()) if directory else None
+        self.writing = False
+        self.book = None
+        self.pending = {}          # (is_bid, tick) -> variazione in lotti
+        self.need_keyframe = True
+        self.last_keyframe = 0
+        self.segment = None        # nome del segmento aperto
+        self.log = None
+        self.index = None
+        self.last_write = 0
+        self.gap = False
+        self.segment_ticks = {}    # nome del segmento -> tick con cui e' scritto
+        self.counts = {'keyframes': 0, 'diffs': 0, 'bytes': 0}
+
+    def start(self, tick_size=None):
+        """Inizia a scrivere con il tick confermato (senza tick non si scrive)"""
+        if tick_size is not None:
+            self.tick_size = tick_size
+        if self.tick_size is None:
+            print(f"[WARN] Archivio book {self.symbol}: tick sconosciuto, archivio non avviato")
+            return False
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+            self.writing = True
+        return self.writing
+
+    def close(self):
+        for f in (self.log, self.index):
+            if f is not None:
+                f.close()
+        self.log = self.index = self.segment = None
+        self.writing = False
+
+    def tick(self, price):
+        return int(round(price / self.tick_size))
+
+    def lots(self, qty):
+        return int(round(qty / QTY_LOT))
+
+    # ------------------------------------------------------------------
+    # Listener del book
+    # ------------------------------------------------------------------
+
+    def reset(self, book):
+        self.book = book
+        self.pending.clear()
+        self.need_keyframe = True
+
+    def update(self, is_bid, price, old, new):
+        if not self.writing:
+            return
+        key = (is_bid, self.tick(price))
+        self.pending[key] = self.pending.get(key, 0) + self.lots(new) - self.lots(old)
+
+    def flush(self, ts):
+        """Chiude l'evento depth applicato al tempo ts dell'exchange"""
+        if not self.writing or self.book is None:
+            return
+        if self.need_keyframe or segment_name(ts) != self.segment or ts - self.last_keyframe >= ARCHIVE_KEYFRAME_SECONDS * 1000:
+            # Il book contiene gia' le variazioni in attesa
+            self.pending.clear()
+            self.keyframe(ts, self.book.bids.levels.items(), self.book.asks.levels.items())
+        elif self.pending:
+            entries = [(int(is_bid), tick, d) for (is_bid, tick), d in self.pending.items() if d]
+            self.pending.clear()
+            if entries:
+                self._write(DIFF, ts, *columns(entries))
+                self.counts['diffs'] += 1
+        self._maybe_flush(ts)
+
+    def mark_gap(self, ts):
+        """Book desincronizzato: la ricostruzione non deve attraversare il buco"""
+        if self.writing and not self.gap and self.log is not None:
+            self._write(GAP, ts, *columns([]))
+            self.gap = True
+            self.need_keyframe = True
+
+    def keyframe(self, ts, bids, asks):
+        """Book intero (coppie prezzo, quantita') come punto di ingresso dell'indice"""
+        if not self.writing:
+            return
+        self._open(ts)
+        if self.log is None:
+            return   # segmento scritto con un altro tick
+        entries = [(1, self.tick(p), self.lots(q)) for p, q in bids]
+        entries += [(0, self.tick(p), self.lots(q)) for p, q in asks]
+        offset = self.log.tell()
+        self._write(KEYFRAME, ts, *columns(entries))
+        self.index.write(np.array([(ts, offset)], INDEX).tobytes())
+        self.need_keyframe = False
+        self.gap = False
+        self.last_keyframe = ts
+        self.counts['keyframes'] += 1
+
+    def record_snapshot(self, snapshot, ts):
+        """Snapshot REST (book non alimentato dallo stream) archiviato come keyframe"""
+        if self.writing and (self.book is None or not self.book.synced):
+            self.keyframe(ts, ((float(p), float(q)) for p, q in snapshot.get('bids', [])),
+                          ((float(p), float(q)) for p, q in snapshot.get('asks', [])))
+            self._maybe_flush(ts, force=True)
+
+    def _write(self, kind, ts, sides, ticks, qty):
+        payload = encode(sides, ticks, qty)
+        header = np.array([(kind, ts, len(sides), len(payload))], RECORD)
+        self.log.write(header.tobytes())
+        self.log.write(payload)
+        self.counts['bytes'] += RECORD.itemsize + len(payload)
+
+    def _maybe_flush(self, ts, force=False):
+        if self.log is not None and (force or ts - self.last_write >= ARCHIVE_FLUSH_SECONDS * 1000):
+            self.log.flush()
+            self.index.flush()
+            self.last_write = ts
+
+    def _open(self, ts):
+        """Apre il segmento orario di ts (ogni segmento inizia con un keyframe)"""
+        name = segment_name(ts)
+        if name == self.segment:
+            return
+        if self.log is not None:
+            self.log.close()
+            self.index.close()
+        self.segment = name
+        self.log = self.index = None
+        tick = self._segment_tick(name, None)
+        if tick is not None and tick != self.tick_size:
+            print(f"[WARN] Archivio book {self.symbol} {name} scritto con tick {tick:g} "
+                  f"invece di {self.tick_size:g}: segmento non aggiornato")
+            return
+        if tick is None:
+            tmp = os.path.join(self.path, f"{name}.meta.tmp")
+            with open(tmp, 'w') as f:
+                json.dump({'tick_size': self.tick_size, 'qty_lot': QTY_LOT}, f)
+            os.replace(tmp, os.path.join(self.path, f"{name}.meta"))
+            self.segment_ticks[name] = self.tick_size
+        self.log = open(os.path.join(self.path, f"{name}.log"), 'ab')
+        self.index = open(os.path.join(self.path, f"{name}.idx"), 'ab')
+        self.prune(ts)
+
+    def prune(self, ts):
+        """Retention: cancella i segmenti piu' vecchi di ARCHIVE_RETENTION_HOURS o oltre ARCHIVE_MAX_MB"""
+        cutoff = segment_name(ts - ARCHIVE_RETENTION_HOURS * 3600000)
+        segments = sorted(f[:-4] for f in os.listdir(self.path) if f.endswith('.log'))
+        sizes = {s: os.path.getsize(os.path.join(self.path, f"{s}.log")) for s in segments}
+        total = sum(sizes.values())
+        for name in segments:
+            if name == self.segment or (name >= cutoff and total <= ARCHIVE_MAX_MB * 1024 * 1024):
+                break
+            self.segment_ticks.pop(name, None)
+            for ext in ('.log', '.idx', '.meta'):
+                try:
+                    os.remove(os.path.join(self.path, name + ext))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"[WARN] Archivio book {self.symbol}: {name}{ext} non cancellato: {e}")
+            total -= sizes[name]
+
+    # ------------------------------------------------------------------
+    # Ricostruzione
+    # ------------------------------------------------------------------
+
+    def _segment_tick(self, name, default):
+        """
+        Tick del segmento dal suo .meta; `default` se manca (i segmenti senza
+        .meta sono stati scritti con la tabella TICK_SIZES, 0.01 fuori tabella)
+        """
+        tick = self.segment_ticks.get(name)
+        if tick is None:
+            try:
+                with open(os.path.join(self.path, f"{name}.meta")) as f:
+                    tick = float(json.load(f)['tick_size'])
+            except (OSError, ValueError, KeyError, TypeError):
+                return default
+            self.segment_ticks[name] = tick
+        return tick
+
+    def _index(self, name):
+        """Keyframe (ts, offset) di un segmento, None se il segmento non esiste"""
+        path = os.path.join(self.path, f"{name}.idx")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            raw = f.read()
+        return np.frombuffer(raw[:len(raw) // INDEX.itemsize * INDEX.itemsize], dtype=INDEX)   # ultima voce forse incompleta
+
+    def _read(self, name, start, end=None):
+        try:
+            with open(os.path.join(self.path, f"{name}.log"), 'rb') as f:
+                f.seek(start)
+                return f.read() if end is None else f.read(end - start)
+        except OSError:
+            return b''
+
+    def book_at(self, ts, limit=100):
+        """
+        Book all'istante ts (ms): ultimo keyframe del segmento <= ts piu' i
+        diff fino a ts, letti solo tra quel keyframe e il successivo. Prima
+        del primo keyframe del segmento si parte dall'ultimo keyframe del
+        segmento precedente, letto fino alla fine, piu' l'inizio di questo.
+        """
+        if self.path is None:
+            return {'error': 'Archivio del book disattivato'}
+        if self.log is not None:
+            self.log.flush()
+            self.index.flush()
+        name = segment_name(ts)
+        index = self._index(name)
+        i = bisect_right(index['ts'].tolist(), ts) - 1 if index is not None else -1
+        if i >= 0:
+            end = int(index['offset'][i + 1]) if i + 1 < len(index) else None
+            chunks = [(name, self._read(name, int(index['offset'][i]), end))]
+        else:
+            previous = segment_name(ts // 3600000 * 3600000 - 1)
+            prev_index = self._index(previous)
+            if prev_index is None and index is None:
+                return {'error': f"Nessun dato archiviato per {name}"}
+            if prev_index is None or not len(prev_index):
+                return {'error': 'Nessun keyframe prima dell\'istante richiesto'}
+            chunks = [(previous, self._read(previous, int(prev_index['offset'][-1])))]
+            if index is not None:
+                chunks.append((name, self._read(name, 0, int(index['offset'][0]) if len(index) else None)))
+
+        levels = ({}, {})   # ask, bid: prezzo -> lotti (i segmenti possono avere tick diversi)
+        keyframe_ts, applied = None, 0
+        for segment, data in chunks:
+            tick_size = self._segment_tick(segment, TICK_SIZES.get(self.symbol, 0.01))
+            pos = 0
+            while pos + RECORD.itemsize <= len(data):
+                header = np.frombuffer(data, RECORD, count=1, offset=pos)[0]
+                pos += RECORD.itemsize
+                payload = data[pos:pos + int(header['size'])]
+                if len(payload) < header['size'] or header['ts'] > ts:
+                    break   # record ancora in scrittura oppure oltre l'istante
+                pos += int(header['size'])
+                if header['kind'] == GAP:
+                    return {'error': 'Book non sincronizzato all\'istante richiesto', 'gap': int(header['ts'])}
+                sides, ticks, qty = decode(payload, int(header['n']))
+                prices = np.round(ticks * tick_size, 8)
+                if header['kind'] == KEYFRAME:
+                    keyframe_ts, applied = int(header['ts']), 0
+                    levels[0].clear()
+                    levels[1].clear()
+                    for side, price, q in zip(sides.tolist(), prices.tolist(), qty.tolist()):
+                        levels[side][price] = q
+                    continue
+                applied += 1
+                for side, price, q in zip(sides.tolist(), prices.tolist(), qty.tolist()):
+                    q += levels[side].get(price, 0)
+                    if q > 0:
+                        levels[side][price] = q
+                    else:
+                        levels[side].pop(price, None)
+            if pos < len(data):
+                break   # record incompleto o oltre ts: i chunk successivi non vanno applicati
+
+        def top(side, reverse):
+            prices = sorted(levels[side], reverse=reverse)[:limit]
+            return [[p, round(levels[side][p] * QTY_LOT, 8)] for p in prices]
+
+        return {'symbol': self.symbol, 'timestamp': ts, 'keyframe': keyframe_ts, 'diffs': applied,
+                'bids': top(1, True), 'asks': top(0, False)}
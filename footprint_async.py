@@ -0,0 +1,729 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT ORDERFLOW - SERVER ASYNCIO UNICO
+Le tre dashboard servite da un solo processo, un MarketEngine per simbolo
+"""
+
+import argparse
+import ast
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from footprint_engine import (DEPTH_LADDER_RANGE_PCT, EVENT_SECONDS, ORDERBOOK_TTL, SIGNAL_INTERVAL, SYMBOL_BINANCE, SYMBOLS, MarketHub,
+                              TradeView, close_session, filtered_footprint, kline_delta_footprint)
+from footprint_bars import BAR_TYPES
+from footprint_imbalance import IMBALANCE_MIN_VOLUME, IMBALANCE_RATIO, imbalance_footprint
+from footprint_profile import ProfileIndex
+from footprint_shards import ShardRouter, start_shards
+from footprint_shm import SharedCache
+from footprint_tape import TradeTape, row_dict
+from footprint_tracker import history_slice
+from footprint_vwap import VWAP_ROLLING_BARS
+
+# Configurazione filtro trade rilevanti (le dashboard complete/ob28 non filtrano)
+TRADE_FILTER_MODE = "none"
+TRADE_MIN_QTY_PERCENT = 0.5
+TRADE_PERCENTILE = 75
+TRADE_TOP_N = 300
+
+# Stream verso i client: una sottoscrizione per simbolo, nessun thread per client
+STREAM_POLL_SECONDS = 3
+STREAM_QUEUE_SIZE = 4
+STREAM_EVENTS = ("orderbook", "signal", "absorption", "tape", "sweep", "vwap")
+
+# Multi-processo: un solo processo di ingestion pubblica in shared memory
+# queste chiavi, i worker web le leggono senza interrogare Binance
+SHARED_INTERVALS = ["1m", "5m", "15m"]
+SHARED_STEPS = [5.0, 10.0, 25.0, 50.0]
+SHARED_REFRESH_SECONDS = 5
+SHARED_MAX_AGE = 30
+SHARED_PREFIX = "btcfootprint"
+MAX_SHARED_EVENTS = 50
+SHARED_TAPE_MINUTES = 60   # grandi trade pubblicati per le query dei worker
+SHARED_FEATURES_SECONDS = 300   # serie delle feature del book pubblicate per i worker
+SHARED_RELEVANT_TFS = ["1m", "5m", "15m", "30m", "1h"]   # chart_tf di /api/relevant_orders pubblicati dall'hub
+INGESTION_STATUS_KEY = "ingestion_status"   # ultimo giro dei loop ed errori dell'ingestion
+
+# Dashboard servite dallo stesso processo: path -> script con index()
+DASHBOARDS = {
+    '/': "9btc-footprint-INTENSITY-CHART-ORDERS-top.py",
+    '/ob28': "9btc-footprint-ob28-top.py",
+    '/complete': "8btc-footprint-complete.py",
+}
+
+
+class Broadcaster:
+    """Fan-out di un payload a tutti i client in streaming (una coda per client)"""
+
+    def __init__(self, queue_size=STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event, payload):
+        self.publish_raw(event, json.dumps(payload).encode())
+
+    def publish_raw(self, event, payload):
+        """payload gia' serializzato in JSON (bytes)"""
+        message = f"event: {event}\ndata: ".encode() + payload + b"\n\n"
+        for queue in self.subscribers:
+            # Client lento: scarta il messaggio piu' vecchio invece di bloccare
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+def load_dashboard_html(script):
+    """Estrae l'HTML di index() da uno degli script Flask senza importarlo"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef) and node.name == 'index':
+            for stmt in node.body:
+                if isinstance(stmt, ast.Assign) and isinstance(stmt.value, ast.Constant):
+                    return stmt.value.value
+    raise ValueError(f"index() non trovato in {script}")
+
+
+def register_dashboard(app, path, script):
+    """Monta la pagina di una dashboard: tutte usano le stesse /api/*"""
+    html = load_dashboard_html(script)
+
+    async def index(request):
+        return web.Response(text=html, content_type='text/html')
+
+    app.router.add_get(path, index)
+
+
+def footprint_key(symbol, interval, step):
+    return f"footprint_{symbol}_{interval}_{float(step)}"
+
+def last_candle_key(symbol, interval):
+    return f"last_candle_{symbol}_{interval}"
+
+def signal_key(symbol, interval):
+    return f"signal_{symbol}_{interval}"
+
+def shared_payload(app, key):
+    """JSON gia' serializzato dalla shared memory, None in modalita' singolo processo o se assente"""
+    shared = app.get('shared')
+    return shared.read(key, SHARED_MAX_AGE) if shared is not None else None
+
+def shared_json(app, key):
+    payload = shared_payload(app, key)
+    return json.loads(payload) if payload is not None else None
+
+def ingestion_health(shared, now=None):
+    """
+    Stato dell'ingestion visto da un worker: eta' in secondi di ogni loop e
+    dell'ultima pubblicazione; stale se oltre SHARED_MAX_AGE (i worker stanno
+    ripiegando sull'hub o servendo dati vecchi)
+    """
+    now = time.time() if now is None else now
+    status = shared.read_json(INGESTION_STATUS_KEY) or new_status()
+    updated_at = shared.updated_at(INGESTION_STATUS_KEY)
+    ages = {loop: round(now - ts, 1) for loop, ts in status['loops'].items()}
+    return {'updated_at': updated_at or None, 'age': round(now - updated_at, 1) if updated_at else None,
+            'loops': ages, 'stale': not updated_at or any(a > SHARED_MAX_AGE for a in ages.values()),
+            'errors': status['errors'], 'last_error': status['last_error']}
+
+def shared_filtered_footprint(app, symbol, interval, step, filters):
+    """Filtro come vista sull'ultima candela pubblicata dall'ingestion (nessun fetch nel worker)"""
+    data = shared_json(app, footprint_key(symbol, interval, step))
+    candle = shared_json(app, last_candle_key(symbol, interval))
+    if not data or not data['bars'] or not candle or int(candle['kline'][0]) != data['bars'][-1]['timestamp']:
+        return None
+    version = (int(candle['kline'][0]), len(candle['trades']))
+    cached = app['trade_views'].get((symbol, interval))
+    if cached is None or cached[0] != version:
+        trades = [{'p': p, 'q': q, 'm': m} for p, q, m in candle['trades']]
+        cached = app['trade_views'][(symbol, interval)] = (version, TradeView(trades))
+    return filtered_footprint(data, candle['kline'], cached[1], step, filters)
+
+def json_payload_response(payload):
+    return web.Response(body=payload, content_type='application/json')
+
+
+def get_symbol(request):
+    """Simbolo richiesto (?symbol=, default BTCUSDT), 400 se non configurato"""
+    symbol = request.query.get('symbol', SYMBOL_BINANCE).upper()
+    if symbol not in request.app['hub'].symbols():
+        raise web.HTTPBadRequest(text=json.dumps({'error': f"Simbolo non configurato: {symbol}"}), content_type='application/json')
+    return symbol
+
+
+routes = web.RouteTableDef()
+
+@routes.get('/api/data')
+async def get_data(request):
+    interval = request.query.get('interval', '1m')
+    step = float(request.query.get('step', 10))
+    update_last_only = request.query.get('update_last', 'false') == 'true'
+
+    # Parametri filtro dalla richiesta
+    filter_mode = request.query.get('filter_mode', TRADE_FILTER_MODE)
+    filter_percentile = int(request.query.get('filter_percentile', TRADE_PERCENTILE))
+    filter_min_qty = float(request.query.get('filter_min_qty', TRADE_MIN_QTY_PERCENT))
+    filter_top_n = int(request.query.get('filter_top_n', TRADE_TOP_N))
+    # delta_mode=kline: delta approssimato dalle klines anche sulle barre senza footprint
+    delta_mode = request.query.get('delta_mode', 'trades')
+    # Imbalance diagonali: rapporto e volume minimo (default gia' calcolati in cache)
+    imbalance = (float(request.query.get('imbalance_ratio', IMBALANCE_RATIO)),
+                 float(request.query.get('imbalance_min_volume', IMBALANCE_MIN_VOLUME)))
+    default_imbalance = imbalance == (IMBALANCE_RATIO, IMBALANCE_MIN_VOLUME)
+
+    symbol = get_symbol(request)
+    bar_type = request.query.get('bar_type', 'time')
+    if bar_type != 'time':
+        # Barre a volume/tick/range (?bar_size=), dallo stesso flusso di trade
+        if bar_type not in BAR_TYPES:
+            raise web.HTTPBadRequest(text=json.dumps({'error': f"bar_type non supportato: {bar_type}"}), content_type='application/json')
+        bar_size = request.query.get('bar_size')
+        payload = await request.app['hub'].call_raw(
+            symbol, 'get_bars', bar_type=bar_type, bar_size=float(bar_size) if bar_size else None, step=step)
+        return json_payload_response(payload)
+
+    if filter_mode == 'none' and delta_mode != 'kline' and default_imbalance:
+        payload = shared_payload(request.app, footprint_key(symbol, interval, step))
+        if payload is not None:
+            return json_payload_response(payload)
+    elif 'shared' in request.app:
+        if filter_mode == 'none':
+            data = shared_json(request.app, footprint_key(symbol, interval, step))
+        else:
+            data = shared_filtered_footprint(request.app, symbol, interval, step,
+                                             (filter_mode, filter_percentile, filter_min_qty, filter_top_n))
+        if data is not None:
+            if not default_imbalance:
+                data = imbalance_footprint(data, step, *imbalance)
+            return web.json_response(kline_delta_footprint(data) if delta_mode == 'kline' else data)
+
+    payload = await request.app['hub'].call_raw(
+        symbol, 'get_footprint', interval=interval, step=step, update_last_only=update_last_only,
+        filter_mode=filter_mode, filter_percentile=filter_percentile, filter_min_qty=filter_min_qty, filter_top_n=filter_top_n,
+        delta_mode=delta_mode, imbalance_ratio=imbalance[0], imbalance_min_volume=imbalance[1])
+    return json_payload_response(payload)
+
+@routes.get('/api/cvd')
+async def get_cvd(request):
+    """Delta cumulato (?interval=&start=&end= in ms, ?session=true dal giorno UTC, ?bars=false solo totali)"""
+    symbol = get_symbol(request)
+    query = request.query
+    start, end = query.get('start'), query.get('end')
+    payload = await request.app['hub'].call_raw(
+        symbol, 'get_cvd', interval=query.get('interval', '1m'),
+        start=int(start) if start else None, end=int(end) if end else None,
+        session=query.get('session', 'false') == 'true', bars=query.get('bars', 'true') != 'false')
+    return json_payload_response(payload)
+
+@routes.get('/api/vwap')
+async def get_vwap(request):
+    """VWAP con bande σ (?interval=&mode=session|anchored|rolling&anchor=ms&rolling=N&start=&end=)"""
+    symbol = get_symbol(request)
+    query = request.query
+    start, end, anchor = query.get('start'), query.get('end'), query.get('anchor')
+    data = await request.app['hub'].call(
+        symbol, 'get_vwap', interval=query.get('interval', '1m'), mode=query.get('mode', 'session'),
+        anchor=int(anchor) if anchor else None, rolling=int(query.get('rolling', VWAP_ROLLING_BARS)),
+        start=int(start) if start else None, end=int(end) if end else None)
+    return web.json_response(data, status=400 if 'error' in data else 200)
+
+@routes.get('/api/size_histogram')
+async def get_size_histogram(request):
+    """Distribuzione delle size dei trade per lato, fusa sulle ultime N barre (?interval=&step=&bars=)"""
+    symbol = get_symbol(request)
+    query = request.query
+    payload = await request.app['hub'].call_raw(
+        symbol, 'get_size_histogram', interval=query.get('interval', '1m'),
+        step=float(query.get('step', 10)), bars=int(query.get('bars', 1)))
+    return json_payload_response(payload)
+
+@routes.get('/api/book_at')
+async def get_book_at(request):
+    """Book archiviato a un istante passato (?time= in ms, ?limit= livelli per lato)"""
+    symbol = get_symbol(request)
+    query = request.query
+    if 'time' not in query:
+        return web.json_response({'error': 'Parametro time mancante'}, status=400)
+    data = await request.app['hub'].call(symbol, 'get_book_at', time_ms=int(query['time']),
+                                         limit=int(query.get('limit', 100)))
+    return web.json_response(data, status=400 if 'error' in data else 200)
+
+@routes.get('/api/cube')
+async def get_cube(request):
+    """Footprint dal cubo persistente (?interval=1h|1d|range&step=&start=&end= in ms, oppure ?bars=N)"""
+    symbol = get_symbol(request)
+    query = request.query
+    start, end = query.get('start'), query.get('end')
+    data = await request.app['hub'].call(
+        symbol, 'get_cube', interval=query.get('interval', '1h'), step=float(query.get('step', 10)),
+        start=int(start) if start else None, end=int(end) if end else None, bars=int(query.get('bars', 24)))
+    return web.json_response(data, status=400 if 'error' in data else 200)
+
+@routes.get('/api/profile')
+async def get_profile(request):
+    """Volume profile di un range di barre (?interval=&step=&start=&end= in ms, oppure ?bars=N)"""
+    symbol = get_symbol(request)
+    query = request.query
+    interval, step = query.get('interval', '1m'), float(query.get('step', 10))
+    start, end = query.get('start'), query.get('end')
+    last = int(query['bars']) if 'bars' in query else None
+    value_area = float(query.get('value_area', 70))
+    data = shared_json(request.app, footprint_key(symbol, interval, step))
+    if data is not None:
+        index = request.app['profiles'].setdefault((symbol, interval, step), ProfileIndex(step)).sync(data['bars'])
+        return web.json_response(dict(index.profile(start, end, last, value_area), interval=interval))
+    payload = await request.app['hub'].call_raw(symbol, 'get_profile', interval=interval, step=step,
+                                                start=start, end=end, last=last, value_area=value_area)
+    return json_payload_response(payload)
+
+@routes.get('/api/orderbook')
+async def get_orderbook(request):
+    symbol = get_symbol(request)
+    payload = shared_payload(request.app, f"orderbook_{symbol}")
+    if payload is None:
+        payload = await request.app['hub'].call_raw(symbol, 'get_orderbook')
+    return json_payload_response(payload)
+
+@routes.get('/api/relevant_orders')
+async def get_relevant_orders(request):
+    symbol = get_symbol(request)
+    chart_tf = request.query.get('chart_tf', '15m')
+    try:
+        # Risultato dell'hub (soglia per simbolo, indice dei grandi ordini): stesso esito su ogni worker
+        data = shared_json(request.app, f"relevant_orders_{symbol}_{chart_tf}")
+        if data is None:
+            data = await request.app['hub'].call(symbol, 'get_relevant_orders', chart_tf=chart_tf)
+    except Exception as e:
+        data = {'error': str(e)}
+    return web.json_response(data, status=500 if 'error' in data else 200)
+
+@routes.get('/api/depth_ladder')
+async def get_depth_ladder(request):
+    """Book pre-aggregato negli step del footprint (?step=&range_pct=)"""
+    symbol = get_symbol(request)
+    payload = await request.app['hub'].call_raw(
+        symbol, 'get_depth_ladder', step=float(request.query.get('step', 10)),
+        range_pct=float(request.query.get('range_pct', DEPTH_LADDER_RANGE_PCT)))
+    return json_payload_response(payload)
+
+@routes.get('/api/signal')
+async def get_signal(request):
+    """Segnale di trading calcolato dal server, uguale per tutti i client (?interval=&step=)"""
+    symbol = get_symbol(request)
+    interval = request.query.get('interval', SIGNAL_INTERVAL)
+    payload = shared_payload(request.app, signal_key(symbol, interval))
+    if payload is None:
+        payload = await request.app['hub'].call_raw(symbol, 'get_signal', interval=interval,
+                                                    step=float(request.query.get('step', 10)))
+    return json_payload_response(payload)
+
+@routes.get('/api/signal_history')
+async def get_signal_history(request):
+    """Storico intensita' (?start=&end= in ms, oppure ?minutes=), fasi e distribuzione pesata"""
+    symbol = get_symbol(request)
+    query = request.query
+    start, end = query.get('start'), query.get('end')
+    if 'minutes' in query:
+        start = int(time.time() * 1000 - float(query['minutes']) * 60000)
+    start, end = (int(start) if start else None), (int(end) if end else None)
+    history = shared_json(request.app, f"signal_history_{symbol}")
+    if history is not None:
+        return web.json_response(history_slice(history, start, end))
+    return json_payload_response(await request.app['hub'].call_raw(symbol, 'get_signal_history', start=start, end=end))
+
+@routes.get('/api/qty_threshold')
+async def get_qty_threshold(request):
+    """Soglia del filtro percentile dagli sketch per candela (?interval=&percentile=&candles=)"""
+    symbol = get_symbol(request)
+    query = request.query
+    payload = await request.app['hub'].call_raw(
+        symbol, 'get_qty_threshold', interval=query.get('interval', '1m'),
+        percentile=float(query.get('percentile', TRADE_PERCENTILE)), candles=int(query.get('candles', 1)))
+    return json_payload_response(payload)
+
+@routes.get('/api/absorption')
+async def get_absorption(request):
+    """Assorbimenti e ricariche rilevati dallo stream (?after=seq&limit=)"""
+    symbol = get_symbol(request)
+    after, limit = int(request.query.get('after', 0)), int(request.query.get('limit', 50))
+    data = shared_json(request.app, f"absorption_{symbol}")
+    if data is not None:
+        events = [e for e in data['events'] if e['seq'] > after]
+        return web.json_response(dict(data, events=events[-limit:] if limit else []))
+    return json_payload_response(await request.app['hub'].call_raw(symbol, 'get_absorption', after=after, limit=limit))
+
+@routes.get('/api/book_features')
+async def get_book_features(request):
+    """Imbalance a 0.1/0.5/1%, microprice e OFI (?start=&end= in ms o ?minutes=, ?every=N campioni)"""
+    symbol = get_symbol(request)
+    query = request.query
+    start, end = query.get('start'), query.get('end')
+    if 'minutes' in query:
+        start = int(time.time() * 1000 - float(query['minutes']) * 60000)
+    start, end = (int(start) if start else None), (int(end) if end else None)
+    every = int(query.get('every', 1))
+    data = shared_json(request.app, f"book_features_{symbol}")
+    if data is not None:
+        return web.json_response(features_slice(data, start, end, every))
+    data = await request.app['hub'].call(symbol, 'get_book_features', start=start, end=end, every=every)
+    return web.json_response(data, status=400 if 'error' in data else 200)
+
+def features_slice(data, start, end, every):
+    """Range e sottocampionamento sulle serie pubblicate dall'ingestion"""
+    columns = data['columns']
+    ts = columns['timestamps']
+    lo = 0 if start is None else bisect_left(ts, start)
+    hi = len(ts) if end is None else bisect_right(ts, end)
+    hi = max(lo, hi)
+    ofi = columns['cum_ofi'][hi - 1] - columns['cum_ofi'][lo] + columns['ofi'][lo] if hi > lo else 0.0
+    step = max(1, every)
+    return dict(data, samples=hi - lo, ofi=round(ofi, 6), columns={k: v[lo:hi:step] for k, v in columns.items()})
+
+@routes.get('/api/sweeps')
+async def get_sweeps(request):
+    """Sweep aggressivi dallo stream (?after=seq&limit=); i conteggi per barra sono in /api/data"""
+    symbol = get_symbol(request)
+    after, limit = int(request.query.get('after', 0)), int(request.query.get('limit', 50))
+    data = shared_json(request.app, f"sweeps_{symbol}")
+    if data is not None:
+        events = [e for e in data['events'] if e['seq'] > after]
+        return web.json_response(dict(data, events=events[-limit:] if limit else []))
+    return json_payload_response(await request.app['hub'].call_raw(symbol, 'get_sweeps', after=after, limit=limit))
+
+@routes.get('/api/tape')
+async def get_tape(request):
+    """Grandi trade per range (?start=&end= in ms, oppure ?minutes=) e size minima (?min_size=&limit=)"""
+    symbol = get_symbol(request)
+    query = request.query
+    start, end = query.get('start'), query.get('end')
+    if 'minutes' in query:
+        start = int(time.time() * 1000 - float(query['minutes']) * 60000)
+    start, end = (int(start) if start else None), (int(end) if end else None)
+    min_size = float(query['min_size']) if 'min_size' in query else None
+    limit = int(query.get('limit', 500))
+    tape = shared_tape(request.app, symbol)
+    if tape is not None:
+        rows = tape.query(start, end, min_size, limit)
+        return web.json_response({'symbol': symbol, 'thresholds': tape.thresholds, 'seq': tape.seq,
+                                  'trades': [row_dict(r) for r in rows]})
+    payload = await request.app['hub'].call_raw(symbol, 'get_tape', start=start, end=end, min_size=min_size, limit=limit)
+    return json_payload_response(payload)
+
+def shared_tape(app, symbol):
+    """Tape pubblicata dall'ingestion, indicizzata una volta per versione nel worker"""
+    data = shared_json(app, f"tape_{symbol}")
+    if data is None:
+        return None
+    cached = app['tapes'].get(symbol)
+    if cached is None or cached[0] != data['seq']:
+        cached = app['tapes'][symbol] = (data['seq'], TradeTape.from_rows(data['thresholds'], data['rows']))
+    return cached[1]
+
+@routes.get('/api/large_orders')
+async def get_large_orders(request):
+    """Grandi ordini a riposo dall'indice incrementale (?threshold=&min_price=&max_price=&top=)"""
+    symbol = get_symbol(request)
+    query = request.query
+    data = await request.app['hub'].call(
+        symbol, 'get_large_orders', threshold=query.get('threshold'), min_price=query.get('min_price'),
+        max_price=query.get('max_price'), top=int(query.get('top', 50)))
+    return web.json_response(data, status=400 if 'error' in data else 200)
+
+@routes.get('/api/symbols')
+async def get_symbols(request):
+    """Simboli configurati con consumo di CPU e memoria per simbolo"""
+    data = await request.app['hub'].stats()
+    shared = request.app.get('shared')
+    if shared is not None:
+        data['ingestion'] = ingestion_health(shared)
+    return web.json_response(data)
+
+@routes.get('/api/stream')
+async def stream(request):
+    """Server-Sent Events: orderbook e segnale del simbolo, il client resta in attesa su una coda"""
+    symbol = get_symbol(request)
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+    await response.prepare(request)
+    broadcaster = request.app['broadcasters'][symbol]
+    queue = broadcaster.subscribe()
+    if len(broadcaster.subscribers) == 1:
+        await start_orderbook_stream(request.app, symbol)
+    try:
+        while True:
+            await response.write(await queue.get())
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        broadcaster.unsubscribe(queue)
+        if not broadcaster.subscribers:
+            await stop_orderbook_stream(request.app, symbol)
+    return response
+
+
+async def start_orderbook_stream(app, symbol):
+    """Una sola sottoscrizione per simbolo ed evento, attiva finche' c'e' almeno un client"""
+    if symbol in app['stream_tokens']:
+        return
+    broadcaster = app['broadcasters'][symbol]
+    if 'shared' in app:
+        app['stream_tokens'][symbol] = [asyncio.create_task(shared_orderbook_poller(app, symbol, broadcaster))]
+    else:
+        tokens = app['stream_tokens'][symbol] = []
+        for event in STREAM_EVENTS:
+            callback = lambda payload, event=event: broadcaster.publish_raw(event, payload)
+            tokens.append(await app['hub'].subscribe(symbol, event, callback))
+
+async def stop_orderbook_stream(app, symbol):
+    for token in app['stream_tokens'].pop(symbol, []):
+        if isinstance(token, asyncio.Task):
+            token.cancel()
+        else:
+            await app['hub'].unsubscribe(token)
+
+async def shared_orderbook_poller(app, symbol, broadcaster):
+    """Orderbook e segnale ogni STREAM_POLL_SECONDS, eventi incrementali appena cambiano"""
+    keys = {'orderbook': f"orderbook_{symbol}", 'signal': signal_key(symbol, SIGNAL_INTERVAL),
+            'absorption': f"absorption_{symbol}", 'tape': f"tape_updates_{symbol}",
+            'sweep': f"sweeps_{symbol}", 'vwap': f"vwap_{symbol}"}
+    last_payload, last_sent = {}, {}
+    while True:
+        now = time.time()
+        for event in STREAM_EVENTS:
+            incremental = event in EVENT_SECONDS
+            if not incremental and now - last_sent.get(event, 0) < STREAM_POLL_SECONDS:
+                continue
+            payload = shared_payload(app, keys[event])
+            if payload is None or (incremental and payload == last_payload.get(event)):
+                continue
+            last_payload[event], last_sent[event] = payload, now
+            broadcaster.publish_raw(event, payload)
+        await asyncio.sleep(min(EVENT_SECONDS.values()))
+
+async def on_startup(app):
+    if app['live']:
+        app['hub'].start_feed()
+    if app['tracking']:
+        app['hub'].start_tracking()
+
+async def on_cleanup(app):
+    for symbol in list(app['stream_tokens']):
+        await stop_orderbook_stream(app, symbol)
+    await app['hub'].stop()
+    await close_session()
+    if 'shared' in app:
+        app['shared'].close()
+
+def create_app(shared=False, symbols=SYMBOLS, live=True, shards=0):
+    """
+    shared: worker che legge dalla shared memory; shards: simboli serviti da
+    processi shard via IPC; live: stream websocket in questo processo
+    """
+    app = web.Application()
+    app['hub'] = ShardRouter(symbols, shards) if shards else MarketHub(symbols)
+    app['live'] = live and not shared and not shards
+    app['tracking'] = not shared and not shards
+    app['stream_tokens'] = {}
+    if shared:
+        app['shared'] = SharedCache(SHARED_PREFIX)
+        app['trade_views'] = {}
+        app['profiles'] = {}
+        app['tapes'] = {}
+    app['broadcasters'] = {symbol: Broadcaster() for symbol in app['hub'].symbols()}
+    for path, script in DASHBOARDS.items():
+        register_dashboard(app, path, script)
+    app.add_routes(routes)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+# ----------------------------------------------------------------------
+# Processo di ingestion (unico writer della shared memory)
+# ----------------------------------------------------------------------
+
+def new_status():
+    """Stato dell'ingestion pubblicato per i worker: ultimo giro di ogni loop ed errori"""
+    return {'loops': {}, 'errors': 0, 'last_error': None}
+
+@contextmanager
+def ingestion_step(status, loop, symbol):
+    """
+    Passo di un loop di ingestion (engine o pubblicazione): un errore viene
+    loggato e contato, il loop e gli altri simboli continuano
+    """
+    try:
+        yield
+    except Exception as e:
+        status['errors'] += 1
+        status['last_error'] = {'loop': loop, 'symbol': symbol, 'error': f"{type(e).__name__}: {e}", 'time': time.time()}
+        print(f"[WARN] Ingestion {loop} {symbol}: {type(e).__name__}: {e}")
+
+def loop_done(shared, status, loop):
+    """Fine di un giro: i worker confrontano il tempo dello slot per riconoscere dati fermi"""
+    status['loops'][loop] = time.time()
+    with ingestion_step(status, loop, None):
+        shared.publish(INGESTION_STATUS_KEY, status)
+
+async def publish_orderbook_loop(hub, shared, status=None):
+    status = status if status is not None else new_status()
+    while True:
+        for engine in hub.engines.values():
+            with ingestion_step(status, 'orderbook', engine.symbol):
+                ob_data = await engine.get_orderbook()
+                if ob_data.get('bids'):
+                    shared.publish(f"orderbook_{engine.symbol}", ob_data)
+            # Solo con il book dallo stream: senza, ogni chart_tf costerebbe chiamate REST a ogni giro
+            for chart_tf in SHARED_RELEVANT_TFS if engine.book.synced else ():
+                with ingestion_step(status, 'orderbook', engine.symbol):
+                    data = await engine.get_relevant_orders(chart_tf)
+                    if 'error' not in data:
+                        shared.publish(f"relevant_orders_{engine.symbol}_{chart_tf}", data)
+        loop_done(shared, status, 'orderbook')
+        await asyncio.sleep(ORDERBOOK_TTL)
+
+async def publish_events_loop(hub, shared, status=None):
+    """Eventi incrementali (assorbimenti) a cadenza breve: latenza limitata per i worker"""
+    status = status if status is not None else new_status()
+    while True:
+        for engine in hub.engines.values():
+            for key, method in ((f"absorption_{engine.symbol}", engine.get_absorption),
+                                (f"tape_updates_{engine.symbol}", engine.get_tape_updates),
+                                (f"sweeps_{engine.symbol}", engine.get_sweeps)):
+                with ingestion_step(status, 'events', engine.symbol):
+                    shared.publish(key, method(limit=MAX_SHARED_EVENTS))
+        loop_done(shared, status, 'events')
+        await asyncio.sleep(EVENT_SECONDS['absorption'])
+
+async def publish_footprints_loop(hub, shared, status=None):
+    status = status if status is not None else new_status()
+    while True:
+        started = time.time()
+        for engine in hub.engines.values():
+            for interval in sorted(set(SHARED_INTERVALS) | {'15m'}):
+                with ingestion_step(status, 'footprints', engine.symbol):
+                    klines = await engine.get_klines(interval, limit=150)
+                    if klines:
+                        shared.publish(f"klines_{engine.symbol}_{interval}", klines)
+            for interval in SHARED_INTERVALS:
+                for step in SHARED_STEPS:
+                    with ingestion_step(status, 'footprints', engine.symbol):
+                        # Ricalcolo completo a TTL scaduto, altrimenti solo l'ultima candela
+                        data = await engine.get_footprint(interval, step, update_last_only=True)
+                        if data['bars']:
+                            shared.publish(footprint_key(engine.symbol, interval, step), data)
+                publish_last_candle(shared, engine, interval)
+                with ingestion_step(status, 'footprints', engine.symbol):
+                    shared.publish(signal_key(engine.symbol, interval), await engine.get_signal(interval))
+            with ingestion_step(status, 'footprints', engine.symbol):
+                shared.publish(f"signal_history_{engine.symbol}", engine.get_signal_history())
+            with ingestion_step(status, 'footprints', engine.symbol):
+                shared.publish(f"vwap_{engine.symbol}", await engine.get_vwap_live())
+            if engine.book.synced:
+                with ingestion_step(status, 'footprints', engine.symbol):
+                    features_start = int(time.time() * 1000) - SHARED_FEATURES_SECONDS * 1000
+                    shared.publish(f"book_features_{engine.symbol}", engine.get_book_features(start=features_start))
+            with ingestion_step(status, 'footprints', engine.symbol):
+                tape_start = int(time.time() * 1000) - SHARED_TAPE_MINUTES * 60000
+                shared.publish(f"tape_{engine.symbol}", {'thresholds': engine.tape.thresholds, 'seq': engine.tape.seq,
+                                                         'rows': engine.tape.rows(tape_start)})
+        loop_done(shared, status, 'footprints')
+        await asyncio.sleep(max(0, SHARED_REFRESH_SECONDS - (time.time() - started)))
+
+def publish_last_candle(shared, engine, interval):
+    """Kline e trade grezzi dell'ultima candela: i worker ci applicano i filtri"""
+    candle = engine.last_candles.get(interval)
+    if candle is None:
+        return
+    k, trades = candle
+    try:
+        shared.publish(last_candle_key(engine.symbol, interval),
+                       {'kline': k, 'trades': [[t['p'], t['q'], t['m']] for t in trades]})
+    except ValueError as e:
+        # Candela troppo grande per lo slot: i worker ripiegano sull'hub
+        print(f"[WARN] {e}")
+
+async def run_ingestion(symbols=SYMBOLS, live=True):
+    hub = MarketHub(symbols)
+    shared = SharedCache(SHARED_PREFIX, create=True)
+    if live:
+        hub.start_feed()
+    hub.start_tracking()
+    try:
+        status = new_status()
+        await asyncio.gather(publish_orderbook_loop(hub, shared, status), publish_footprints_loop(hub, shared, status),
+                             publish_events_loop(hub, shared, status))
+    finally:
+        await hub.stop()
+        shared.close()
+        await close_session()
+
+def ingestion_main(symbols):
+    try:
+        asyncio.run(run_ingestion(symbols))
+    except KeyboardInterrupt:
+        pass
+
+def worker_main(port, symbols):
+    web.run_app(create_app(shared=True, symbols=symbols), host='0.0.0.0', port=port, reuse_port=True, print=None)
+
+def run_workers(workers, port, symbols):
+    processes = [multiprocessing.Process(target=ingestion_main, args=(symbols,), name='ingestion')]
+    processes += [multiprocessing.Process(target=worker_main, args=(port, symbols), name=f'worker-{i}') for i in range(workers)]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1, help="worker web; >1 attiva ingestion unica in shared memory")
+    parser.add_argument('--port', type=int, default=5002)
+    parser.add_argument('--shards', type=int, default=0, help="processi shard tra cui dividere i simboli")
+    parser.add_argument('--symbols', default=",".join(SYMBOLS), help="simboli separati da virgola")
+    args = parser.parse_args()
+    symbols = [s.strip().upper() for s in args.symbols.split(',') if s.strip()]
+
+    print("=" * 70)
+    print("BTC FOOTPRINT - SERVER UNICO ASYNCIO")
+    print("=" * 70)
+    print("✅ Un MarketEngine per simbolo, fetch e cache condivisi tra le dashboard")
+    print("✅ Un solo combined stream websocket per tutti i simboli (?symbol=)")
+    print("✅ Fetch Binance non bloccanti (aiohttp, client condiviso)")
+    print("✅ Stream SSE su /api/stream senza thread per client")
+    print("=" * 70)
+    for path, script in DASHBOARDS.items():
+        print(f"http://localhost:{args.port}{path}  ({script})")
+    print("=" * 70)
+    if args.shards:
+        print(f"[INFO] {len(symbols)} simboli su {min(args.shards, len(set(symbols)))} shard")
+        shard_processes = start_shards(symbols, args.shards)
+        try:
+            web.run_app(create_app(symbols=symbols, shards=args.shards), host='0.0.0.0', port=args.port)
+        finally:
+            for p in shard_processes:
+                p.join()
+    elif args.workers > 1:
+        print(f"[INFO] {args.workers} worker + 1 processo di ingestion in shared memory")
+        run_workers(args.workers, args.port, symbols)
+    else:
+        web.run_app(create_app(symbols=symbols), host='0.0.0.0', port=args.port)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - BARRE COSTRUITE DAI TRADE
+Candele a tempo (1m e aggregate) e barre a volume, tick e range costruite in
+modo incrementale dagli aggTrade, nel formato kline Binance
+"""
+
+from collections import deque
+
+BAR_TYPES = ("volume", "tick", "range")
+DEFAULT_BAR_SIZES = {"volume": 100.0, "tick": 1000, "range": 2000}   # BTC, trade, tick di prezzo
+TICK_SIZES = {"BTCUSDT": 0.01, "ETHUSDT": 0.01, "SOLUSDT": 0.01}   # PRICE_FILTER spot; le barre verificano con exchangeInfo
+MAX_BARS = 150
+
+
+def new_minute_candle(minute, price):
+    """
+    Candela 1m nel formato kline Binance, aggiornata trade per trade, con in
+    piu' Σp²q all'indice 12 (varianza per le bande VWAP)
+    """
+    return [minute, price, price, price, price, 0.0, minute + 59999, 0.0, 0, 0.0, 0.0, "0", 0.0]
+
+def update_minute_candle(candle, price, qty, is_buyer_maker, count=1):
+    candle[2] = max(candle[2], price)
+    candle[3] = min(candle[3], price)
+    candle[4] = price
+    candle[5] += qty
+    candle[7] += price * qty
+    candle[8] += count
+    candle[12] += price * price * qty
+    if not is_buyer_maker:
+        candle[9] += qty
+        candle[10] += price * qty
+
+def aggregate_klines(minute_candles, start, end, interval_ms, prev_close=None):
+    """
+    Klines del timeframe [start, end] (start allineato) dalle candele 1m.
+    Un periodo senza trade diventa una candela piatta sulla chiusura precedente.
+    """
+    klines = []
+    for ts in range(start, end + 1, interval_ms):
+        minutes = [minute_candles[m] for m in range(ts, ts + interval_ms, 60000) if m in minute_candles]
+        if not minutes:
+            if prev_close is not None:
+                klines.append([ts, prev_close, prev_close, prev_close, prev_close, 0.0, ts + interval_ms - 1, 0.0, 0, 0.0, 0.0, "0", 0.0])
+            continue
+        k = [ts, minutes[0][1], max(c[2] for c in minutes), min(c[3] for c in minutes), minutes[-1][4],
+             sum(c[5] for c in minutes), ts + interval_ms - 1, sum(c[7] for c in minutes), sum(c[8] for c in minutes),
+             sum(c[9] for c in minutes), sum(c[10] for c in minutes), "0", sum(c[12] for c in minutes)]
+        klines.append(k)
+        prev_close = k[4]
+    return klines
+
+
+class BarBuilder:
+    """
+    Barre non temporali: a volume (chiude a `size` BTC), a tick (ogni `size`
+    trade) e range (escursione massima di `size` tick di prezzo). Ogni barra
+    tiene kline e trade grezzi, da cui build_bar ricava lo stesso footprint
+    delle candele a tempo. I trade gia' visti (id aggTrade) vengono ignorati.
+    """
+
+    def __init__(self, bar_type, size, tick_size=0.01, max_bars=MAX_BARS):
+        if bar_type not in BAR_TYPES:
+            raise ValueError(f"Tipo di barra non supportato: {bar_type}")
+        self.bar_type = bar_type
+        self.size = float(size)
+        self.price_range = self.size * tick_size
+        self.closed = deque(maxlen=max_bars - 1)   # {'id', 'kline', 'trades'}
+        self.current = None
+        self.last_id = 0
+        self.fed_minute = None   # minuto da cui riprendere ad alimentare (ancora aperto)
+        self.truncated = False   # i trade in arrivo vengono da un minuto REST incompleto
+
+    def __len__(self):
+        return len(self.closed) + (self.current is not None)
+
+    def bars(self):
+        return list(self.closed) + ([self.current] if self.current is not None else [])
+
+    def add(self, trade):
+        trade_id = int(trade['a'])
+        if trade_id <= self.last_id:
+            return
+        self.last_id = trade_id
+        price, qty = float(trade['p']), float(trade['q'])
+
+        if self.current is not None and self.bar_type == "range":
+            k = self.current['kline']
+            if max(k[2], price) - min(k[3], price) > self.price_range:
+                self._close()
+        if self.current is None:
+            ts = int(trade['T'])
+            self.current = {'id': trade_id, 'kline': new_minute_candle(ts, price), 'trades': []}
+        if self.truncated:
+            self.current['truncated'] = True
+
+        k = self.current['kline']
+        update_minute_candle(k, price, qty, trade.get('m'))
+        k[6] = int(trade['T'])
+        self.current['trades'].append(trade)
+
+        if (self.bar_type == "volume" and k[5] >= self.size) or \
+           (self.bar_type == "tick" and len(self.current['trades']) >= self.size):
+            self._close()
+
+    def _close(self):
+        self.closed.append(self.current)
+        self.current = None
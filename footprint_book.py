@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - ORDER BOOK LOCALE
+Book mantenuto dallo stream depth diff di Binance (snapshot REST + aggiornamenti)
+"""
+
+from bisect import bisect_left, bisect_right, insort
+
+BOOK_MAX_LEVELS = 5000   # livelli per lato, i piu' lontani vengono scartati
+BUFFER_MAX_EVENTS = 1000 # eventi depth tenuti in attesa dello snapshot
+LADDER_EPSILON = 1e-9    # residui float delle somme incrementali
+
+
+class BookSide:
+    """Un lato del book: dict prezzo -> quantita' + lista prezzi ordinata"""
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self.levels = {}
+        self.prices = []   # crescente per entrambi i lati
+
+    def __len__(self):
+        return len(self.prices)
+
+    def set(self, price, qty):
+        """Imposta la quantita' di un livello, ritorna la quantita' precedente"""
+        old = self.levels.get(price, 0.0)
+        if qty > 0:
+            if price not in self.levels:
+                insort(self.prices, price)
+            self.levels[price] = qty
+        elif price in self.levels:
+            del self.levels[price]
+            del self.prices[bisect_left(self.prices, price)]
+        return old
+
+    def best(self):
+        if not self.prices:
+            return None
+        return self.prices[-1] if self.is_bid else self.prices[0]
+
+    def top(self, limit):
+        """Primi `limit` livelli dal migliore, formato [[prezzo, qty], ...]"""
+        prices = self.prices[-limit:][::-1] if self.is_bid else self.prices[:limit]
+        return [[p, self.levels[p]] for p in prices]
+
+    def clear(self):
+        self.levels.clear()
+        self.prices.clear()
+
+
+class LargeOrderIndex:
+    """
+    Ordini a riposo con quantita' > threshold, indicizzati per prezzo e per
+    quantita' (liste ordinate con bisect). Aggiornato dal book a ogni
+    variazione di livello: range per prezzo e top-K per size costano
+    O(log n + k) senza riscansionare il book.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.by_price = {True: [], False: []}   # is_bid -> prezzi crescenti
+        self.by_size = {True: [], False: []}    # is_bid -> (qty, prezzo) crescenti
+        self.qty = {True: {}, False: {}}
+
+    def reset(self, book):
+        for is_bid in (True, False):
+            side = book.side(is_bid)
+            large = {p: q for p, q in side.levels.items() if q > self.threshold}
+            self.qty[is_bid] = large
+            self.by_price[is_bid] = sorted(large)
+            self.by_size[is_bid] = sorted((q, p) for p, q in large.items())
+
+    def update(self, is_bid, price, old_qty, new_qty):
+        if old_qty > self.threshold:
+            prices, sizes = self.by_price[is_bid], self.by_size[is_bid]
+            del prices[bisect_left(prices, price)]
+            del sizes[bisect_left(sizes, (old_qty, price))]
+            del self.qty[is_bid][price]
+        if new_qty > self.threshold:
+            insort(self.by_price[is_bid], price)
+            insort(self.by_size[is_bid], (new_qty, price))
+            self.qty[is_bid][price] = new_qty
+
+    def in_range(self, is_bid, min_price, max_price):
+        """[(prezzo, qty)] con min_price <= prezzo <= max_price, prezzo crescente"""
+        prices = self.by_price[is_bid]
+        lo, hi = bisect_left(prices, min_price), bisect_right(prices, max_price)
+        qty = self.qty[is_bid]
+        return [(p, qty[p]) for p in prices[lo:hi]]
+
+    def top(self, is_bid, k):
+        """I k ordini piu' grandi del lato, quantita' decrescente"""
+        return [(p, q) for q, p in reversed(self.by_size[is_bid][-k:])] if k > 0 else []
+
+    def __len__(self):
+        return len(self.by_price[True]) + len(self.by_price[False])
+
+
+class DepthLadder:
+    """
+    Book aggregato in bucket di `step` (stesso arrotondamento dei livelli
+    footprint). Ogni variazione di livello sposta solo il proprio bucket;
+    le chiavi dei bucket restano ordinate per estrarre una finestra di prezzo.
+    """
+
+    def __init__(self, step):
+        self.step = step
+        self.qty = {True: {}, False: {}}   # is_bid -> bucket -> qty
+        self.buckets = []                  # bucket non vuoti, crescenti
+
+    def bucket(self, price):
+        return round(price / self.step) * self.step
+
+    def reset(self, book):
+        self.qty = {True: {}, False: {}}
+        for is_bid in (True, False):
+            side = self.qty[is_bid]
+            for price, qty in book.side(is_bid).levels.items():
+                b = self.bucket(price)
+                side[b] = side.get(b, 0.0) + qty
+        self.buckets = sorted(set(self.qty[True]) | set(self.qty[False]))
+
+    def update(self, is_bid, price, old_qty, new_qty):
+        b = self.bucket(price)
+        side, other = self.qty[is_bid], self.qty[not is_bid]
+        value = side.get(b, 0.0) + new_qty - old_qty
+        if value > LADDER_EPSILON:
+            if b not in side and b not in other:
+                insort(self.buckets, b)
+            side[b] = value
+        elif b in side:
+            del side[b]
+            if b not in other:
+                del self.buckets[bisect_left(self.buckets, b)]
+
+    def window(self, min_price, max_price):
+        """
+        Bucket tra min_price e max_price (prezzo decrescente, come le righe
+        del footprint) con profondita' cumulata dal miglior prezzo verso
+        l'esterno e massimo per bucket della finestra. La cumulata parte dal
+        touch anche quando la finestra non lo contiene: i bid sopra la finestra
+        e gli ask sotto (tra il touch e il bordo) sono gia' inclusi.
+        """
+        lo, hi = bisect_left(self.buckets, min_price), bisect_right(self.buckets, max_price)
+        window = self.buckets[lo:hi]
+        bids, asks = self.qty[True], self.qty[False]
+
+        levels = {}
+        # Bid: dal touch verso il basso (prezzo decrescente)
+        cum = sum(bids.get(b, 0.0) for b in self.buckets[hi:])
+        for b in reversed(window):
+            cum += bids.get(b, 0.0)
+            levels[b] = {'price': b, 'bid': bids.get(b, 0.0), 'ask': asks.get(b, 0.0), 'cum_bid': cum}
+        # Ask: dal touch verso l'alto (prezzo crescente)
+        cum = sum(asks.get(b, 0.0) for b in self.buckets[:lo])
+        for b in window:
+            cum += asks.get(b, 0.0)
+            levels[b]['cum_ask'] = cum
+
+        max_vol = max((max(l['bid'], l['ask']) for l in levels.values()), default=0.0)
+        return {'step': self.step, 'max_vol': max_vol, 'levels': [levels[b] for b in reversed(window)]}
+
+
+class OrderBook:
+    """
+    Order book locale secondo la procedura Binance: gli eventi depth vengono
+    bufferizzati finche' non arriva lo snapshot REST, poi applicati in ordine
+    di update id. Un buco nella sequenza marca il book come non sincronizzato.
+    """
+
+    def __init__(self, symbol, max_levels=BOOK_MAX_LEVELS):
+        self.symbol = symbol
+        self.max_levels = max_levels
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.last_update_id = 0
+        self.synced = False
+        self.buffer = []
+        self.updated_at = 0
+        self.listeners = []   # reset(book) / update(is_bid, prezzo, old_qty, new_qty)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+        if self.synced:
+            listener.reset(self)
+        return listener
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _set(self, is_bid, price, qty):
+        old = self.side(is_bid).set(price, qty)
+        if old != qty:
+            for listener in self.listeners:
+                listener.update(is_bid, price, old, qty)
+
+    def side(self, is_bid):
+        return self.bids if is_bid else self.asks
+
+    def load_snapshot(self, snapshot):
+        """Carica lo snapshot REST e riapplica gli eventi bufferizzati"""
+        self.bids.clear()
+        self.asks.clear()
+        for price, qty in snapshot.get('bids', []):
+            self.bids.set(float(price), float(qty))
+        for price, qty in snapshot.get('asks', []):
+            self.asks.set(float(price), float(qty))
+        self.last_update_id = int(snapshot.get('lastUpdateId', 0))
+        self.synced = True
+        for listener in self.listeners:
+            listener.reset(self)
+
+        buffered, self.buffer = self.buffer, []
+        for event in buffered:
+            if int(event['u']) <= self.last_update_id:
+                continue
+            if not self.apply_diff(event):
+                break
+        return self.synced
+
+    def apply_diff(self, event):
+        """Applica un evento depthUpdate; False se serve un nuovo snapshot"""
+        if not self.synced:
+            self.buffer.append(event)
+            del self.buffer[:-BUFFER_MAX_EVENTS]
+            return False
+
+        first_id, last_id = int(event['U']), int(event['u'])
+        if last_id <= self.last_update_id:
+            return True
+        if first_id > self.last_update_id + 1:
+            # Evento perso: il book non e' piu' affidabile
+            self.synced = False
+            self.buffer = [event]
+            return False
+
+        for price, qty in event.get('b', []):
+            self._set(True, float(price), float(qty))
+        for price, qty in event.get('a', []):
+            self._set(False, float(price), float(qty))
+        for is_bid in (True, False):
+            side = self.side(is_bid)
+            if len(side) > self.max_levels:
+                for price in side.prices[:len(side) - self.max_levels] if is_bid else side.prices[self.max_levels:]:
+                    self._set(is_bid, price, 0.0)
+        self.last_update_id = last_id
+        self.updated_at = int(event.get('E', 0))
+        return True
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def mid_price(self):
+        bid, ask = self.best_bid(), self.best_ask()
+        if bid is None or ask is None:
+            return None
+        return (bid + ask) / 2
+
+    def snapshot(self, limit=1000):
+        """Stesso formato di /api/v3/depth"""
+        return {
+            "lastUpdateId": self.last_update_id,
+            "bids": self.bids.top(limit),
+            "asks": self.asks.top(limit),
+        }
+
+    def level_count(self):
+        return len(self.bids) + len(self.asks)
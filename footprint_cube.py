@@ -0,0 +1,525 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - CUBO TEMPO x PREZZO PERSISTENTE
+Volume bid/ask a 1 minuto x tick minimo, una directory per giorno UTC, con
+roll-up precalcolati (5m, 1h, 1d x step di prezzo piu' grossi): footprint
+1h/1d e profili di piu' giorni leggono solo le righe del range richiesto
+"""
+
+import io
+import json
+import os
+import threading
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+import numpy as np
+
+from footprint_bars import TICK_SIZES
+
+CUBE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cube_state")
+CUBE_TIER_MINUTES = (5, 60, 1440)   # roll-up temporali precalcolati
+CUBE_STEPS = {                      # step di prezzo precalcolati (gli altri si calcolano dal livello base)
+    "BTCUSDT": (5.0, 10.0, 25.0, 50.0),
+    "ETHUSDT": (0.5, 1.0, 2.5, 5.0),
+    "SOLUSDT": (0.05, 0.1, 0.25, 0.5),
+}
+CUBE_HOT_DAYS = 2          # giorni in memoria e ancora aggiornabili (oggi e ieri)
+CUBE_MAX_DAYS = 90         # giorni letti al massimo da una query
+CUBE_PENDING_TRADES = 200000   # trade tenuti in attesa del tick di exchangeInfo
+DAY_MS = 86400000
+
+CELL = np.dtype([('t', '<i4'), ('tick', '<i8'), ('bid', '<f8'), ('ask', '<f8')])   # t = minuto del giorno
+ID_RANGE = np.dtype([('t', '<i4'), ('lo', '<i8'), ('hi', '<i8')])                  # intervalli di aggTrade gia' contati per minuto
+
+
+def day_name(day_ms):
+    return datetime.fromtimestamp(day_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def tier_name(minutes, step):
+    return f"{minutes}m_{step:g}"
+
+
+def price_buckets(ticks, tick_size, step):
+    """Bucket di prezzo (prezzo = bucket * step) come round_price del footprint"""
+    return np.rint(np.round(ticks * tick_size, 8) / step).astype(np.int64)
+
+
+def to_cells(minute, cells):
+    """dict tick -> [bid, ask] di un minuto come array CELL ordinato per tick"""
+    arr = np.zeros(len(cells), CELL)
+    arr['t'] = minute
+    arr['tick'] = list(cells)
+    values = np.array(list(cells.values()), dtype=np.float64).reshape(-1, 2)
+    arr['bid'], arr['ask'] = values[:, 0], values[:, 1]
+    arr.sort(order='tick')
+    return arr
+
+
+def add_id(ranges, trade_id):
+    """
+    Aggiunge trade_id agli intervalli [lo, hi] disgiunti e ordinati di un
+    minuto, unendo quelli adiacenti; False se era gia' contato
+    """
+    i = bisect_right(ranges, [trade_id, float('inf')]) - 1   # ultimo intervallo con lo <= trade_id
+    if i >= 0 and ranges[i][1] >= trade_id:
+        return False
+    if i >= 0 and ranges[i][1] == trade_id - 1:
+        ranges[i][1] = trade_id
+        if i + 1 < len(ranges) and ranges[i + 1][0] == trade_id + 1:
+            ranges[i][1] = ranges.pop(i + 1)[1]
+    elif i + 1 < len(ranges) and ranges[i + 1][0] == trade_id + 1:
+        ranges[i + 1][0] = trade_id
+    else:
+        ranges.insert(i + 1, [trade_id, trade_id])
+    return True
+
+
+def npy_header(n, dtype):
+    """Header .npy (v1.0) di un array 1-D di n righe: lunghezza fissa, np.save riserva spazio alla shape"""
+    buf = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buf, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (n,)})
+    return buf.getvalue()
+
+
+def save_atomic(path, arr):
+    tmp = path[:-len(".npy")] + ".tmp.npy"
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+def rows_from(path, t0):
+    """Righe con t >= t0 di un file del cubo (ordinato per t), vuoto se manca"""
+    if not os.path.exists(path):
+        return np.zeros(0, CELL)
+    arr = np.load(path, mmap_mode='r')
+    return np.array(arr[np.searchsorted(arr['t'], t0, side='left'):])
+
+
+def replace_tail(path, cut, rows):
+    """
+    Riscrive in place le righe dalla `cut` in poi: prima la shape si accorcia
+    al prefisso invariato (un lettore vede il prefisso o il file nuovo), poi
+    coda e shape definitiva. False se l'header non lo consente.
+    """
+    with open(path, 'r+b') as f:
+        if np.lib.format.read_magic(f) != (1, 0):
+            return False
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+        head, full = npy_header(cut, dtype), npy_header(cut + len(rows), dtype)
+        if dtype != rows.dtype or fortran_order or len(shape) != 1 or not len(head) == len(full) == offset:
+            return False
+        f.seek(0)
+        f.write(head)
+        f.flush()
+        f.seek(offset + cut * dtype.itemsize)
+        f.write(rows.tobytes())
+        f.truncate()
+        f.flush()
+        f.seek(0)
+        f.write(full)
+    return True
+
+
+def write_tail(path, rows, t0):
+    """Sostituisce le righe con t >= t0 di un file del cubo con `rows` (ordinate per t)"""
+    if os.path.exists(path):
+        old = np.load(path, mmap_mode='r')
+        cut = int(np.searchsorted(old['t'], t0, side='left'))
+        del old
+        if replace_tail(path, cut, rows):
+            return
+        rows = np.concatenate([np.load(path)[:cut], rows])
+    save_atomic(path, rows)
+
+
+def rollup(cells, minutes, step, tick_size):
+    """Celle aggregate a `minutes` x `step` (step None = tick minimo), ordinate per (t, tick)"""
+    if not len(cells):
+        return np.zeros(0, CELL)
+    t = cells['t'] // minutes * minutes
+    tick = cells['tick'] if step is None else price_buckets(cells['tick'], tick_size, step)
+    keys = (t.astype(np.int64) << 40) + tick
+    unique, inverse = np.unique(keys, return_inverse=True)
+    out = np.zeros(len(unique), CELL)
+    out['t'] = unique >> 40
+    out['tick'] = unique - (out['t'].astype(np.int64) << 40)
+    out['bid'] = np.bincount(inverse, weights=cells['bid'], minlength=len(unique))
+    out['ask'] = np.bincount(inverse, weights=cells['ask'], minlength=len(unique))
+    return out
+
+
+class CubeDay:
+    """
+    Giorno caldo in memoria: minuti chiusi come array CELL, minuti ancora
+    aperti come dict tick -> [bid, ask]. Per ogni minuto si tengono gli
+    intervalli disgiunti di id aggTrade gia' contati (di solito uno solo), cosi'
+    stream e REST, che si sovrappongono o arrivano in qualsiasi ordine, non
+    contano due volte lo stesso trade e non ne scartano di nuovi.
+    """
+
+    def __init__(self, day_ms, tick_size=None):
+        self.day_ms = day_ms
+        self.tick_size = tick_size   # tick con cui sono espresse le celle (salvato in meta.json)
+        self.closed = {}     # minuto -> array CELL
+        self.open = {}       # minuto -> {tick: [bid, ask]}
+        self.ids = {}        # minuto -> [[lo, hi], ...] disgiunti e ordinati
+        self.changed_from = None   # primo minuto modificato dall'ultimo salvataggio
+
+    def __len__(self):
+        return sum(len(a) for a in self.closed.values()) + sum(len(c) for c in self.open.values())
+
+    def add(self, minute, trade_id, tick, qty, is_bid):
+        if not add_id(self.ids.setdefault(minute, []), trade_id):
+            return False
+        cells = self.open.get(minute)
+        if cells is None:
+            cells = self.open[minute] = {}
+            for c in self.closed.pop(minute, ()):
+                # Trade tardivo su un minuto gia' compattato: torna modificabile
+                cells[int(c['tick'])] = [float(c['bid']), float(c['ask'])]
+        cell = cells.get(tick)
+        if cell is None:
+            cell = cells[tick] = [0.0, 0.0]
+        cell[0 if is_bid else 1] += qty
+        if self.changed_from is None or minute < self.changed_from:
+            self.changed_from = minute
+        return True
+
+    def compact(self, before=None):
+        """Converte in array i minuti aperti precedenti a `before` (tutti se None)"""
+        for minute in [m for m in self.open if before is None or m < before]:
+            self.closed[minute] = to_cells(minute, self.open.pop(minute))
+
+    def cells(self, first=0, last=1439):
+        """Celle dei minuti [first, last] in ordine (t, tick), minuti aperti compresi"""
+        parts = [(m, a) for m, a in self.closed.items() if first <= m <= last]
+        parts += [(m, to_cells(m, c)) for m, c in self.open.items() if first <= m <= last]
+        if not parts:
+            return np.zeros(0, CELL)
+        parts.sort(key=lambda p: p[0])
+        return np.concatenate([a for _, a in parts])
+
+    def id_ranges(self):
+        """Una riga (minuto, lo, hi) per intervallo"""
+        rows = [(minute, lo, hi) for minute, ranges in sorted(self.ids.items()) for lo, hi in ranges]
+        return np.array(rows, ID_RANGE)
+
+    @classmethod
+    def from_arrays(cls, day_ms, base, ids, tick_size=None):
+        day = cls(day_ms, tick_size)
+        if len(base):
+            bounds = np.flatnonzero(np.diff(base['t'])) + 1
+            for part in np.split(base, bounds):
+                day.closed[int(part['t'][0])] = part.copy()
+        for r in np.sort(ids, order=('t', 'lo')):
+            day.ids.setdefault(int(r['t']), []).append([int(r['lo']), int(r['hi'])])
+        day.changed_from = 0   # roll-up ricostruiti al primo salvataggio (anche dopo un salvataggio interrotto)
+        return day
+
+
+class FootprintCube:
+    """
+    Cubo di un simbolo. Per ogni giorno su disco: base.npy (1m x tick),
+    un file per roll-up (minuti x step, tick = bucket del prezzo), ids.npy e
+    meta.json con il tick delle celle base.
+    Le query aprono i file in memory map e tagliano le righe del range per
+    bisezione sul minuto. A ogni save dei giorni caldi si riscrivono solo le
+    righe dal primo minuto modificato in poi (e le righe dei roll-up che lo
+    contengono); snapshot gira sul loop, write anche in un executor. I giorni
+    usciti dalla finestra calda vengono scaricati dalla memoria una volta
+    scritti; da quel momento sono immutabili.
+
+    Il tick viene da exchangeInfo (set_tick_size, dall'engine): fino ad
+    allora i trade restano in attesa. Un giorno salvato con un tick diverso
+    non viene piu' scritto.
+    """
+
+    def __init__(self, symbol, directory=CUBE_DIR, tick_size=None):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.steps = CUBE_STEPS.get(symbol, ())
+        self.path = os.path.join(directory, symbol.lower()) if directory else None
+        self.days = {}             # day_ms -> CubeDay caldo
+        self.frozen = set()        # giorni salvati con un altro tick: solo lettura
+        self.day_ticks = {}        # day_ms -> tick dei giorni su disco
+        self.pending = []          # trade arrivati prima del tick
+        self.stream_minute = None  # ultimo minuto dallo stream (i precedenti si compattano)
+        self.write_lock = threading.Lock()   # un solo write alla volta (executor o save)
+        self.failed = set()        # giorni non scritti: al prossimo save si riscrivono per intero
+
+    def set_tick_size(self, tick_size):
+        """Tick confermato: ricarica i giorni caldi salvati, poi riapplica i trade in attesa"""
+        if self.tick_size is not None and tick_size != self.tick_size:
+            print(f"[WARN] Cubo {self.symbol}: tick {tick_size:g} invece di {self.tick_size:g}, giorni in memoria chiusi")
+            self.write(self.snapshot())
+            self.frozen.update(self.days)
+            self.days.clear()
+        self.tick_size = tick_size
+        self.load()
+        pending, self.pending = self.pending, []
+        for trade in pending:
+            self.add(trade)
+        self._compact(self.stream_minute)
+
+    # ------------------------------------------------------------------
+    # Ingestion
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def hot_floor(now_ms=None):
+        """Primo giorno ancora aggiornabile"""
+        if now_ms is None:
+            now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        return now_ms // DAY_MS * DAY_MS - (CUBE_HOT_DAYS - 1) * DAY_MS
+
+    def _hot_day(self, day_ms):
+        day = self.days.get(day_ms)
+        if day is None:
+            if day_ms < self.hot_floor() or day_ms in self.frozen:
+                return None   # giorno archiviato: immutabile
+            day = self._load_day(day_ms)
+            if day is not None and day.tick_size != self.tick_size:
+                print(f"[WARN] Cubo {self.symbol} {day_name(day_ms)} salvato con tick {day.tick_size:g} "
+                      f"invece di {self.tick_size:g}: non viene aggiornato")
+                self.frozen.add(day_ms)
+                return None
+            day = self.days[day_ms] = day if day is not None else CubeDay(day_ms, self.tick_size)
+        return day
+
+    def add(self, trade):
+        if self.tick_size is None:
+            if len(self.pending) < CUBE_PENDING_TRADES:
+                self.pending.append(trade)
+            return False
+        ts = int(trade['T'])
+        day_ms = ts // DAY_MS * DAY_MS
+        day = self._hot_day(day_ms)
+        if day is None:
+            return False
+        minute = (ts - day_ms) // 60000
+        tick = int(round(float(trade['p']) / self.tick_size))
+        return day.add(minute, int(trade['a']), tick, float(trade['q']), bool(trade.get('m')))
+
+    def on_trade(self, trade):
+        """Trade dallo stream: al cambio di minuto compatta i minuti precedenti"""
+        minute = int(trade['T']) // 60000
+        if self.stream_minute is None or minute > self.stream_minute:
+            if self.stream_minute is not None:
+                self._compact(minute)
+            self.stream_minute = minute
+        return self.add(trade)
+
+    def extend(self, trades):
+        """Trade di una candela dal REST (quelli gia' visti dallo stream vengono ignorati)"""
+        for trade in trades:
+            self.add(trade)
+        self._compact(self.stream_minute)
+
+    def _compact(self, minute=None):
+        for day in self.days.values():
+            day.compact(None if minute is None else minute - day.day_ms // 60000)
+
+    # ------------------------------------------------------------------
+    # Persistenza
+    # ------------------------------------------------------------------
+
+    def _day_path(self, day_ms):
+        return os.path.join(self.path, day_name(day_ms))
+
+    def snapshot(self):
+        """
+        Copia (sul loop) le righe da scrivere: per ogni giorno caldo
+        modificato le celle dal primo minuto cambiato, gli id e il tick
+        """
+        with self.write_lock:
+            failed, self.failed = self.failed, set()
+        changes = []
+        for day_ms in sorted(self.days):
+            day = self.days[day_ms]
+            if day_ms in failed:
+                day.changed_from = 0
+            if day.changed_from is not None:
+                if self.path is not None:
+                    first = day.changed_from
+                    changes.append((day_ms, first, day.cells(first), day.id_ranges(), day.tick_size))
+                day.changed_from = None
+        return changes
+
+    def write(self, changes):
+        """Scrive le modifiche di snapshot (anche fuori dal loop)"""
+        with self.write_lock:
+            for change in changes:
+                try:
+                    self._write_day(*change)
+                except (OSError, ValueError) as e:
+                    print(f"[WARN] Cubo {self.symbol} {day_name(change[0])} non salvato: {e}")
+                    self.failed.add(change[0])
+
+    def _write_day(self, day_ms, first, cells, ids, tick_size):
+        directory = self._day_path(day_ms)
+        os.makedirs(directory, exist_ok=True)
+        write_tail(os.path.join(directory, "base.npy"), cells, first)
+        for step in self.steps:
+            # Ogni roll-up dal precedente (5m dal base, 1h dal 5m, ...): solo le righe dal bucket di `first`
+            source, source_step = os.path.join(directory, "base.npy"), step
+            for minutes in sorted(CUBE_TIER_MINUTES):
+                t0 = first // minutes * minutes
+                path = os.path.join(directory, f"{tier_name(minutes, step)}.npy")
+                write_tail(path, rollup(rows_from(source, t0), minutes, source_step, tick_size), t0)
+                source, source_step = path, None
+        save_atomic(os.path.join(directory, "ids.npy"), ids)
+        tmp = os.path.join(directory, "meta.tmp.json")
+        with open(tmp, 'w') as f:
+            json.dump({'tick_size': tick_size}, f)
+        os.replace(tmp, os.path.join(directory, "meta.json"))
+        self.day_ticks[day_ms] = tick_size
+
+    def unload(self):
+        """Scarica i giorni usciti dalla finestra calda gia' scritti su disco"""
+        floor = self.hot_floor()
+        for day_ms in [d for d in self.days if d < floor]:
+            if self.days[day_ms].changed_from is None and day_ms not in self.failed:
+                del self.days[day_ms]
+
+    def save(self):
+        """Salva i giorni modificati e scarica quelli usciti dalla finestra calda"""
+        self.write(self.snapshot())
+        self.unload()
+
+    def _day_tick(self, day_ms):
+        """
+        Tick delle celle base di un giorno su disco; i giorni senza meta.json
+        sono stati scritti con la tabella TICK_SIZES (0.01 fuori tabella)
+        """
+        tick = self.day_ticks.get(day_ms)
+        if tick is None:
+            try:
+                with open(os.path.join(self._day_path(day_ms), "meta.json")) as f:
+                    tick = float(json.load(f)['tick_size'])
+            except (OSError, ValueError, KeyError, TypeError):
+                tick = TICK_SIZES.get(self.symbol, 0.01)
+            self.day_ticks[day_ms] = tick
+        return tick
+
+    def _load_day(self, day_ms):
+        if self.path is None:
+            return None
+        directory = self._day_path(day_ms)
+        if not os.path.exists(os.path.join(directory, "base.npy")):
+            return None
+        try:
+            base = np.load(os.path.join(directory, "base.npy"))
+            ids = np.load(os.path.join(directory, "ids.npy"))
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Cubo {self.symbol} {day_name(day_ms)} non leggibile: {e}")
+            return None
+        # Id di minuti senza celle: base interrotto a meta' scrittura, quei trade vanno ricontati
+        ids = ids[np.isin(ids['t'], base['t'])]
+        return CubeDay.from_arrays(day_ms, base, ids, self._day_tick(day_ms))
+
+    def load(self):
+        """Ricarica i giorni caldi gia' salvati (riavvio nella stessa giornata)"""
+        floor = self.hot_floor()
+        if self.path is None or self.tick_size is None:
+            return False
+        for day_ms in range(floor, floor + CUBE_HOT_DAYS * DAY_MS, DAY_MS):
+            if day_ms not in self.days and os.path.exists(os.path.join(self._day_path(day_ms), "base.npy")):
+                self._hot_day(day_ms)
+        return bool(self.days)
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def _source(self, first, last, interval_ms, step):
+        """
+        (minuti, step) del roll-up piu' grossolano utilizzabile per i minuti
+        [first, last] di un giorno: allineato agli estremi e all'intervallo
+        (non mescola barre diverse) e con lo stesso step (ri-arrotondare bucket
+        gia' arrotondati non e' esatto). (1, None) = livello base.
+        """
+        if step in self.steps:
+            for minutes in sorted(CUBE_TIER_MINUTES, reverse=True):
+                if first % minutes == 0 and (last + 1) % minutes == 0 \
+                        and (interval_ms is None or interval_ms % (minutes * 60000) == 0):
+                    return minutes, step
+        return 1, None
+
+    def _day_cells(self, day_ms, first, last, interval_ms, step):
+        """
+        Celle del giorno per i minuti [first, last] con tick = bucket di
+        `step`: dalla memoria se il giorno e' caldo, altrimenti dal file del
+        roll-up in memory map, tagliato per bisezione sul minuto
+        """
+        minutes, tier_step = self._source(first, last, interval_ms, step)
+        day = self.days.get(day_ms)
+        if day is not None:
+            cells, tick_size = day.cells(first, last), day.tick_size
+        elif self.path is None:
+            return np.zeros(0, CELL)
+        else:
+            name = 'base' if tier_step is None else tier_name(minutes, tier_step)
+            path = os.path.join(self._day_path(day_ms), f"{name}.npy")
+            if not os.path.exists(path):
+                return np.zeros(0, CELL)
+            arr = np.load(path, mmap_mode='r')
+            lo, hi = np.searchsorted(arr['t'], first, side='left'), np.searchsorted(arr['t'], last, side='right')
+            cells = np.array(arr[lo:hi])
+            if tier_step is not None:
+                return cells
+            tick_size = self._day_tick(day_ms)
+        return rollup(cells, minutes, step, tick_size)
+
+    def query(self, start_ms, end_ms, interval_ms, step):
+        """
+        Barre footprint con livelli bid/ask tra start_ms ed end_ms (estremi
+        portati ai limiti delle barre). interval_ms None = una sola barra su
+        tutto il range (profilo di piu' giorni).
+        """
+        step = float(step)
+        size = interval_ms or 60000
+        start_ms = start_ms // size * size
+        end_ms = (end_ms // size + 1) * size - 1
+        end_ms = min(end_ms, start_ms // DAY_MS * DAY_MS + CUBE_MAX_DAYS * DAY_MS - 1)
+
+        ts_parts, cell_parts = [], []
+        for day_ms in range(start_ms // DAY_MS * DAY_MS, end_ms + 1, DAY_MS):
+            first = max(0, (start_ms - day_ms) // 60000)
+            last = min(1439, (end_ms - day_ms) // 60000)
+            cells = self._day_cells(day_ms, first, last, interval_ms, step)
+            if len(cells):
+                ts_parts.append(day_ms + cells['t'].astype(np.int64) * 60000)
+                cell_parts.append(cells)
+        if not cell_parts:
+            return []
+
+        ts, cells = np.concatenate(ts_parts), np.concatenate(cell_parts)
+        buckets = cells['tick']
+        bar_index = (ts - start_ms) // interval_ms if interval_ms else np.zeros(len(ts), dtype=np.int64)
+        low = int(buckets.min())
+        width = int(buckets.max()) - low + 1
+        # Chiave (barra, prezzo decrescente): np.unique restituisce i livelli gia' nell'ordine del footprint
+        keys = bar_index * width + (width - 1 - (buckets - low))
+        unique, inverse = np.unique(keys, return_inverse=True)
+        bid = np.bincount(inverse, weights=cells['bid'], minlength=len(unique))
+        ask = np.bincount(inverse, weights=cells['ask'], minlength=len(unique))
+        bars_of = unique // width
+        prices = np.round((low + width - 1 - unique % width) * step, 8)
+
+        bars = []
+        for rows in np.split(np.arange(len(unique)), np.flatnonzero(np.diff(bars_of)) + 1):
+            b, a = bid[rows], ask[rows]
+            bars.append({
+                'timestamp': int(start_ms + int(bars_of[rows[0]]) * (interval_ms or 0)),
+                'levels': [{'price': float(p), 'bid': round(float(x), 4), 'ask': round(float(y), 4)}
+                           for p, x, y in zip(prices[rows], b, a)],
+                'high': float(prices[rows[0]]), 'low': float(prices[rows[-1]]),
+                'volume': round(float(b.sum() + a.sum()), 4), 'delta': round(float(a.sum() - b.sum()), 4),
+            })
+        return bars
+
+    def stats(self):
+        return {'hot_days': [day_name(d) for d in sorted(self.days)], 'cells': sum(len(d) for d in self.days.values())}
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - DELTA CUMULATO (CVD)
+Serie per timeframe di delta e volume con somme prefisse: il CVD di
+qualsiasi finestra e' una sottrazione. Le divergenze prezzo/CVD vengono
+calcolate una volta sola, alla chiusura di ogni barra.
+"""
+
+from bisect import bisect_left, bisect_right
+
+CVD_MAX_BARS = 5000          # barre chiuse tenute per timeframe
+DIVERGENCE_LOOKBACK = 20     # barre precedenti su cui cercare massimi/minimi
+
+
+def bar_delta(k):
+    """Delta della kline: taker buy (indice 9) meno il resto del volume"""
+    return 2 * float(k[9]) - float(k[5]) if len(k) > 9 else 0.0
+
+
+class CVDSeries:
+    """
+    cum_delta[i] / cum_volume[i] = somme delle barre chiuse prima della i-esima
+    (assolute dall'origine della serie, quindi restano valide anche dopo aver
+    scartato le barre piu' vecchie). La barra aperta resta fuori dai prefissi.
+    """
+
+    def __init__(self, interval_ms, max_bars=CVD_MAX_BARS, lookback=DIVERGENCE_LOOKBACK):
+        self.interval_ms = interval_ms
+        self.max_bars = max_bars
+        self.lookback = lookback
+        self.timestamps = []
+        self.highs = []
+        self.lows = []
+        self.deltas = []
+        self.volumes = []
+        self.divergences = []   # 'bearish' / 'bullish' / None, fissata alla chiusura
+        self.cum_delta = [0.0]
+        self.cum_volume = [0.0]
+        self.open_bar = None    # kline della barra ancora aperta
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def reset(self):
+        self.__init__(self.interval_ms, self.max_bars, self.lookback)
+
+    def sync(self, klines):
+        """
+        Aggiunge le barre chiuse nuove; un buco nella serie la fa ripartire,
+        klines che iniziano prima della serie (storico piu' lungo) la ricostruiscono
+        """
+        if not klines:
+            return self
+        closed, self.open_bar = klines[:-1], klines[-1]
+        if self.timestamps and closed and (int(closed[0][0]) > self.timestamps[-1] + self.interval_ms
+                                           or int(closed[0][0]) < self.timestamps[0]):
+            self.reset()
+            self.open_bar = klines[-1]
+        last = self.timestamps[-1] if self.timestamps else None
+        for k in closed:
+            if last is None or int(k[0]) > last:
+                self._close(k)
+        return self
+
+    def _close(self, k):
+        high, low = float(k[2]), float(k[3])
+        delta = bar_delta(k)
+        cvd = self.cum_delta[-1] + delta
+        self.divergences.append(self._divergence(high, low, cvd))
+        self.timestamps.append(int(k[0]))
+        self.highs.append(high)
+        self.lows.append(low)
+        self.deltas.append(delta)
+        self.volumes.append(float(k[5]))
+        self.cum_delta.append(cvd)
+        self.cum_volume.append(self.cum_volume[-1] + float(k[5]))
+        if len(self.timestamps) > self.max_bars:
+            drop = len(self.timestamps) - self.max_bars
+            for values in (self.timestamps, self.highs, self.lows, self.deltas, self.volumes,
+                           self.divergences, self.cum_delta, self.cum_volume):
+                del values[:drop]
+
+    def _divergence(self, high, low, cvd):
+        """
+        Nuovo massimo di prezzo sulle ultime `lookback` barre senza nuovo
+        massimo del CVD (ribassista), o l'opposto sui minimi (rialzista)
+        """
+        if len(self.timestamps) < self.lookback:
+            return None
+        prev_cvd = self.cum_delta[-self.lookback:]
+        if high > max(self.highs[-self.lookback:]) and cvd <= max(prev_cvd):
+            return 'bearish'
+        if low < min(self.lows[-self.lookback:]) and cvd >= min(prev_cvd):
+            return 'bullish'
+        return None
+
+    def _live(self):
+        """(timestamp, delta, volume) della barra aperta se segue l'ultima chiusa"""
+        k = self.open_bar
+        if k is None or (self.timestamps and int(k[0]) <= self.timestamps[-1]):
+            return None
+        return int(k[0]), bar_delta(k), float(k[5])
+
+    def at(self, ts):
+        """(cvd, divergenza) della barra con timestamp ts, None se fuori serie"""
+        live = self._live()
+        if live is not None and live[0] == ts:
+            return self.cum_delta[-1] + live[1], None
+        i = bisect_left(self.timestamps, ts)
+        if i < len(self.timestamps) and self.timestamps[i] == ts:
+            return self.cum_delta[i + 1], self.divergences[i]
+        return None
+
+    def annotate(self, bars):
+        """Aggiunge cvd e divergenza alle barre del footprint"""
+        for bar in bars:
+            point = self.at(bar['timestamp'])
+            bar['cvd'] = round(point[0], 2) if point else None
+            bar['divergence'] = point[1] if point else None
+        return bars
+
+    def window(self, start=None, end=None, include_bars=True):
+        """CVD e volume delle barre con start <= timestamp <= end (ms), aperta inclusa"""
+        a = 0 if start is None else bisect_left(self.timestamps, int(start))
+        b = len(self.timestamps) if end is None else bisect_right(self.timestamps, int(end))
+        b = max(a, b)
+        base_delta, base_volume = self.cum_delta[a], self.cum_volume[a]
+        delta = self.cum_delta[b] - base_delta
+        volume = self.cum_volume[b] - base_volume
+
+        live = self._live()
+        use_live = live is not None and b == len(self.timestamps) and \
+            (start is None or live[0] >= int(start)) and (end is None or live[0] <= int(end))
+        if use_live:
+            delta += live[1]
+            volume += live[2]
+
+        result = {
+            'start': self.timestamps[a] if b > a else (live[0] if use_live else None),
+            'end': live[0] if use_live else (self.timestamps[b - 1] if b > a else None),
+            'bars_count': b - a + use_live,
+            'cvd': round(delta, 2),
+            'volume': round(volume, 2),
+        }
+        if include_bars:
+            result['bars'] = [
+                {'timestamp': self.timestamps[i], 'delta': round(self.deltas[i], 2),
+                 'cvd': round(self.cum_delta[i + 1] - base_delta, 2),
+                 'cum_volume': round(self.cum_volume[i + 1] - base_volume, 2),
+                 'divergence': self.divergences[i]}
+                for i in range(a, b)
+            ]
+            if use_live:
+                result['bars'].append({'timestamp': live[0], 'delta': round(live[1], 2), 'cvd': result['cvd'],
+                                       'cum_volume': result['volume'], 'divergence': None, 'open': True})
+        return result
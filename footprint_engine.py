@@ -0,0 +1,1301 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - MOTORE DATI CONDIVISO
+Un solo livello di ingestion e cache Binance per tutte le dashboard
+"""
+
+import asyncio
+import heapq
+import json
+import sys
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
+from bisect import bisect_left
+
+import aiohttp
+import numpy as np
+
+from footprint_absorption import ABSORPTION_MIN_VOLUME, AbsorptionDetector
+from footprint_archive import BookArchive
+from footprint_bars import DEFAULT_BAR_SIZES, TICK_SIZES, BarBuilder, aggregate_klines, new_minute_candle, update_minute_candle
+from footprint_book import DepthLadder, LargeOrderIndex, OrderBook
+from footprint_cube import DAY_MS, FootprintCube
+from footprint_cvd import CVDSeries
+from footprint_features import BookFeatures
+from footprint_imbalance import IMBALANCE_MIN_VOLUME, IMBALANCE_RATIO, annotate_imbalances, imbalance_footprint
+from footprint_profile import VALUE_AREA_PCT, ProfileIndex
+from footprint_signal import trading_signal
+from footprint_sizes import merge_histograms, size_edges, size_histogram
+from footprint_sketch import KLLSketch
+from footprint_sweep import SweepDetector, sweep_counts
+from footprint_tape import TAPE_THRESHOLDS, TradeTape, row_dict
+from footprint_tracker import SignalTracker
+from footprint_vwap import VWAP_ROLLING_BARS, VWAPSeries
+
+SYMBOL_BINANCE = "BTCUSDT"
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+BINANCE_API = "https://api.binance.com/api/v3"
+
+CACHE_TTL = 60            # footprint completo
+KLINES_TTL = 2            # klines condivise tra dashboard e relevant_orders
+ORDERBOOK_TTL = 3
+OPEN_TRADES_TTL = 2       # trade della candela ancora aperta
+MAX_TRADE_CANDLES = 500   # trade di candele chiuse tenuti in memoria (LRU)
+FOOTPRINT_BARS = 20       # candele con footprint calcolato
+MAX_FOOTPRINT_KEYS = 32   # footprint calcolati in cache per simbolo (LRU)
+MAX_TRADE_VIEWS = 64      # candele con trade ordinati per quantita' (LRU)
+MAX_BAR_BUILDERS = 8      # barre volume/tick/range mantenute per simbolo (LRU)
+MAX_BAR_FOOTPRINTS = 2000 # footprint di barre chiuse gia' calcolati (LRU)
+MAX_BAR_SWEEPS = 2000     # conteggi sweep di candele chiuse gia' calcolati (LRU)
+BAR_SOURCE_MINUTES = 60   # minuti di trade con cui si avvia un nuovo tipo di barra
+BAR_BACKFILL_PAGES = 10   # pagine aggTrades (1000 trade) per minuto nel backfill delle barre
+AGG_TRADES_LIMIT = 1000   # massimo di /aggTrades per richiesta
+MAX_KLINES = 1000         # massimo di /klines per richiesta
+LIVE_TRADE_MINUTES = 60   # minuti di trade dallo stream tenuti per simbolo
+LIVE_CANDLE_MINUTES = 1500  # candele 1m costruite dallo stream (base di tutti i timeframe)
+
+# Ordini rilevanti: banda fissa attorno al prezzo e soglie per simbolo dell'indice
+# dei grandi ordini a riposo (la prima soglia e' quella di /api/relevant_orders)
+FIXED_RANGE_PCT = 0.420
+MIN_BTC_THRESHOLD = 3.0
+LARGE_ORDER_THRESHOLDS = {
+    "BTCUSDT": (MIN_BTC_THRESHOLD, 10.0, 50.0),
+    "ETHUSDT": (50.0, 200.0),
+    "SOLUSDT": (1000.0, 5000.0),
+}
+RELEVANT_KLINES_TTL = 60  # price_history: l'ultima candela si aggiorna dallo stream
+
+DEPTH_LADDER_RANGE_PCT = 1.0   # finestra di /api/depth_ladder attorno al mid
+MAX_DEPTH_LADDERS = 8          # step diversi mantenuti incrementalmente (LRU)
+
+SIGNAL_BOOK_LEVELS = 1000      # livelli per lato nel segnale (come /api/orderbook)
+SIGNAL_INTERVAL = "1m"         # timeframe del segnale pubblicato sullo stream
+SIGNAL_SAMPLE_SECONDS = 5      # campionamento di fasi e intensita' (come il refresh OB)
+TRACKER_SAVE_SECONDS = 60      # salvataggio su disco dello storico del segnale e del cubo footprint
+
+HTTP = {'session': None}
+
+
+def get_interval_ms(interval):
+    intervals = {"1m": 60000, "5m": 300000, "15m": 900000, "30m": 1800000, "1h": 3600000, "1d": 86400000}
+    return intervals.get(interval, 60000)
+
+def round_price(price, step):
+    return round(price / step) * step
+
+def get_session():
+    """Client HTTP condiviso da tutte le richieste"""
+    if HTTP['session'] is None or HTTP['session'].closed:
+        HTTP['session'] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=50))
+    return HTTP['session']
+
+async def close_session():
+    if HTTP['session'] is not None:
+        await HTTP['session'].close()
+        HTTP['session'] = None
+
+async def fetch_with_retry(url, params, max_retries=3, timeout=15):
+    session = get_session()
+    for attempt in range(max_retries):
+        try:
+            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                r.raise_for_status()
+                return await r.json()
+        except asyncio.TimeoutError:
+            if attempt < max_retries - 1:
+                await asyncio.sleep(1)
+        except Exception as e:
+            if attempt < max_retries - 1:
+                await asyncio.sleep(1)
+    return None
+
+class TradeView:
+    """
+    Trade grezzi di una candela ordinati per quantita': percentile, min_qty
+    e top_n diventano slice trovate per bisezione, senza riscansionare
+    """
+
+    def __init__(self, trades):
+        self.source = trades
+        self.trades = sorted(trades, key=lambda t: float(t.get('q', 0)))
+        self.qty = [float(t.get('q', 0)) for t in self.trades]
+
+    def matches(self, trades):
+        """Stessi trade della vista (la lista dello stream viene ricreata a ogni richiesta)"""
+        return len(trades) == len(self.source) and (not trades or trades[-1] is self.source[-1])
+
+    def at_least(self, threshold):
+        return self.trades[bisect_left(self.qty, threshold):]
+
+    def filter(self, vol, filter_mode, filter_percentile, filter_min_qty, filter_top_n):
+        """Stessa semantica del filtro sull'ultima candela degli script Flask"""
+        if filter_mode == "min_qty":
+            return self.at_least(vol * (filter_min_qty / 100))
+        if filter_mode == "percentile":
+            if not self.qty:
+                return self.source
+            idx = int(len(self.qty) * (filter_percentile / 100))
+            return self.at_least(self.qty[min(idx, len(self.qty) - 1)])
+        if filter_mode == "top_n":
+            return self.trades[len(self.trades) - filter_top_n:][::-1] if filter_top_n > 0 else []
+        return self.source
+
+
+class SketchView:
+    """
+    Candela aperta alimentata dallo stream: i trade cambiano a ogni messaggio,
+    quindi niente ordinamento per richiesta. La soglia del percentile viene
+    dagli sketch KLL per minuto fusi sulla candela, gli altri filtri sono una
+    scansione lineare (top_n con un heap).
+    """
+
+    def __init__(self, trades, sketch):
+        self.source = trades
+        self.sketch = sketch
+
+    def at_least(self, threshold):
+        return [t for t in self.source if float(t.get('q', 0)) >= threshold]
+
+    def filter(self, vol, filter_mode, filter_percentile, filter_min_qty, filter_top_n):
+        """Stessa semantica di TradeView.filter, soglia del percentile entro rank_error()"""
+        if filter_mode == "min_qty":
+            return self.at_least(vol * (filter_min_qty / 100))
+        if filter_mode == "percentile":
+            if not self.source or not len(self.sketch):
+                return self.source
+            return self.at_least(self.sketch.quantile(filter_percentile / 100))
+        if filter_mode == "top_n":
+            return heapq.nlargest(filter_top_n, self.source, key=lambda t: float(t.get('q', 0))) if filter_top_n > 0 else []
+        return self.source
+
+
+def filtered_footprint(data, k, view, step, filters):
+    """
+    Footprint con l'ultima candela ricostruita dalla vista filtrata dei suoi
+    trade; sweep e CVD restano quelli della candela completa
+    """
+    last = data['bars'][-1]
+    bar = build_bar(k, view.filter(float(k[5]), *filters), step, sweeps=last.get('sweeps'))
+    bar.update({key: last[key] for key in ('cvd', 'divergence') if key in last})
+    bars = data['bars'][:-1] + [bar]
+    return {"bars": bars, "stats": compute_stats(bars), "filtered": True}
+
+def build_bar(k, trades, step, sweeps=None):
+    """
+    Costruisce una barra footprint da una kline e dai suoi trade (in ordine
+    di id: gli sweep si contano sulla sequenza, se non gia' noti)
+    """
+    ts = int(k[0])
+    o, h, l, c = float(k[1]), float(k[2]), float(k[3]), float(k[4])
+    vol = float(k[5])
+
+    open_rounded = round_price(o, step)
+    close_rounded = round_price(c, step)
+    high_rounded = round_price(h, step)
+    low_rounded = round_price(l, step)
+
+    # Aggregazione vettoriale: volume e numero di trade per livello e lato
+    prices, qty, is_bid = trade_arrays(trades)
+    rounded = np.rint(prices / step) * step
+    inside = (rounded >= low_rounded) & (rounded <= high_rounded)
+    keys, inv = np.unique(rounded[inside], return_inverse=True)
+    keys = keys.tolist()
+    bid_in, n = is_bid[inside], len(keys)
+    bid_vol = dict(zip(keys, np.bincount(inv, weights=qty[inside] * bid_in, minlength=n).tolist()))
+    ask_vol = dict(zip(keys, np.bincount(inv, weights=qty[inside] * ~bid_in, minlength=n).tolist()))
+    bid_count = dict(zip(keys, np.bincount(inv, weights=bid_in, minlength=n).astype(int).tolist()))
+    ask_count = dict(zip(keys, np.bincount(inv, weights=~bid_in, minlength=n).astype(int).tolist()))
+
+    active_prices = set()
+    min_body = min(open_rounded, close_rounded)
+    max_body = max(open_rounded, close_rounded)
+    current_price = min_body
+    while current_price <= max_body:
+        active_prices.add(current_price)
+        current_price += step
+
+    active_prices.update(bid_vol.keys())
+    active_prices.update(ask_vol.keys())
+
+    sorted_prices = sorted(active_prices, reverse=True)
+
+    levels_data = []
+    bar_total_bid = sum(bid_vol.values())
+    bar_total_ask = sum(ask_vol.values())
+
+    for price_level in sorted_prices:
+        bid = bid_vol.get(price_level, 0)
+        ask = ask_vol.get(price_level, 0)
+
+        is_in_body = close_rounded <= price_level <= open_rounded if open_rounded >= close_rounded else open_rounded <= price_level <= close_rounded
+
+        levels_data.append({
+            "price": price_level,
+            "bid": round(bid, 2),
+            "ask": round(ask, 2),
+            "bid_trades": bid_count.get(price_level, 0),
+            "ask_trades": ask_count.get(price_level, 0),
+            "significant": (bid + ask) > max((bar_total_bid + bar_total_ask) * 0.12, 0.1),
+            "in_body": is_in_body
+        })
+
+    return {
+        "timestamp": ts,
+        "time": datetime.fromtimestamp(ts/1000).strftime("%H:%M"),
+        "open": round(o, 2),
+        "high": round(h, 2),
+        "low": round(l, 2),
+        "close": round(c, 2),
+        "open_rounded": open_rounded,
+        "close_rounded": close_rounded,
+        "volume": round(vol, 2),
+        "levels": levels_data,
+        "imbalance_zones": annotate_imbalances(levels_data, step),
+        "bullish": c > o,
+        "delta": round(bar_total_ask - bar_total_bid, 2),
+        "footprint": bool(trades),
+        "kline_delta": kline_delta(k),
+        "sweeps": sweeps if sweeps is not None else sweep_counts(trades),
+        "size_histogram": size_histogram(qty[inside], bid_in) if inside.any() else None
+    }
+
+def bar_footprint(bar, step):
+    """Footprint di una barra del BarBuilder, marcata se costruita da trade incompleti"""
+    built = build_bar(bar['kline'], bar['trades'], step)
+    if bar.get('truncated'):
+        built['truncated'] = True
+    return built
+
+def trade_arrays(trades):
+    """(prezzi, quantita', lato bid) dei trade come array numpy; i trade malformati vengono saltati"""
+    rows = []
+    for t in trades:
+        try:
+            rows.append((float(t.get('p', 0)), float(t.get('q', 0)), bool(t.get('m'))))
+        except (ValueError, TypeError):
+            continue
+    if not rows:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=bool)
+    prices, qty, is_bid = zip(*rows)
+    return np.array(prices), np.array(qty), np.array(is_bid, dtype=bool)
+
+def kline_delta(k):
+    """Delta approssimato dalla sola kline: taker buy (indice 9) meno il resto del volume"""
+    if len(k) <= 9:
+        return None
+    return round(2 * float(k[9]) - float(k[5]), 2)
+
+def kline_delta_footprint(data):
+    """
+    Delta su tutte le barre: dai trade dove c'e' il footprint, altrimenti
+    dalla kline, con delta cumulato e volumi bid/ask approssimati. Le stats
+    restano quelle del footprint (stesso delta usato dal segnale).
+    """
+    bars, cum = [], 0.0
+    for bar in data['bars']:
+        bar = dict(bar)
+        if bar.get('footprint') or bar.get('kline_delta') is None:
+            bar['delta_source'] = 'trades'
+            bar['ask_volume'] = round(sum(l['ask'] for l in bar['levels']), 2)
+            bar['bid_volume'] = round(sum(l['bid'] for l in bar['levels']), 2)
+        else:
+            bar['delta_source'] = 'kline'
+            bar['delta'] = bar['kline_delta']
+            bar['ask_volume'] = round((bar['volume'] + bar['delta']) / 2, 2)
+            bar['bid_volume'] = round((bar['volume'] - bar['delta']) / 2, 2)
+        cum += bar['delta']
+        bar['cum_delta'] = round(cum, 2)
+        bars.append(bar)
+    return {"bars": bars, "stats": dict(data['stats'], cum_delta=round(cum, 2))}
+
+def relevant_orders(klines, ob_data, chart_tf, threshold=MIN_BTC_THRESHOLD):
+    """
+    Ordini rilevanti orderbook - RANGE FISSO ±0.420% (scansione di uno snapshot)
+    """
+    if not klines:
+        return {'error': 'Cannot fetch price data'}
+    if not ob_data or 'bids' not in ob_data or 'asks' not in ob_data:
+        return {'error': 'Cannot fetch orderbook'}
+
+    current_price = float(klines[-1][4])
+    min_price, max_price = price_band(current_price)
+
+    def relevant(side):
+        orders = []
+        for level in side:
+            price = float(level[0])
+            qty = float(level[1])
+            if min_price <= price <= max_price and qty > threshold:
+                orders.append((price, qty))
+        return orders
+
+    return relevant_payload(current_price, klines, chart_tf, relevant(ob_data['bids']), relevant(ob_data['asks']), threshold)
+
+def price_band(current_price):
+    price_range = current_price * (FIXED_RANGE_PCT / 100.0)
+    return current_price - price_range, current_price + price_range
+
+def relevant_payload(current_price, klines, chart_tf, bid_levels, ask_levels, threshold):
+    """Risposta di /api/relevant_orders da livelli (prezzo, qty) gia' filtrati"""
+    price_history = []
+    for k in klines[-50:]:
+        price_history.append({
+            'time': int(k[0]),
+            'price': float(k[4]),
+            'high': float(k[2]),
+            'low': float(k[3])
+        })
+
+    min_price, max_price = price_band(current_price)
+
+    def orders(levels):
+        result = [{'price': p, 'quantity': q, 'total': p * q} for p, q in levels]
+        return sorted(result, key=lambda x: x['quantity'], reverse=True)
+
+    relevant_bids = orders(bid_levels)
+    relevant_asks = orders(ask_levels)
+
+    total_bid_qty = sum(b['quantity'] for b in relevant_bids)
+    total_ask_qty = sum(a['quantity'] for a in relevant_asks)
+    total_bid_value = sum(b['total'] for b in relevant_bids)
+    total_ask_value = sum(a['total'] for a in relevant_asks)
+
+    return {
+        'current_price': current_price,
+        'price_range': {
+            'min': min_price,
+            'max': max_price,
+            'pct': FIXED_RANGE_PCT,
+            'total_range': max_price - min_price
+        },
+        'price_history': price_history,
+        'chart_timeframe': chart_tf,
+        'bids': relevant_asks,
+        'asks': relevant_bids,
+        'summary': {
+            'total_bid_qty': total_bid_qty,
+            'total_ask_qty': total_ask_qty,
+            'total_bid_value': total_bid_value,
+            'total_ask_value': total_ask_value,
+            'delta': total_bid_qty - total_ask_qty,
+            'min_btc_threshold': threshold
+        }
+    }
+
+def deep_sizeof(obj):
+    """Stima in byte di un oggetto e del suo contenuto (dict/list/tuple)"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_sizeof(v) for v in obj)
+    return size
+
+def compute_stats(bars):
+    return {
+        "price": bars[-1]["close"] if bars else 0,
+        "volume": round(sum(b["volume"] for b in bars), 2),
+        "delta": round(sum(b["delta"] for b in bars), 2),
+        "bars_count": len(bars)
+    }
+
+
+class MarketEngine:
+    """
+    Ingestion e cache di un simbolo: klines, trade per candela, orderbook e
+    footprint calcolati vengono condivisi da tutte le dashboard servite.
+    Ogni chiave viene calcolata una sola volta anche con richieste concorrenti.
+    """
+
+    def __init__(self, symbol=SYMBOL_BINANCE, cache_ttl=CACHE_TTL):
+        self.symbol = symbol
+        self.cache_ttl = cache_ttl
+        self.cache = {'data': OrderedDict(), 'klines': {}, 'backfill': {}, 'orderbook': {}, 'trades': OrderedDict()}
+        self.locks = defaultdict(asyncio.Lock)
+
+        # Stato live alimentato dal MarketFeed (vuoto se lo stream non gira)
+        self.large_orders = {thr: LargeOrderIndex(thr) for thr in LARGE_ORDER_THRESHOLDS.get(symbol, (MIN_BTC_THRESHOLD,))}
+        self.ladders = OrderedDict()   # step -> DepthLadder
+        self.signals = {}              # interval -> ultimo segnale e versione degli input
+        self.last_candles = {}         # interval -> (kline, trade) dell'ultima candela calcolata
+        self.trade_views = OrderedDict()   # (interval, ts) -> TradeView
+        self.bar_builders = OrderedDict()  # (bar_type, size) -> BarBuilder
+        self.bar_footprints = OrderedDict()   # (bar_type, size, step, id barra) -> barra chiusa
+        self.bar_sweeps = OrderedDict()       # (interval, ts, n trade) -> sweep della candela chiusa
+        self.profiles = {}             # (interval, step) -> ProfileIndex sul footprint in cache
+        self.cvd = {}                  # interval -> CVDSeries (barre chiuse con somme prefisse)
+        self.vwaps = {}                # interval -> VWAPSeries (Σpq, Σq, Σp²q prefissi)
+        self.tracker = SignalTracker(symbol)
+        self.sweeps = SweepDetector()
+        self.features = BookFeatures()
+        self.tape = TradeTape(TAPE_THRESHOLDS.get(symbol, (MIN_BTC_THRESHOLD,)))
+        self.cube = FootprintCube(symbol)
+        self.archive = BookArchive(symbol)
+        self.absorption = AbsorptionDetector(ABSORPTION_MIN_VOLUME.get(symbol, MIN_BTC_THRESHOLD))
+        self.book = self._new_book()
+        self.last_price = None
+        self.live_trades = OrderedDict()   # minuto -> trade aggTrade
+        self.live_sketches = {}            # minuto -> KLLSketch delle quantita'
+        self.live_since = None             # primo minuto completo coperto dallo stream
+        self.live_candles = OrderedDict()  # minuto -> kline 1m costruita dai trade
+        self.candles_since = None          # primo minuto completo delle candele locali
+        self.last_trade_id = 0
+        self.sync_task = None
+        self.metrics = {'messages': 0, 'cpu_seconds': 0.0}
+        self.tick_size = TICK_SIZES.get(symbol, 0.01)
+        self.tick_size_checked = False
+        self.tick_size_known = symbol in TICK_SIZES   # da exchangeInfo o dalla tabella, non il fallback 0.01
+        self.stores_started = False
+
+    # ------------------------------------------------------------------
+    # Stream live
+    # ------------------------------------------------------------------
+
+    def _new_book(self):
+        book = OrderBook(self.symbol)
+        for index in self.large_orders.values():
+            book.add_listener(index)
+        for ladder in self.ladders.values():
+            book.add_listener(ladder)
+        book.add_listener(self.absorption)
+        book.add_listener(self.archive)
+        return book
+
+    def on_trade(self, trade):
+        started = time.process_time()
+        trade_id = int(trade['a'])
+        if trade_id > self.last_trade_id:
+            self.last_trade_id = trade_id
+            self.last_price = float(trade['p'])
+            minute = int(trade['T']) // 60000 * 60000
+            if self.live_since is None:
+                self.live_since = minute + 60000
+            bucket = self.live_trades.get(minute)
+            if bucket is None:
+                bucket = self.live_trades[minute] = []
+                self.live_sketches[minute] = KLLSketch()
+                while len(self.live_trades) > LIVE_TRADE_MINUTES:
+                    old_minute, _ = self.live_trades.popitem(last=False)
+                    self.live_sketches.pop(old_minute, None)
+                    self.live_since = max(self.live_since, old_minute + 60000)
+            bucket.append(trade)
+            self.live_sketches[minute].update(float(trade['q']))
+            self._update_candle(minute, trade)
+            self.absorption.on_trade(trade)
+            self.tape.add(trade)
+            self.cube.on_trade(trade)
+            self.sweeps.add(trade)
+        self.metrics['messages'] += 1
+        self.metrics['cpu_seconds'] += time.process_time() - started
+
+    def _update_candle(self, minute, trade):
+        price, qty = float(trade['p']), float(trade['q'])
+        if self.candles_since is None:
+            self.candles_since = minute + 60000
+        candle = self.live_candles.get(minute)
+        if candle is None:
+            candle = self.live_candles[minute] = new_minute_candle(minute, price)
+            while len(self.live_candles) > LIVE_CANDLE_MINUTES:
+                old_minute, _ = self.live_candles.popitem(last=False)
+                self.candles_since = max(self.candles_since, old_minute + 60000)
+        count = int(trade['l']) - int(trade['f']) + 1 if 'l' in trade and 'f' in trade else 1
+        update_minute_candle(candle, price, qty, trade.get('m'), count)
+
+    def on_depth(self, event):
+        started = time.process_time()
+        if self.book.apply_diff(event):
+            self.absorption.on_book(self.book.updated_at)
+            self.sweeps.flush(self.book.updated_at)
+            self.features.update(self.book, self.book.updated_at)
+            self.archive.flush(self.book.updated_at)
+        else:
+            self.archive.mark_gap(int(event.get('E', 0)))
+            if self.sync_task is None:
+                self.sync_task = asyncio.get_running_loop().create_task(self.sync_book())
+        self.metrics['messages'] += 1
+        self.metrics['cpu_seconds'] += time.process_time() - started
+
+    async def sync_book(self):
+        """Snapshot REST per (ri)agganciare il book allo stream depth"""
+        try:
+            while not self.book.synced:
+                await asyncio.sleep(1)   # lascia accumulare qualche evento
+                snapshot = await self.fetch_orderbook()
+                if snapshot.get('bids'):
+                    self.features.reset()
+                    self.book.load_snapshot(snapshot)
+        finally:
+            self.sync_task = None
+
+    def reset_live(self):
+        self.book = self._new_book()
+        self.last_price = None
+        self.live_trades.clear()
+        self.live_sketches.clear()
+        self.live_since = None
+        self.live_candles.clear()
+        self.candles_since = None
+
+    def live_covers(self, start_ms):
+        return self.live_since is not None and start_ms >= self.live_since
+
+    def live_trades_between(self, start_ms, end_ms):
+        trades = []
+        for minute in range(start_ms // 60000 * 60000, end_ms + 1, 60000):
+            trades.extend(t for t in self.live_trades.get(minute, ()) if start_ms <= int(t['T']) <= end_ms)
+        return trades
+
+    def qty_sketch(self, interval, ts, trades):
+        """
+        Sketch delle quantita' di una candela: fusione degli sketch per minuto
+        dello stream, oppure costruito una volta sola sui trade in cache
+        """
+        if self.live_covers(ts):
+            minutes = [m for m in range(ts, ts + get_interval_ms(interval), 60000) if m in self.live_sketches]
+            if len(minutes) == 1:
+                return self.live_sketches[minutes[0]]
+            return KLLSketch.merged(self.live_sketches[m] for m in minutes)
+        entry = self.cache['trades'].get((interval, ts))
+        if entry is None or entry['data'] is not trades:
+            return KLLSketch().extend(float(t.get('q', 0)) for t in trades)
+        if entry.get('sketch') is None:
+            entry['sketch'] = KLLSketch().extend(float(t.get('q', 0)) for t in trades)
+        return entry['sketch']
+
+    def candle_sweeps(self, interval, ts, trades):
+        """
+        Sweep di una candela: calcolati una volta sola quando e' chiusa (la
+        chiave include il numero di trade, un nuovo fetch piu' completo li
+        ricalcola), ad ogni richiesta solo per la candela aperta
+        """
+        if not trades:
+            return sweep_counts(trades)
+        if ts + get_interval_ms(interval) > time.time() * 1000:
+            return sweep_counts(trades)
+        key = (interval, ts, len(trades))
+        counts = self.bar_sweeps.get(key)
+        if counts is None:
+            counts = self.bar_sweeps[key] = sweep_counts(trades)
+            while len(self.bar_sweeps) > MAX_BAR_SWEEPS:
+                self.bar_sweeps.popitem(last=False)
+        self.bar_sweeps.move_to_end(key)
+        return counts
+
+    def stats(self):
+        """Consumo per simbolo: messaggi, CPU nei callback, memoria stimata"""
+        live_count = sum(len(b) for b in self.live_trades.values())
+        cached_count = sum(len(e['data']) for e in self.cache['trades'].values())
+        sample = next((b[0] for b in self.live_trades.values() if b), None)
+        if sample is None:
+            sample = next((e['data'][0] for e in self.cache['trades'].values() if e['data']), None)
+        trade_bytes = deep_sizeof(sample) if sample else 0
+        footprint_bytes = sum(deep_sizeof(e['data']) for e in self.cache['data'].values())
+        book_bytes = self.book.level_count() * 2 * deep_sizeof(0.0) + deep_sizeof(self.book.bids.levels) + deep_sizeof(self.book.asks.levels)
+        return {
+            'symbol': self.symbol,
+            'messages': self.metrics['messages'],
+            'cpu_seconds': round(self.metrics['cpu_seconds'], 3),
+            'book_synced': self.book.synced,
+            'book_levels': self.book.level_count(),
+            'large_orders': {str(thr): len(index) for thr, index in self.large_orders.items()},
+            'depth_ladders': list(self.ladders),
+            'live_trades': live_count,
+            'live_candles': len(self.live_candles),
+            'cached_trade_candles': len(self.cache['trades']),
+            'cached_trades': cached_count,
+            'footprint_keys': len(self.cache['data']),
+            'cube': self.cube.stats(),
+            'book_archive': dict(self.archive.counts, writing=self.archive.writing),
+            'approx_bytes': (live_count + cached_count) * trade_bytes + footprint_bytes + book_bytes,
+        }
+
+    # ------------------------------------------------------------------
+    # Fetch Binance
+    # ------------------------------------------------------------------
+
+    async def fetch_klines(self, interval, limit=150):
+        params = {"symbol": self.symbol, "interval": interval, "limit": limit}
+        result = await fetch_with_retry(f"{BINANCE_API}/klines", params, max_retries=3, timeout=15)
+        return result if result else []
+
+    async def fetch_trades(self, start_ms, end_ms):
+        trades, _, _ = await self.fetch_trade_pages(start_ms, end_ms, 1)
+        return trades
+
+    async def fetch_trade_pages(self, start_ms, end_ms, max_pages):
+        """
+        aggTrades tra start_ms ed end_ms: dopo la prima pagina per tempo si
+        prosegue per fromId finche' si supera end_ms. (trade, troncati,
+        falliti): troncati = trade mancanti nel range (pagine esaurite o una
+        pagina fallita), falliti = una richiesta non e' andata a buon fine
+        """
+        params = {"symbol": self.symbol, "startTime": start_ms, "endTime": end_ms, "limit": AGG_TRADES_LIMIT}
+        trades = []
+        for _ in range(max_pages):
+            page = await fetch_with_retry(f"{BINANCE_API}/aggTrades", params, max_retries=2, timeout=12)
+            if page is None:
+                return trades, True, True
+            trades.extend(t for t in page if int(t['T']) <= end_ms)
+            if len(page) < AGG_TRADES_LIMIT or int(page[-1]['T']) > end_ms:
+                return trades, False, False
+            params = {"symbol": self.symbol, "fromId": int(page[-1]['a']) + 1, "limit": AGG_TRADES_LIMIT}
+        return trades, True, False
+
+    async def fetch_tick_size(self):
+        """tickSize del PRICE_FILTER da exchangeInfo, None se non disponibile"""
+        info = await fetch_with_retry(f"{BINANCE_API}/exchangeInfo", {"symbol": self.symbol}, max_retries=2, timeout=10)
+        try:
+            filters = info['symbols'][0]['filters']
+            return float(next(f['tickSize'] for f in filters if f['filterType'] == 'PRICE_FILTER'))
+        except (TypeError, KeyError, IndexError, StopIteration, ValueError):
+            return None
+
+    async def fetch_orderbook(self):
+        params = {"symbol": self.symbol, "limit": 1000}
+        result = await fetch_with_retry(f"{BINANCE_API}/depth", params, max_retries=2, timeout=10)
+        return result if result else {"bids": [], "asks": []}
+
+    # ------------------------------------------------------------------
+    # Cache condivisa
+    # ------------------------------------------------------------------
+
+    def local_klines(self, interval):
+        """
+        Klines costruite dallo stream dal primo periodo completo coperto, None
+        se non coprono ancora nemmeno la candela corrente
+        """
+        if self.candles_since is None:
+            return None
+        interval_ms = get_interval_ms(interval)
+        first = -(-self.candles_since // interval_ms) * interval_ms
+        current = int(time.time() * 1000) // interval_ms * interval_ms
+        if current < first:
+            return None
+        return first, aggregate_klines(self.live_candles, first, current, interval_ms)
+
+    async def get_klines(self, interval, limit=150, max_age=KLINES_TTL):
+        """
+        OHLCV dalle candele costruite dagli stessi trade del footprint; il REST
+        serve solo per lo storico precedente allo stream (backfill)
+        """
+        local = self.local_klines(interval)
+        if local is None:
+            return await self.rest_klines(interval, limit, max_age)
+        first, klines = local
+        if len(klines) >= limit:
+            return klines[-limit:]
+        backfill = self.cache['backfill'].get((interval, limit))
+        if backfill is None or backfill['fetched_at'] < first:
+            # Valido solo se scaricato a candela `first` gia' aperta: tutto cio' che precede e' chiuso
+            history = await self.rest_klines(interval, limit, max_age=0)
+            backfill = self.cache['backfill'][(interval, limit)] = {'data': history, 'fetched_at': int(time.time() * 1000)}
+        history = [k for k in backfill['data'] if int(k[0]) < first]
+        return (history + klines)[-limit:]
+
+    async def rest_klines(self, interval, limit=150, max_age=KLINES_TTL):
+        key = f"{interval}_{limit}"
+        async with self.locks[f"klines_{key}"]:
+            entry = self.cache['klines'].get(key)
+            if entry and time.time() - entry['timestamp'] < max_age:
+                return entry['data']
+            klines = await self.fetch_klines(interval, limit)
+            if klines:
+                self.cache['klines'][key] = {'data': klines, 'timestamp': time.time()}
+            return klines
+
+    async def get_trades(self, interval, ts, max_pages=1):
+        """
+        Trade di una candela: dallo stream se coperta, altrimenti REST (definitivi
+        se chiusa) con al massimo max_pages pagine; trades_truncated() dice se
+        la candela ne aveva di piu'
+        """
+        interval_ms = get_interval_ms(interval)
+        if self.live_covers(ts):
+            return self.live_trades_between(ts, ts + interval_ms - 1)
+
+        key = (interval, ts)
+        trades_cache = self.cache['trades']
+        async with self.locks[key]:
+            entry = trades_cache.get(key)
+            if entry and (entry['closed'] or time.time() - entry['timestamp'] < OPEN_TRADES_TTL) \
+                    and not (entry['truncated'] and entry['pages'] < max_pages):
+                trades_cache.move_to_end(key)
+                return entry['data']
+            trades, truncated, failed = await self.fetch_trade_pages(ts, ts + interval_ms - 1, max_pages)
+            self.tape.extend(trades)
+            self.cube.extend(trades)
+            # Definitivi solo se chiusa e con tutte le pagine ricevute: un fetch fallito si ripete
+            closed = ts + interval_ms <= time.time() * 1000 and bool(trades) and not failed
+            trades_cache[key] = {'data': trades, 'timestamp': time.time(), 'closed': closed,
+                                 'truncated': truncated, 'failed': failed, 'pages': max_pages}
+            trades_cache.move_to_end(key)
+            while len(trades_cache) > MAX_TRADE_CANDLES:
+                old_key, _ = trades_cache.popitem(last=False)
+                self.locks.pop(old_key, None)
+            return trades
+
+    def trades_truncated(self, interval, ts):
+        entry = self.cache['trades'].get((interval, ts))
+        return bool(entry and entry['truncated'])
+
+    def trades_failed(self, interval, ts):
+        entry = self.cache['trades'].get((interval, ts))
+        return bool(entry and entry['failed'])
+
+    async def get_orderbook(self):
+        if self.book.synced:
+            return self.book.snapshot(1000)
+        async with self.locks['orderbook']:
+            if time.time() - self.cache['orderbook'].get('timestamp', 0) < ORDERBOOK_TTL:
+                return self.cache['orderbook']['data']
+            ob_data = await self.fetch_orderbook()
+            self.cache['orderbook'] = {'data': ob_data, 'timestamp': time.time()}
+            self.archive.record_snapshot(ob_data, int(time.time() * 1000))
+        return ob_data
+
+    async def get_relevant_orders(self, chart_tf='15m'):
+        threshold = min(self.large_orders)
+        if not (self.book.synced and self.last_price is not None):
+            klines, ob_data = await asyncio.gather(self.get_klines(chart_tf, limit=150), self.get_orderbook())
+            return relevant_orders(klines, ob_data, chart_tf, threshold)
+
+        # Book e prezzo dallo stream: nessuna chiamata upstream se le klines
+        # dello storico sono in cache, bande e soglia interrogate sull'indice
+        klines = await self.get_klines(chart_tf, limit=150, max_age=RELEVANT_KLINES_TTL)
+        if not klines:
+            return {'error': 'Cannot fetch price data'}
+        current_price = self.last_price
+        last = klines[-1]
+        klines = klines[:-1] + [[last[0], last[1], max(float(last[2]), current_price), min(float(last[3]), current_price), current_price] + list(last[5:])]
+
+        index = self.large_orders[threshold]
+        min_price, max_price = price_band(current_price)
+        return relevant_payload(current_price, klines, chart_tf,
+                                index.in_range(True, min_price, max_price),
+                                index.in_range(False, min_price, max_price), threshold)
+
+    async def get_depth_ladder(self, step, range_pct=DEPTH_LADDER_RANGE_PCT):
+        """Book aggregato per step con max e profondita' cumulata, pronto da disegnare"""
+        step = float(step)
+        if self.book.synced:
+            ladder = self.ladders.get(step)
+            if ladder is None:
+                ladder = self.ladders[step] = self.book.add_listener(DepthLadder(step))
+                while len(self.ladders) > MAX_DEPTH_LADDERS:
+                    _, old = self.ladders.popitem(last=False)
+                    self.book.remove_listener(old)
+            self.ladders.move_to_end(step)
+            mid = self.book.mid_price()
+        else:
+            # Senza stream: aggregazione una tantum dello snapshot REST
+            book = OrderBook(self.symbol)
+            book.load_snapshot(await self.get_orderbook())
+            ladder = book.add_listener(DepthLadder(step))
+            mid = book.mid_price()
+        if mid is None:
+            return {'step': step, 'max_vol': 0.0, 'levels': []}
+        span = mid * range_pct / 100.0
+        return dict(ladder.window(mid - span, mid + span), mid=mid)
+
+    async def get_signal(self, interval=SIGNAL_INTERVAL, step=10.0):
+        """
+        Segnale di trading su book e footprint correnti, ricalcolato solo se
+        il book o le candele sono cambiati dall'ultima richiesta
+        """
+        data = await self.get_footprint(interval, float(step), update_last_only=True)
+        if self.book.synced:
+            ob_data, book_version = None, self.book.last_update_id
+        else:
+            ob_data = await self.get_orderbook()
+            book_version = self.cache['orderbook'].get('timestamp')
+        bars, stats = data['bars'], data['stats']
+        last = bars[-1] if bars else {}
+        version = (book_version, len(bars), last.get('timestamp'), last.get('volume'), stats.get('price'), stats.get('delta'))
+
+        entry = self.signals.get(interval)
+        if entry and entry['version'] == version:
+            return entry['data']
+        if ob_data is None:
+            ob_data = self.book.snapshot(SIGNAL_BOOK_LEVELS)
+        signal = dict(trading_signal(ob_data, bars, stats), interval=interval, price=stats.get('price', 0),
+                      timestamp=int(time.time() * 1000))
+        if self.book.synced and self.features.latest is not None:
+            signal['bookFeatures'] = self.features.latest
+        self.signals[interval] = {'version': version, 'data': signal}
+        return signal
+
+    async def track_signal(self):
+        """Un campione del segnale nello storico di fasi e intensita'"""
+        signal = await self.get_signal()
+        if signal['price']:
+            self.tracker.add_sample(signal['timestamp'], signal['signal'], signal['strength'])
+
+    def get_signal_history(self, start=None, end=None):
+        """Storico intensita' nel range (ms), fasi e distribuzione pesata"""
+        return self.tracker.history(int(start) if start else None, int(end) if end else None)
+
+    async def get_qty_threshold(self, interval='1m', percentile=75, candles=1):
+        """Soglia di quantita' al percentile sulle ultime `candles` candele (sketch fusi)"""
+        klines = await self.get_klines(interval, limit=150)
+        window = [int(k[0]) for k in klines[-max(1, int(candles)):]]
+        results = await asyncio.gather(*[self.get_trades(interval, ts) for ts in window])
+        sketch = KLLSketch.merged(self.qty_sketch(interval, ts, trades) for ts, trades in zip(window, results))
+        return {'interval': interval, 'percentile': float(percentile), 'candles': len(window),
+                'trades': len(sketch), 'threshold': sketch.quantile(float(percentile) / 100)}
+
+    def get_absorption(self, after=0, limit=50):
+        """Eventi di assorbimento e ricarica (iceberg) con seq > after"""
+        return dict(self.absorption.recent(int(after), int(limit)), symbol=self.symbol, synced=self.book.synced)
+
+    def get_book_features(self, start=None, end=None, every=1):
+        """Serie di imbalance per profondita', microprice e OFI a ogni evento depth"""
+        if not self.book.synced:
+            return {'error': 'Book locale non sincronizzato'}
+        series = self.features.series(int(start) if start else None, int(end) if end else None, every)
+        return dict(series, symbol=self.symbol, latest=self.features.latest)
+
+    def get_book_at(self, time_ms, limit=100):
+        """Book ricostruito dall'archivio all'istante time_ms (keyframe + diff)"""
+        return self.archive.book_at(int(time_ms), max(1, int(limit)))
+
+    def get_sweeps(self, after=0, limit=50):
+        """Sweep rilevati dallo stream con seq > after"""
+        return dict(self.sweeps.recent(int(after), int(limit)), symbol=self.symbol)
+
+    def get_tape(self, start=None, end=None, min_size=None, limit=500):
+        """Grandi trade (stream e REST gia' ricevuti) per range temporale e size minima"""
+        rows = self.tape.query(int(start) if start else None, int(end) if end else None, min_size, int(limit))
+        return {'symbol': self.symbol, 'thresholds': self.tape.thresholds, 'seq': self.tape.seq,
+                'trades': [row_dict(r) for r in rows]}
+
+    def get_tape_updates(self, after=0, limit=50):
+        """Ultimi grandi trade inseriti (stream): seq crescente per il client"""
+        return {'symbol': self.symbol, 'seq': self.tape.seq, 'trades': self.tape.since(int(after), int(limit))}
+
+    async def get_large_orders(self, threshold=None, min_price=None, max_price=None, top=50):
+        """Grandi ordini a riposo: range per prezzo e/o top-K per size dall'indice"""
+        if not self.book.synced:
+            return {'error': 'Book locale non sincronizzato'}
+        if threshold is None:
+            threshold = min(self.large_orders)
+        index = self.large_orders.get(float(threshold))
+        if index is None:
+            return {'error': f"Soglia non indicizzata: {threshold}", 'thresholds': sorted(self.large_orders)}
+
+        result = {'threshold': index.threshold, 'mid_price': self.book.mid_price()}
+        for name, is_bid in (('bids', True), ('asks', False)):
+            if min_price is not None or max_price is not None:
+                lo = float(min_price) if min_price is not None else float('-inf')
+                hi = float(max_price) if max_price is not None else float('inf')
+                levels = sorted(index.in_range(is_bid, lo, hi), key=lambda x: x[1], reverse=True)[:top]
+            else:
+                levels = index.top(is_bid, top)
+            result[name] = [{'price': p, 'quantity': q} for p, q in levels]
+        return result
+
+    # ------------------------------------------------------------------
+    # Footprint
+    # ------------------------------------------------------------------
+
+    async def process_data(self, interval, step, update_last_only=False, filter_mode='none', filter_percentile=75, filter_min_qty=0.5, filter_top_n=300):
+        klines = await self.get_klines(interval, limit=150)
+        if not klines:
+            return {"bars": [], "stats": {"error": "Timeout API"}}
+
+        first_fp = len(klines) - 1 if update_last_only else len(klines) - FOOTPRINT_BARS
+        fp_klines = klines[max(first_fp, 0):]
+        results = await asyncio.gather(*[self.get_trades(interval, int(k[0])) for k in fp_klines])
+        trades_by_ts = {int(k[0]): trades for k, trades in zip(fp_klines, results)}
+
+        bars = []
+        for k in klines:
+            trades = trades_by_ts.get(int(k[0]), [])
+            bars.append(build_bar(k, trades, step, sweeps=self.candle_sweeps(interval, int(k[0]), trades)))
+        self.cvd_series(interval, klines).annotate(bars)
+        self.vwap_series(interval, klines).annotate(bars)
+        data = {"bars": bars, "stats": compute_stats(bars)}
+        last = klines[-1]
+        self.last_candles[interval] = (last, trades_by_ts.get(int(last[0]), []))
+        # Filtro applicato SOLO all'ultima candela
+        return await self.apply_filters(data, interval, step, filter_mode, filter_percentile, filter_min_qty, filter_top_n)
+
+    def cvd_series(self, interval, klines):
+        series = self.cvd.get(interval)
+        if series is None:
+            series = self.cvd[interval] = CVDSeries(get_interval_ms(interval))
+        return series.sync(klines)
+
+    async def get_cvd(self, interval='1m', start=None, end=None, session=False, bars=True):
+        """
+        CVD e volume cumulato su una finestra (ms) o dalla sessione (giorno UTC),
+        con la serie per barra e le divergenze fissate alla chiusura
+        """
+        limit = 150
+        if session:
+            start = int(time.time() * 1000) // 86400000 * 86400000
+            if (time.time() * 1000 - start) // get_interval_ms(interval) + 1 > limit:
+                limit = MAX_KLINES   # storico della sessione intera (una chiave di backfill fissa)
+        series = self.cvd_series(interval, await self.get_klines(interval, limit=limit))
+        # partial: la serie inizia dopo l'inizio richiesto (es. 1m oltre le 1000 klines REST)
+        partial = start is not None and (not series.timestamps or series.timestamps[0] > int(start))
+        return dict(series.window(start, end, bars), interval=interval, session=bool(session), partial=partial)
+
+    def vwap_series(self, interval, klines):
+        series = self.vwaps.get(interval)
+        if series is None:
+            series = self.vwaps[interval] = VWAPSeries(get_interval_ms(interval))
+        return series.sync(klines)
+
+    async def get_vwap(self, interval='1m', mode='session', anchor=None, rolling=VWAP_ROLLING_BARS, start=None, end=None):
+        """VWAP di sessione, ancorato o mobile con bande σ per barra; l'ultimo punto e' la barra aperta"""
+        if mode not in ('session', 'anchored', 'rolling'):
+            return {'error': f"Modalita' VWAP non supportata: {mode}"}
+        series = self.vwap_series(interval, await self.get_klines(interval, limit=150))
+        points = series.series(mode, anchor, int(rolling), start, end)
+        return {'symbol': self.symbol, 'interval': interval, 'mode': mode, 'anchor': anchor,
+                'rolling': int(rolling), 'points': points, 'live': points[-1] if points and points[-1]['open'] else None}
+
+    async def get_vwap_live(self, interval=SIGNAL_INTERVAL):
+        """VWAP di sessione e mobile della barra aperta (stream)"""
+        series = self.vwap_series(interval, await self.get_klines(interval, limit=150))
+        live = series.series('session', start=series.open_bar[0]) if series.open_bar else []
+        rolling = series.series('rolling', start=series.open_bar[0]) if series.open_bar else []
+        return {'symbol': self.symbol, 'interval': interval, 'session': live[-1] if live else None,
+                'rolling': rolling[-1] if rolling else None}
+
+    async def get_size_histogram(self, interval='1m', step=10.0, bars=1):
+        """Istogramma delle size fuso sulle ultime `bars` barre con footprint"""
+        data = await self._footprint(interval, float(step), True)
+        window = [b for b in data['bars'] if b.get('size_histogram')][-max(1, int(bars)):]
+        return {'symbol': self.symbol, 'interval': interval, 'bars': len(window), 'edges': size_edges(),
+                'start': window[0]['timestamp'] if window else None,
+                'histogram': merge_histograms(b['size_histogram'] for b in window)}
+
+    def get_cube(self, interval='1h', step=10.0, start=None, end=None, bars=24):
+        """
+        Footprint dal cubo persistente per qualsiasi timeframe e step (1h, 1d
+        o interval='range' per un solo profilo su piu' giorni), senza trade REST
+        """
+        if interval != 'range' and interval not in ('1m', '5m', '15m', '30m', '1h', '1d'):
+            return {'error': f"Intervallo non valido: {interval}"}
+        interval_ms = None if interval == 'range' else get_interval_ms(interval)
+        end = int(end) if end else int(time.time() * 1000)
+        if start:
+            start = int(start)
+        elif interval_ms:
+            start = end - (max(1, int(bars)) - 1) * interval_ms
+        else:
+            start = end // DAY_MS * DAY_MS
+        if start > end:
+            return {'error': 'start successivo a end'}
+        return {'symbol': self.symbol, 'interval': interval, 'step': float(step),
+                'bars': self.cube.query(start, end, interval_ms, float(step))}
+
+    async def get_profile(self, interval='1m', step=10.0, start=None, end=None, last=None, value_area=VALUE_AREA_PCT):
+        """Volume profile (POC, value area, bid/ask) delle barre tra start e end o delle ultime `last`"""
+        step = float(step)
+        data = await self._footprint(interval, step, True)
+        index = self.profiles.get((interval, step))
+        if index is None:
+            index = self.profiles[(interval, step)] = ProfileIndex(step)
+        index.sync(data['bars'])
+        return dict(index.profile(start, end, last, float(value_area)), interval=interval)
+
+    async def get_bars(self, bar_type, bar_size=None, step=10.0):
+        """
+        Footprint di barre a volume, tick o range: il builder e' alimentato
+        solo dai trade nuovi (per candela 1m, dallo stream o dalla cache),
+        le barre chiuse vengono calcolate una volta sola
+        """
+        size = float(bar_size if bar_size is not None else DEFAULT_BAR_SIZES.get(bar_type, 0))
+        step = float(step)
+        key = (bar_type, size)
+        async with self.locks[('bars',) + key]:
+            builder = self.bar_builders.get(key)
+            if builder is None:
+                if not self.tick_size_checked:
+                    await self.check_tick_size()
+                builder = BarBuilder(bar_type, size, self.tick_size)
+                self.bar_builders[key] = builder
+                while len(self.bar_builders) > MAX_BAR_BUILDERS:
+                    self.bar_builders.popitem(last=False)
+            self.bar_builders.move_to_end(key)
+            await self._feed_bars(builder)
+
+        bars = []
+        for bar in builder.closed:
+            bar_key = key + (step, bar['id'])
+            built = self.bar_footprints.get(bar_key)
+            if built is None:
+                built = self.bar_footprints[bar_key] = bar_footprint(bar, step)
+                while len(self.bar_footprints) > MAX_BAR_FOOTPRINTS:
+                    self.bar_footprints.popitem(last=False)
+            bars.append(built)
+        if builder.current is not None:
+            bars.append(bar_footprint(builder.current, step))
+        return {"bars": bars, "stats": compute_stats(bars), "bar_type": bar_type, "bar_size": size}
+
+    async def check_tick_size(self):
+        """Tick reale da exchangeInfo (la tabella TICK_SIZES resta il fallback)"""
+        tick_size = await self.fetch_tick_size()
+        if tick_size:
+            if tick_size != self.tick_size:
+                print(f"[WARN] Tick {self.symbol}: {tick_size:g} da exchangeInfo invece di {self.tick_size:g}")
+            self.tick_size = tick_size
+            self.tick_size_known = True
+        self.tick_size_checked = True
+        return self.tick_size
+
+    async def start_stores(self):
+        """
+        Avvia i dati persistiti in unita' di tick (cubo footprint e archivio
+        del book) solo con un tick certo: exchangeInfo, oppure la tabella se
+        exchangeInfo non risponde. Per un simbolo fuori tabella si riprova al
+        giro successivo.
+        """
+        if self.stores_started:
+            return True
+        if not self.tick_size_checked or not self.tick_size_known:
+            await self.check_tick_size()
+        if not self.tick_size_known:
+            print(f"[WARN] Tick {self.symbol} non verificato: cubo footprint e archivio del book non avviati")
+            return False
+        self.cube.set_tick_size(self.tick_size)
+        self.archive.start(self.tick_size)
+        self.stores_started = True
+        return True
+
+    async def _feed_bars(self, builder):
+        now_minute = int(time.time() * 1000) // 60000 * 60000
+        start = builder.fed_minute
+        if start is None:
+            start = now_minute - (BAR_SOURCE_MINUTES - 1) * 60000
+        minutes = list(range(start, now_minute + 1, 60000))
+        results = await asyncio.gather(*[self.get_trades('1m', m, BAR_BACKFILL_PAGES) for m in minutes])
+        for minute, trades in zip(minutes, results):
+            if not self.live_covers(minute) and self.trades_failed('1m', minute):
+                # Pagina fallita: ci si ferma qui e si riprova al prossimo giro (i trade dei minuti
+                # successivi alzerebbero last_id del builder e quelli mancanti verrebbero scartati)
+                builder.truncated = False
+                builder.fed_minute = minute
+                return
+            # Minuto oltre BAR_BACKFILL_PAGES pagine: le barre che ne ricevono i trade sono incomplete
+            builder.truncated = self.trades_truncated('1m', minute) and not self.live_covers(minute)
+            for trade in trades:
+                builder.add(trade)
+        builder.truncated = False
+        # L'ultimo minuto e' ancora aperto: la prossima volta si riparte da li'
+        builder.fed_minute = now_minute
+
+    def trade_view(self, interval, ts, trades):
+        key = (interval, ts)
+        view = self.trade_views.get(key)
+        if view is None or not view.matches(trades):
+            view = self.trade_views[key] = TradeView(trades)
+            while len(self.trade_views) > MAX_TRADE_VIEWS:
+                self.trade_views.popitem(last=False)
+        self.trade_views.move_to_end(key)
+        return view
+
+    async def apply_filters(self, data, interval, step, filter_mode='none', filter_percentile=75, filter_min_qty=0.5, filter_top_n=300):
+        """
+        Vista filtrata del footprint non filtrato, solo l'ultima candela. Se
+        l'ultima candela calcolata non e' quella del footprint (cache nata
+        prima del cambio di candela) se ne riprendono kline e trade; se non
+        si puo' filtrare il payload resta intero con filtered: false
+        """
+        bars = data['bars']
+        if filter_mode == "none" or not bars:
+            return data
+        ts = bars[-1]['timestamp']
+        candle = self.last_candles.get(interval)
+        if candle is None or int(candle[0][0]) != ts:
+            candle = await self.candle_at(interval, ts)
+        if candle is None or not candle[1]:
+            return dict(data, filtered=False)
+        k, trades = candle
+        if self.live_covers(ts) and ts + get_interval_ms(interval) > time.time() * 1000:
+            view = SketchView(trades, self.qty_sketch(interval, ts, trades))
+        else:
+            view = self.trade_view(interval, ts, trades)
+        return filtered_footprint(data, k, view, step, (filter_mode, filter_percentile, filter_min_qty, filter_top_n))
+
+    async def candle_at(self, interval, ts):
+        """(kline, trade) della candela che inizia a ts, None se fuori dalle klines recenti"""
+        klines = await self.get_klines(interval, limit=150)
+        k = next((k for k in reversed(klines or []) if int(k[0]) == ts), None)
+        if k is None:
+            return None
+        return k, await self.get_trades(interval, ts)
+
+    async def get_footprint(self, interval, step, update_last_only=False, filter_mode='none', filter_percentile=75, filter_min_qty=0.5, filter_top_n=300, delta_mode='trades',
+                            imbalance_ratio=IMBALANCE_RATIO, imbalance_min_volume=IMBALANCE_MIN_VOLUME):
+        """
+        In cache solo il footprint non filtrato per (interval, step): i filtri
+        sono viste sui trade dell'ultima candela, cambiarli non costa fetch.
+        delta_mode='kline': delta anche sulle barre senza trade (dalle klines).
+        Le imbalance di default sono calcolate con la barra; altri parametri
+        le ricalcolano su tutte le ladder.
+        """
+        data = await self._footprint(interval, step, update_last_only)
+        data = await self.apply_filters(data, interval, step, filter_mode, filter_percentile, filter_min_qty, filter_top_n)
+        if (imbalance_ratio, imbalance_min_volume) != (IMBALANCE_RATIO, IMBALANCE_MIN_VOLUME):
+            data = imbalance_footprint(data, step, float(imbalance_ratio), float(imbalance_min_volume))
+        return kline_delta_footprint(data) if delta_mode == 'kline' else data
+
+    async def _footprint(self, interval, step, update_last_only):
+        cache_key = f"{interval}_{step}"
+
+        async with self.locks[cache_key]:
+            entry = self.cache['data'].get(cache_key)
+            if entry and time.time() - entry['timestamp'] < self.cache_ttl:
+                self.cache['data'].move_to_end(cache_key)
+                if update_last_only:
+                    last = await self.process_data(interval, step, True)
+                    if last['bars']:
+                        self._merge_last_bar(entry['data'], last['bars'][-1])
+                return entry['data']
+
+            data = await self.process_data(interval, step, False)
+            if data['bars']:
+                self.cache['data'][cache_key] = {'data': data, 'timestamp': time.time()}
+                self.cache['data'].move_to_end(cache_key)
+                while len(self.cache['data']) > MAX_FOOTPRINT_KEYS:
+                    self.cache['data'].popitem(last=False)
+            return data
+
+    @staticmethod
+    def _merge_last_bar(data, new_bar):
+        """Aggiorna in cache l'ultima candela (o la aggiunge se e' nuova)"""
+        bars = data['bars']
+        if bars and bars[-1]['timestamp'] == new_bar['timestamp']:
+            bars[-1] = new_bar
+        elif not bars or new_bar['timestamp'] > bars[-1]['timestamp']:
+            bars.append(new_bar)
+            del bars[:-150]
+        data['stats'] = compute_stats(bars)
+
+
+SUBSCRIPTION_SECONDS = 3
+EVENT_SECONDS = {'absorption': 0.5, 'tape': 0.5, 'sweep': 0.5}   # eventi incrementali: latenza limitata, inviati solo se nuovi
+ENGINE_METHODS = {'get_footprint', 'get_orderbook', 'get_klines', 'get_relevant_orders', 'get_large_orders', 'get_depth_ladder', 'get_signal', 'get_signal_history', 'get_qty_threshold', 'get_bars', 'get_profile', 'get_cvd', 'get_absorption', 'get_tape', 'get_sweeps', 'get_vwap', 'get_book_features', 'get_size_histogram', 'get_cube', 'get_book_at', 'stats'}
+
+
+class MarketHub:
+    """
+    Un MarketEngine per simbolo configurato, alimentati da un unico MarketFeed.
+    call/subscribe hanno la stessa firma di ShardRouter: il web layer non sa
+    se i simboli vivono in questo processo o in uno shard.
+    """
+
+    def __init__(self, symbols=SYMBOLS):
+        self.engines = {s.upper(): MarketEngine(s.upper()) for s in symbols}
+        self.feed = None
+        self.feed_task = None
+        self.tracking_task = None
+        self.subscriptions = {}
+
+    def symbols(self):
+        return list(self.engines)
+
+    def get(self, symbol):
+        """MarketEngine del simbolo, KeyError se non configurato"""
+        return self.engines[symbol.upper()]
+
+    async def call(self, symbol, method, **kwargs):
+        if method not in ENGINE_METHODS:
+            raise ValueError(f"Metodo non esposto: {method}")
+        result = getattr(self.get(symbol), method)(**kwargs)
+        return await result if asyncio.iscoroutine(result) else result
+
+    async def call_raw(self, symbol, method, **kwargs):
+        """Risultato gia' serializzato in JSON (come arriva da uno shard)"""
+        return json.dumps(await self.call(symbol, method, **kwargs)).encode()
+
+    async def subscribe(self, symbol, event, callback):
+        """callback(payload_json) ogni SUBSCRIPTION_SECONDS finche' non si annulla"""
+        engine = self.get(symbol)
+        sources = {'orderbook': engine.get_orderbook, 'signal': engine.get_signal, 'absorption': engine.get_absorption,
+                   'tape': engine.get_tape_updates, 'sweep': engine.get_sweeps, 'vwap': engine.get_vwap_live}
+        if event not in sources:
+            raise ValueError(f"Evento non supportato: {event}")
+        source = sources[event]
+        seconds = EVENT_SECONDS.get(event, SUBSCRIPTION_SECONDS)
+
+        async def loop():
+            last_seq = None
+            while True:
+                result = source()
+                payload = await result if asyncio.iscoroutine(result) else result
+                if event not in EVENT_SECONDS or payload.get('seq') != last_seq:
+                    last_seq = payload.get('seq')
+                    callback(json.dumps(payload).encode())
+                await asyncio.sleep(seconds)
+
+        task = asyncio.get_running_loop().create_task(loop())
+        self.subscriptions[id(task)] = task
+        return id(task)
+
+    async def unsubscribe(self, token):
+        task = self.subscriptions.pop(token, None)
+        if task is not None:
+            task.cancel()
+
+    def start_feed(self):
+        from footprint_feed import MarketFeed
+        self.feed = MarketFeed(self)
+        self.feed_task = asyncio.get_running_loop().create_task(self.feed.run())
+
+    def start_tracking(self):
+        """Storico del segnale, cubo footprint e archivio del book: solo nel processo che possiede gli engine"""
+        for engine in self.engines.values():
+            engine.tracker.load()
+        self.tracking_task = asyncio.get_running_loop().create_task(self.track_signals())
+
+    async def track_signals(self):
+        last_save = time.time()
+        while True:
+            started = time.time()
+            for engine in self.engines.values():
+                if not engine.stores_started:
+                    await engine.start_stores()
+                try:
+                    await engine.track_signal()
+                except Exception as e:
+                    print(f"[WARN] Segnale {engine.symbol} non campionato: {e}")
+            if started - last_save >= TRACKER_SAVE_SECONDS:
+                await self.save_state()
+                last_save = started
+            await asyncio.sleep(max(0, SIGNAL_SAMPLE_SECONDS - (time.time() - started)))
+
+    async def save_state(self):
+        """Storico del segnale sul loop; le righe del cubo si copiano sul loop e si scrivono in un executor"""
+        loop = asyncio.get_running_loop()
+        for engine in self.engines.values():
+            engine.tracker.save()
+            changes = engine.cube.snapshot()
+            if changes:
+                await loop.run_in_executor(None, engine.cube.write, changes)
+            engine.cube.unload()
+
+    async def stop(self):
+        for task in self.subscriptions.values():
+            task.cancel()
+        self.subscriptions.clear()
+        if self.feed_task is not None:
+            self.feed_task.cancel()
+            await asyncio.gather(self.feed_task, return_exceptions=True)
+        if self.tracking_task is not None:
+            self.tracking_task.cancel()
+            await asyncio.gather(self.tracking_task, return_exceptions=True)
+            await self.save_state()
+            for engine in self.engines.values():
+                engine.archive.close()
+
+    async def stats(self):
+        return {
+            'symbols': [engine.stats() for engine in self.engines.values()],
+            'feed': {'connected': self.feed.connected, 'messages': self.feed.messages} if self.feed else None
+        }
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - FEATURE DI MICROSTRUTTURA DEL BOOK
+Imbalance a piu' profondita', microprice e order flow imbalance (OFI)
+calcolati a ogni aggiornamento depth e tenuti come serie temporali
+"""
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from footprint_tracker import RingBuffer
+
+FEATURE_DEPTHS_PCT = (0.1, 0.5, 1.0)   # imbalance entro lo 0.1%, 0.5% e 1% dal mid
+FEATURE_HISTORY_SIZE = 36000           # campioni per simbolo (1 ora a 100ms)
+
+
+def depth_name(pct):
+    return f"imbalance_{pct:g}"
+
+
+def cumulative_depth(side, lo, hi, from_top):
+    """
+    (prezzi, quantita' cumulata dal miglior prezzo) dei livelli del lato con
+    lo <= prezzo <= hi, come array numpy
+    """
+    prices = side.prices[bisect_left(side.prices, lo):bisect_right(side.prices, hi)]
+    if from_top:
+        prices = prices[::-1]
+    levels = side.levels
+    qty = np.fromiter((levels[p] for p in prices), np.float64, len(prices))
+    return np.asarray(prices, dtype=np.float64), np.cumsum(qty)
+
+
+class BookFeatures:
+    """
+    Una riga per evento depth applicato: mid, spread, microprice, imbalance
+    (bid - ask) / (bid + ask) entro ogni profondita' (somme cumulate lette per
+    searchsorted sulla distanza dal mid) e OFI di Cont-Kukanov-Stoikov sulle
+    variazioni del miglior livello.
+    """
+
+    def __init__(self, depths=FEATURE_DEPTHS_PCT, capacity=FEATURE_HISTORY_SIZE):
+        self.depths = tuple(depths)
+        self.names = [depth_name(d) for d in self.depths]
+        columns = {'timestamps': np.int64, 'mid': np.float64, 'microprice': np.float64, 'spread': np.float32}
+        columns.update({name: np.float32 for name in self.names})
+        columns.update(ofi=np.float32, cum_ofi=np.float64)
+        self.history = RingBuffer(capacity, columns)
+        self.prev = None     # (bid, bid_qty, ask, ask_qty) dell'evento precedente
+        self.cum_ofi = 0.0
+        self.latest = None
+
+    def reset(self):
+        """Dopo un nuovo snapshot l'OFI non e' continuo con l'evento precedente"""
+        self.prev = None
+
+    def update(self, book, timestamp):
+        bid, ask = book.best_bid(), book.best_ask()
+        if bid is None or ask is None:
+            return None
+        bid_qty, ask_qty = book.bids.levels[bid], book.asks.levels[ask]
+        mid = (bid + ask) / 2
+        microprice = (bid * ask_qty + ask * bid_qty) / (bid_qty + ask_qty)
+
+        ofi = 0.0
+        if self.prev is not None:
+            pb, pbq, pa, paq = self.prev
+            ofi = (bid_qty if bid >= pb else 0.0) - (pbq if bid <= pb else 0.0) \
+                - (ask_qty if ask <= pa else 0.0) + (paq if ask >= pa else 0.0)
+        self.prev = (bid, bid_qty, ask, ask_qty)
+        self.cum_ofi += ofi
+
+        span = max(self.depths) / 100 * mid
+        bid_prices, bid_cum = cumulative_depth(book.bids, mid - span, bid, True)
+        ask_prices, ask_cum = cumulative_depth(book.asks, ask, mid + span, False)
+        row = {'timestamps': timestamp, 'mid': mid, 'microprice': microprice, 'spread': ask - bid,
+               'ofi': ofi, 'cum_ofi': self.cum_ofi}
+        bid_dist, ask_dist = mid - bid_prices, ask_prices - mid   # crescenti dal miglior prezzo
+        for pct, name in zip(self.depths, self.names):
+            limit = pct / 100 * mid
+            i, j = np.searchsorted(bid_dist, limit, side='right'), np.searchsorted(ask_dist, limit, side='right')
+            b = bid_cum[i - 1] if i else 0.0
+            a = ask_cum[j - 1] if j else 0.0
+            row[name] = (b - a) / (b + a) if b + a > 0 else 0.0
+        self.history.append(**row)
+        self.latest = {k: (int(v) if k == 'timestamps' else round(float(v), 6)) for k, v in row.items()}
+        return self.latest
+
+    def series(self, start=None, end=None, every=1):
+        """Colonne nel range (ms), un campione ogni `every`; ofi = somma nel range"""
+        rows = self.history.time_range(start, end)
+        n = len(rows['timestamps'])
+        window_ofi = float(rows['cum_ofi'][-1] - rows['cum_ofi'][0] + rows['ofi'][0]) if n else 0.0
+        step = max(1, int(every))
+        return {
+            'depths_pct': list(self.depths), 'samples': n, 'ofi': round(window_ofi, 6),
+            'columns': {name: col[::step].tolist() for name, col in rows.items()},
+        }
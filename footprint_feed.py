@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - FEED WEBSOCKET MULTIPLEXATO
+Una sola connessione combined stream Binance per tutti i simboli configurati
+"""
+
+import asyncio
+import json
+
+import aiohttp
+
+from footprint_engine import get_session
+
+BINANCE_WS = "wss://stream.binance.com:9443/stream"
+DEPTH_STREAM = "depth@100ms"
+RECONNECT_SECONDS = 5
+MAX_STREAMS_PER_CONNECTION = 1024
+
+
+class MarketFeed:
+    """
+    Smista i messaggi del combined stream (aggTrade + depth diff) verso il
+    MarketEngine del simbolo. Si riconnette da solo e risincronizza i book.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.connected = False
+        self.messages = 0
+
+    def streams(self):
+        streams = []
+        for symbol in self.hub.symbols():
+            s = symbol.lower()
+            streams += [f"{s}@aggTrade", f"{s}@{DEPTH_STREAM}"]
+        if len(streams) > MAX_STREAMS_PER_CONNECTION:
+            raise ValueError(f"{len(streams)} stream oltre il limite Binance per connessione")
+        return streams
+
+    def stream_url(self):
+        return f"{BINANCE_WS}?streams={'/'.join(self.streams())}"
+
+    def dispatch(self, message):
+        stream = message.get('stream', '')
+        data = message.get('data')
+        symbol, _, kind = stream.partition('@')
+        engine = self.hub.engines.get(symbol.upper())
+        if engine is None or data is None:
+            return
+        self.messages += 1
+        if kind == 'aggTrade':
+            engine.on_trade(data)
+        elif kind.startswith('depth'):
+            engine.on_depth(data)
+
+    async def run(self):
+        while True:
+            try:
+                async with get_session().ws_connect(self.stream_url(), heartbeat=30) as ws:
+                    self.connected = True
+                    print(f"[INFO] Stream collegato: {len(self.hub.symbols())} simboli")
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self.dispatch(json.loads(msg.data))
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WARN] Stream interrotto: {e}")
+            finally:
+                self.connected = False
+                # Dopo una disconnessione book e trade live non sono piu' continui
+                for engine in self.hub.engines.values():
+                    engine.reset_live()
+            await asyncio.sleep(RECONNECT_SECONDS)
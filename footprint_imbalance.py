@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - IMBALANCE DIAGONALI E STACKED
+Confronto diagonale ask/bid sulla ladder di ogni barra come rapporto tra
+array traslati di un livello, con zone di imbalance consecutive (stacked)
+"""
+
+import numpy as np
+
+IMBALANCE_RATIO = 3.0          # ask >= 3x il bid del livello sotto (e viceversa)
+IMBALANCE_MIN_VOLUME = 0.5     # volume minimo del lato dominante (BTC)
+STACKED_LEVELS = 3             # imbalance consecutive per formare una zona
+
+
+def ladder_grid(levels, step):
+    """
+    Ladder (prezzi decrescenti, anche con buchi) su griglia densa dall'alto:
+    riga i = prezzo top - i * step. Ritorna (top, indici dei livelli, bid, ask)
+    """
+    prices = np.fromiter((l['price'] for l in levels), np.float64, len(levels))
+    top = prices.max()
+    rows = np.rint((top - prices) / step).astype(np.int64)
+    bid = np.zeros(rows.max() + 1)
+    ask = np.zeros(rows.max() + 1)
+    np.add.at(bid, rows, np.fromiter((l['bid'] for l in levels), np.float64, len(levels)))
+    np.add.at(ask, rows, np.fromiter((l['ask'] for l in levels), np.float64, len(levels)))
+    return top, rows, bid, ask
+
+
+def diagonal_imbalances(bid, ask, ratio=IMBALANCE_RATIO, min_volume=IMBALANCE_MIN_VOLUME):
+    """
+    Righe dall'alto. Buy: ask[i] >= ratio * bid[i+1] (bid del livello sotto).
+    Sell: bid[i] >= ratio * ask[i-1] (ask del livello sopra). Oltre i bordi
+    della barra il lato opposto vale 0.
+    """
+    bid_below = np.append(bid[1:], 0.0)
+    ask_above = np.insert(ask[:-1], 0, 0.0)
+    buy = (ask >= min_volume) & (ask >= ratio * bid_below)
+    sell = (bid >= min_volume) & (bid >= ratio * ask_above)
+    return buy, sell
+
+
+def stacked_runs(flags, min_levels=STACKED_LEVELS):
+    """(inizio, fine esclusa) delle sequenze di almeno min_levels True consecutivi"""
+    edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    keep = ends - starts >= min_levels
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
+
+
+def annotate_imbalances(levels, step, ratio=IMBALANCE_RATIO, min_volume=IMBALANCE_MIN_VOLUME, min_stacked=STACKED_LEVELS):
+    """
+    Aggiunge buy_imbalance / sell_imbalance / stacked ai livelli (in place)
+    e ritorna le zone stacked: side, high, low, levels
+    """
+    if not levels:
+        return []
+    top, rows, bid, ask = ladder_grid(levels, step)
+    buy, sell = diagonal_imbalances(bid, ask, ratio, min_volume)
+    stacked = np.zeros(len(bid), dtype=bool)
+    zones = []
+    for side, flags in (('buy', buy), ('sell', sell)):
+        for start, end in stacked_runs(flags, min_stacked):
+            stacked[start:end] = True
+            zones.append({'side': side, 'high': round(float(top - start * step), 8),
+                          'low': round(float(top - (end - 1) * step), 8), 'levels': end - start})
+    for level, row in zip(levels, rows.tolist()):
+        level['buy_imbalance'] = bool(buy[row])
+        level['sell_imbalance'] = bool(sell[row])
+        level['stacked'] = bool(stacked[row])
+    return sorted(zones, key=lambda z: z['high'], reverse=True)
+
+
+def imbalance_footprint(data, step, ratio, min_volume):
+    """Footprint con imbalance ricalcolate per ratio/volume minimo non di default"""
+    bars = []
+    for bar in data['bars']:
+        levels = [dict(l) for l in bar['levels']]
+        zones = annotate_imbalances(levels, step, ratio, min_volume)
+        bars.append(dict(bar, levels=levels, imbalance_zones=zones))
+    return dict(data, bars=bars)
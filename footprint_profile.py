@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - VOLUME PROFILE SU RANGE DI BARRE
+Ladder bid/ask delle barre su una griglia di prezzo comune con somme
+prefisse lungo le barre: il profilo di qualsiasi range costa O(livelli)
+"""
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+VALUE_AREA_PCT = 70.0
+
+
+class ProfileIndex:
+    """
+    bid[i] / ask[i] = volume per livello delle prime i barre. Il profilo
+    delle barre [a, b) e' bid[b] - bid[a]. Se cambia solo l'ultima barra
+    (candela aperta) si ricalcola una riga; altrimenti si ricostruisce.
+    """
+
+    def __init__(self, step):
+        self.step = float(step)
+        self.timestamps = []
+        self.base = 0.0
+        self.bid = np.zeros((1, 0))
+        self.ask = np.zeros((1, 0))
+        self.last = None
+
+    def _column(self, price):
+        return int(round((price - self.base) / self.step))
+
+    def _row(self, bar):
+        bid, ask = np.zeros(self.bid.shape[1]), np.zeros(self.ask.shape[1])
+        for level in bar['levels']:
+            j = self._column(level['price'])
+            bid[j] += level['bid']
+            ask[j] += level['ask']
+        return bid, ask
+
+    def _fits(self, bar):
+        width = self.bid.shape[1]
+        return all(0 <= self._column(l['price']) < width for l in bar['levels'])
+
+    def build(self, bars):
+        self.timestamps = [b['timestamp'] for b in bars]
+        prices = [l['price'] for b in bars for l in b['levels']]
+        self.base = min(prices) if prices else 0.0
+        width = self._column(max(prices)) + 1 if prices else 0
+        self.bid = np.zeros((len(bars) + 1, width))
+        self.ask = np.zeros((len(bars) + 1, width))
+        for i, bar in enumerate(bars):
+            self.bid[i + 1], self.ask[i + 1] = self._row(bar)
+        np.cumsum(self.bid, axis=0, out=self.bid)
+        np.cumsum(self.ask, axis=0, out=self.ask)
+        self.last = bars[-1] if bars else None
+
+    def sync(self, bars):
+        """Allinea l'indice alle barre del footprint in cache"""
+        timestamps = [b['timestamp'] for b in bars]
+        if not bars or timestamps != self.timestamps or not self._fits(bars[-1]):
+            self.build(bars)
+        elif bars[-1] is not self.last:
+            n = len(bars)
+            bid, ask = self._row(bars[-1])
+            self.bid[n] = self.bid[n - 1] + bid
+            self.ask[n] = self.ask[n - 1] + ask
+            self.last = bars[-1]
+        return self
+
+    def bar_range(self, start=None, end=None, last=None):
+        """Indici [a, b) delle barre con timestamp tra start e end, oppure le ultime `last`"""
+        n = len(self.timestamps)
+        if last is not None:
+            return max(0, n - int(last)), n
+        a = 0 if start is None else bisect_left(self.timestamps, int(start))
+        b = n if end is None else bisect_right(self.timestamps, int(end))
+        return a, max(a, b)
+
+    def profile(self, start=None, end=None, last=None, value_area_pct=VALUE_AREA_PCT):
+        a, b = self.bar_range(start, end, last)
+        bid = self.bid[b] - self.bid[a]
+        ask = self.ask[b] - self.ask[a]
+        total = bid + ask
+        result = {
+            'step': self.step, 'bars': b - a,
+            'start': self.timestamps[a] if b > a else None, 'end': self.timestamps[b - 1] if b > a else None,
+            'volume': round(float(total.sum()), 2), 'bid': round(float(bid.sum()), 2), 'ask': round(float(ask.sum()), 2),
+            'poc': None, 'vah': None, 'val': None, 'levels': [],
+        }
+        result['delta'] = round(result['ask'] - result['bid'], 2)
+        if total.size == 0 or total.max() <= 0:
+            return result
+
+        prices = np.round(self.base + np.arange(total.size) * self.step, 8)
+        lo, hi = value_area(total, value_area_pct / 100)
+        poc = int(np.argmax(total))
+        result.update(poc=float(prices[poc]), val=float(prices[lo]), vah=float(prices[hi]))
+        nonzero = np.nonzero(total > 1e-9)[0][::-1]
+        result['levels'] = [
+            {'price': float(prices[j]), 'bid': round(float(bid[j]), 2), 'ask': round(float(ask[j]), 2),
+             'total': round(float(total[j]), 2), 'in_value_area': bool(lo <= j <= hi)}
+            for j in nonzero
+        ]
+        return result
+
+
+def value_area(total, fraction):
+    """
+    Value area classica: dal POC si allarga verso il livello adiacente con
+    piu' volume finche' non si copre `fraction` del volume totale
+    """
+    poc = int(np.argmax(total))
+    target = float(total.sum()) * fraction
+    lo = hi = poc
+    covered = float(total[poc])
+    while covered < target and (lo > 0 or hi < len(total) - 1):
+        up = total[hi + 1] if hi + 1 < len(total) else -1.0
+        down = total[lo - 1] if lo > 0 else -1.0
+        if up >= down:
+            hi += 1
+            covered += up
+        else:
+            lo -= 1
+            covered += down
+    return lo, hi
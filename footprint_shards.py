@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - SHARDING DEI SIMBOLI SU PIU' PROCESSI
+Ogni shard possiede i MarketEngine dei suoi simboli (e il suo stream websocket);
+il web layer instrada richieste e sottoscrizioni allo shard proprietario via
+socket unix locale.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import struct
+import tempfile
+
+from footprint_engine import ENGINE_METHODS, MarketHub, close_session
+
+# Frame: lunghezza payload, id richiesta, tipo
+FRAME = struct.Struct("<IQB")
+REQUEST, RESPONSE, ERROR, PUSH, SUBSCRIBE, UNSUBSCRIBE = range(6)
+
+SHARD_SOCKET_DIR = tempfile.gettempdir()
+CONNECT_RETRIES = 50
+
+
+class ShardError(Exception):
+    pass
+
+
+def socket_path(index, prefix="btcfootprint"):
+    return os.path.join(SHARD_SOCKET_DIR, f"{prefix}-shard-{index}.sock")
+
+def assign_symbols(symbols, shards):
+    """
+    Simboli per shard: round-robin sulla lista ordinata, uguale in tutti i
+    processi che ricevono gli stessi simboli. Al massimo uno shard per
+    simbolo, cosi' nessuno shard resta vuoto (uno stream senza simboli si
+    riconnetterebbe all'infinito).
+    """
+    ordered = sorted({s.upper() for s in symbols})
+    count = min(shards, len(ordered))
+    return [ordered[i::count] for i in range(count)]
+
+def shard_for(symbol, symbols, shards):
+    """Shard proprietario di symbol nell'assegnazione di assign_symbols"""
+    for index, shard_symbols in enumerate(assign_symbols(symbols, shards)):
+        if symbol.upper() in shard_symbols:
+            return index
+    raise KeyError(symbol)
+
+async def read_frame(reader):
+    length, frame_id, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+    payload = await reader.readexactly(length) if length else b""
+    return frame_id, kind, payload
+
+def write_frame(writer, frame_id, kind, payload=b""):
+    writer.write(FRAME.pack(len(payload), frame_id, kind) + payload)
+
+
+# ----------------------------------------------------------------------
+# Lato shard
+# ----------------------------------------------------------------------
+
+class ShardServer:
+    """Processo shard: MarketHub dei propri simboli servito su socket unix"""
+
+    def __init__(self, index, symbols, live=True):
+        self.index = index
+        self.hub = MarketHub(symbols)
+        self.live = live
+        self.path = socket_path(index)
+
+    async def dispatch(self, request):
+        method = request['method']
+        if method == 'hub_stats':
+            return await self.hub.stats()
+        if method not in ENGINE_METHODS:
+            raise ShardError(f"Metodo non esposto: {method}")
+        return await self.hub.call(request['symbol'], method, **request.get('kwargs', {}))
+
+    async def handle_request(self, writer, frame_id, payload):
+        try:
+            result = await self.dispatch(json.loads(payload))
+            write_frame(writer, frame_id, RESPONSE, json.dumps(result).encode())
+        except Exception as e:
+            write_frame(writer, frame_id, ERROR, str(e).encode())
+
+    async def handle_connection(self, reader, writer):
+        subscriptions = {}
+        tasks = set()
+        try:
+            while True:
+                frame_id, kind, payload = await read_frame(reader)
+                if kind == REQUEST:
+                    task = asyncio.create_task(self.handle_request(writer, frame_id, payload))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif kind == SUBSCRIBE:
+                    request = json.loads(payload)
+                    push = lambda data, fid=frame_id: write_frame(writer, fid, PUSH, data)
+                    subscriptions[frame_id] = await self.hub.subscribe(request['symbol'], request['event'], push)
+                elif kind == UNSUBSCRIBE:
+                    token = subscriptions.pop(frame_id, None)
+                    if token is not None:
+                        await self.hub.unsubscribe(token)
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            for token in subscriptions.values():
+                await self.hub.unsubscribe(token)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle_connection, path=self.path)
+        if self.live:
+            self.hub.start_feed()
+        self.hub.start_tracking()
+        print(f"[INFO] Shard {self.index}: {', '.join(self.hub.symbols())}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.hub.stop()
+            await close_session()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def shard_main(index, symbols, live=True):
+    try:
+        asyncio.run(ShardServer(index, symbols, live).serve())
+    except KeyboardInterrupt:
+        pass
+
+def start_shards(symbols, shards, live=True):
+    """Avvia un processo per shard, ritorna i Process"""
+    processes = []
+    for index, shard_symbols in enumerate(assign_symbols(symbols, shards)):
+        p = multiprocessing.Process(target=shard_main, args=(index, shard_symbols, live), name=f'shard-{index}')
+        p.start()
+        processes.append(p)
+    return processes
+
+
+# ----------------------------------------------------------------------
+# Lato web
+# ----------------------------------------------------------------------
+
+class ShardClient:
+    """Connessione multiplexata verso uno shard: richieste concorrenti per id"""
+
+    def __init__(self, index):
+        self.index = index
+        self.path = socket_path(index)
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        self.pending = {}
+        self.callbacks = {}
+        self.next_id = 1
+        self.connect_lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.connect_lock:
+            if self.writer is not None:
+                return
+            for attempt in range(CONNECT_RETRIES):
+                try:
+                    self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    # Shard ancora in avvio
+                    await asyncio.sleep(0.1)
+            else:
+                raise ShardError(f"Shard {self.index} non raggiungibile su {self.path}")
+            self.read_task = asyncio.create_task(self.read_loop())
+
+    async def read_loop(self):
+        try:
+            while True:
+                frame_id, kind, payload = await read_frame(self.reader)
+                if kind == PUSH:
+                    callback = self.callbacks.get(frame_id)
+                    if callback is not None:
+                        callback(payload)
+                    continue
+                future = self.pending.pop(frame_id, None)
+                if future is None or future.done():
+                    continue
+                if kind == RESPONSE:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(ShardError(payload.decode()))
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ShardError(f"Shard {self.index} disconnesso"))
+            self.pending.clear()
+            self.callbacks.clear()
+            self.writer = None
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    async def request(self, method, symbol=None, **kwargs):
+        """Risultato JSON gia' serializzato dallo shard"""
+        await self.connect()
+        frame_id = self._new_id()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[frame_id] = future
+        write_frame(self.writer, frame_id, REQUEST, json.dumps({'method': method, 'symbol': symbol, 'kwargs': kwargs}).encode())
+        return await future
+
+    async def subscribe(self, symbol, event, callback):
+        await self.connect()
+        frame_id = self._new_id()
+        self.callbacks[frame_id] = callback
+        write_frame(self.writer, frame_id, SUBSCRIBE, json.dumps({'symbol': symbol, 'event': event}).encode())
+        return frame_id
+
+    async def unsubscribe(self, frame_id):
+        if self.callbacks.pop(frame_id, None) is not None and self.writer is not None:
+            write_frame(self.writer, frame_id, UNSUBSCRIBE)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.read_task is not None:
+            self.read_task.cancel()
+
+
+class ShardRouter:
+    """Stessa interfaccia di MarketHub, ma ogni simbolo vive nel suo shard"""
+
+    def __init__(self, symbols, shards):
+        groups = assign_symbols(symbols, shards)
+        self.shards = len(groups)
+        self.assignment = {symbol: index for index, group in enumerate(groups) for symbol in group}
+        self.clients = [ShardClient(i) for i in range(self.shards)]
+
+    def symbols(self):
+        return list(self.assignment)
+
+    def client(self, symbol):
+        return self.clients[self.assignment[symbol.upper()]]
+
+    async def call_raw(self, symbol, method, **kwargs):
+        return await self.client(symbol).request(method, symbol.upper(), **kwargs)
+
+    async def call(self, symbol, method, **kwargs):
+        return json.loads(await self.call_raw(symbol, method, **kwargs))
+
+    async def subscribe(self, symbol, event, callback):
+        client = self.client(symbol)
+        return client, await client.subscribe(symbol.upper(), event, callback)
+
+    async def unsubscribe(self, token):
+        client, frame_id = token
+        await client.unsubscribe(frame_id)
+
+    def start_feed(self):
+        # Lo stream gira dentro gli shard
+        pass
+
+    async def stop(self):
+        for client in self.clients:
+            await client.close()
+
+    async def stats(self):
+        results = await asyncio.gather(*[c.request('hub_stats') for c in self.clients], return_exceptions=True)
+        symbols, shards = [], []
+        for client, result in zip(self.clients, results):
+            if isinstance(result, Exception):
+                shards.append({'index': client.index, 'error': str(result)})
+                continue
+            data = json.loads(result)
+            symbols += data['symbols']
+            shards.append({'index': client.index, 'symbols': [s['symbol'] for s in data['symbols']], 'feed': data['feed']})
+        return {'symbols': symbols, 'shards': shards}
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - CACHE IN SHARED MEMORY
+Un solo processo di ingestion scrive, i worker web leggono senza lock (seqlock)
+"""
+
+import hashlib
+import json
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+# Header: sequenza (dispari = scrittura in corso), lunghezza payload, timestamp
+HEADER = struct.Struct("<QQd")
+SLOT_SIZE = 4 * 1024 * 1024
+READ_RETRIES = 100
+
+
+class SharedSlot:
+    """
+    Segmento di shared memory con un solo writer e lettori lock-free.
+    Il writer porta la sequenza a dispari, copia il payload e la riporta a
+    pari; il lettore ripete la copia se la sequenza e' cambiata nel frattempo.
+    """
+
+    def __init__(self, name, size=SLOT_SIZE, create=False):
+        self.name = name
+        if create:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # Segmento rimasto da un'esecuzione precedente
+                self.shm = shared_memory.SharedMemory(name=name)
+            HEADER.pack_into(self.shm.buf, 0, 0, 0, 0.0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # Solo il writer e' proprietario del segmento: il lettore non deve
+            # farlo rimuovere dal resource tracker quando termina
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.owner = create
+        self.capacity = self.shm.size - HEADER.size
+
+    def write(self, payload):
+        if len(payload) > self.capacity:
+            raise ValueError(f"payload {len(payload)} byte oltre la capacita' dello slot {self.name}")
+        buf = self.shm.buf
+        seq = HEADER.unpack_from(buf, 0)[0]
+        struct.pack_into("<Q", buf, 0, seq + 1)
+        buf[HEADER.size:HEADER.size + len(payload)] = payload
+        HEADER.pack_into(buf, 0, seq + 2, len(payload), time.time())
+
+    def read(self):
+        """Ritorna (payload, timestamp) oppure (None, 0) se vuoto o conteso"""
+        buf = self.shm.buf
+        for _ in range(READ_RETRIES):
+            seq, length, ts = HEADER.unpack_from(buf, 0)
+            if seq == 0:
+                return None, 0.0
+            if seq % 2:
+                continue
+            payload = bytes(buf[HEADER.size:HEADER.size + length])
+            if HEADER.unpack_from(buf, 0)[0] == seq:
+                return payload, ts
+        return None, 0.0
+
+    def updated_at(self):
+        """Tempo dell'ultima scrittura completata, 0 se mai scritto"""
+        seq, _, ts = HEADER.unpack_from(self.shm.buf, 0)
+        return ts if seq else 0.0
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedCache:
+    """Insieme di slot indicizzati per chiave (es. footprint 1m_10.0, orderbook)"""
+
+    def __init__(self, prefix="fpcache", create=False, slot_size=SLOT_SIZE):
+        self.prefix = prefix
+        self.create = create
+        self.slot_size = slot_size
+        self.slots = {}
+
+    def slot_name(self, key):
+        return f"{self.prefix}_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+    def _slot(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            try:
+                slot = SharedSlot(self.slot_name(key), self.slot_size, create=self.create)
+            except FileNotFoundError:
+                return None
+            self.slots[key] = slot
+        return slot
+
+    def publish(self, key, data):
+        self._slot(key).write(json.dumps(data).encode())
+
+    def read(self, key, max_age=None):
+        """Payload JSON gia' serializzato, None se assente o piu' vecchio di max_age"""
+        slot = self._slot(key)
+        if slot is None:
+            return None
+        payload, ts = slot.read()
+        if payload is None or (max_age is not None and time.time() - ts > max_age):
+            return None
+        return payload
+
+    def updated_at(self, key):
+        """Tempo dell'ultima pubblicazione di key (0 se mai pubblicata): eta' dei dati serviti"""
+        slot = self._slot(key)
+        return slot.updated_at() if slot is not None else 0.0
+
+    def read_json(self, key, max_age=None):
+        payload = self.read(key, max_age)
+        return json.loads(payload) if payload is not None else None
+
+    def close(self):
+        for slot in self.slots.values():
+            slot.close()
+        self.slots.clear()
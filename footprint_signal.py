@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - SEGNALE DI TRADING
+Porting lato server di calculateTradingSignal (dashboard INTENSITY): stesso
+segnale per tutti i client, pesi per distanza calcolati con numpy
+"""
+
+import math
+
+import numpy as np
+
+PRICE_WEIGHT_FACTOR = 0.02  # 2% di decadimento per ogni % di distanza
+OB_WEIGHT = 0.70            # peso del delta OB pesato nello score composito
+FP_WEIGHT = 0.30            # peso del delta footprint
+OB_THRESHOLD = 0.08         # 8% di sbilanciamento pesato
+FP_THRESHOLD = 0.15         # 15% del volume medio
+VOLUME_THRESHOLD = 1.2
+
+
+def js_round(x):
+    """Math.round di JavaScript (mezzo arrotondato verso l'alto)"""
+    return int(math.floor(x + 0.5))
+
+def book_arrays(levels):
+    """[[prezzo, qty], ...] (anche stringhe del REST) -> (prezzi, quantita')"""
+    if not levels:
+        return np.empty(0), np.empty(0)
+    arr = np.asarray(levels, dtype=np.float64)
+    return arr[:, 0], arr[:, 1]
+
+def weighted_depth(levels, price):
+    """(quantita' pesata exp(-distanza/0.02), quantita' totale) di un lato del book"""
+    prices, qty = book_arrays(levels)
+    weights = np.exp(-np.abs(prices - price) / price / PRICE_WEIGHT_FACTOR)
+    return float(qty @ weights), float(qty.sum())
+
+
+def trading_signal(ob_data, bars, stats):
+    """
+    Stesso calcolo di calculateTradingSignal: delta OB pesato (70%) e delta
+    footprint normalizzato sul volume medio (30%), conferma sul volume.
+    """
+    price = stats.get('price') or 0
+    if price <= 0 or not ob_data:
+        return {
+            'signal': 'neutral', 'strength': 0, 'weightedObDelta': 0.0, 'totalObDelta': 0.0,
+            'footprintDelta': 0.0, 'volumeRatio': 0.0, 'compositeScore': 0.0,
+            'normalizedObDelta': 0.0, 'normalizedFpDelta': 0.0,
+        }
+
+    weighted_bid, total_bid = weighted_depth(ob_data.get('bids'), price)
+    weighted_ask, total_ask = weighted_depth(ob_data.get('asks'), price)
+    weighted_ob_delta = weighted_bid - weighted_ask
+    total_ob_delta = total_bid - total_ask
+
+    footprint_delta = stats.get('delta') or 0
+    avg_volume = stats.get('volume', 0) / max(1, len(bars))
+    current_volume = bars[-1]['volume'] if bars else 0
+    volume_ratio = current_volume / avg_volume if avg_volume > 0 else 1
+
+    total_weighted = abs(weighted_bid + weighted_ask)
+    normalized_ob = weighted_ob_delta / total_weighted if total_weighted > 0 else 0
+    normalized_fp = footprint_delta / avg_volume if avg_volume > 0 else 0
+    composite = normalized_ob * OB_WEIGHT + normalized_fp * FP_WEIGHT
+
+    signal, strength = 'neutral', 0
+    strong = volume_ratio > VOLUME_THRESHOLD
+    if (composite > OB_THRESHOLD and footprint_delta > 0 and strong) or \
+       (composite < -OB_THRESHOLD and footprint_delta < 0 and strong):
+        # Segnale forte: OB pesato + footprint + volume
+        signal = 'buy' if composite > 0 else 'sell'
+        ob_strength = min(60, abs(normalized_ob) / OB_THRESHOLD * 60)
+        fp_strength = min(25, abs(normalized_fp) / FP_THRESHOLD * 25)
+        vol_strength = min(15, volume_ratio / VOLUME_THRESHOLD * 15)
+        strength = js_round(ob_strength + fp_strength + vol_strength)
+    elif abs(composite) > OB_THRESHOLD * 0.5:
+        # Segnale moderato (solo OB forte)
+        signal = 'buy' if composite > 0 else 'sell'
+        strength = min(100, js_round(abs(normalized_ob) / OB_THRESHOLD * 80))
+
+    return {
+        'signal': signal,
+        'strength': min(100, strength),
+        'weightedObDelta': weighted_ob_delta,
+        'totalObDelta': total_ob_delta,
+        'footprintDelta': footprint_delta,
+        'volumeRatio': round(volume_ratio, 2),
+        'compositeScore': round(composite, 4),
+        'normalizedObDelta': round(normalized_ob, 4),
+        'normalizedFpDelta': round(normalized_fp, 4),
+    }
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - DISTRIBUZIONE DELLE SIZE DEI TRADE
+Istogrammi a bucket logaritmici per barra e lato, calcolati con numpy nello
+stesso passaggio del footprint. I bucket sono fissi, quindi gli istogrammi
+di piu' barre si fondono sommandoli (roll-up su timeframe maggiori).
+"""
+
+import numpy as np
+
+SIZE_HIST_MIN = 0.001     # limite inferiore del primo bucket (sotto finisce nel primo)
+SIZE_HIST_BASE = 2.0      # ogni bucket raddoppia la size
+SIZE_HIST_BUCKETS = 24    # l'ultimo parte da 0.001 * 2^23 (~8400) e raccoglie tutto il resto
+
+
+def size_edges():
+    """Limite inferiore di ogni bucket"""
+    return [round(SIZE_HIST_MIN * SIZE_HIST_BASE ** i, 6) for i in range(SIZE_HIST_BUCKETS)]
+
+
+def size_buckets(qty):
+    """Indice del bucket di ogni quantita' (array numpy)"""
+    with np.errstate(divide='ignore'):
+        idx = np.floor(np.log(np.maximum(qty, 1e-300) / SIZE_HIST_MIN) / np.log(SIZE_HIST_BASE))
+    return np.clip(idx, 0, SIZE_HIST_BUCKETS - 1).astype(np.int64)
+
+
+def size_histogram(qty, is_bid):
+    """
+    Numero di trade e volume per bucket, separati per lato (bid = venditore
+    aggressore, come le colonne del footprint)
+    """
+    buckets = size_buckets(qty)
+    ask = ~is_bid
+    return {
+        'bid_count': np.bincount(buckets[is_bid], minlength=SIZE_HIST_BUCKETS).tolist(),
+        'ask_count': np.bincount(buckets[ask], minlength=SIZE_HIST_BUCKETS).tolist(),
+        'bid_qty': np.round(np.bincount(buckets[is_bid], weights=qty[is_bid], minlength=SIZE_HIST_BUCKETS), 4).tolist(),
+        'ask_qty': np.round(np.bincount(buckets[ask], weights=qty[ask], minlength=SIZE_HIST_BUCKETS), 4).tolist(),
+    }
+
+
+def merge_histograms(histograms):
+    """Somma di istogrammi di piu' barre (None = barra senza trade)"""
+    histograms = [h for h in histograms if h]
+    if not histograms:
+        return None
+    return {key: np.round(np.sum([h[key] for h in histograms], axis=0), 4).tolist() for key in histograms[0]}
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - SKETCH DEI QUANTILI (KLL)
+Quantili delle quantita' dei trade mantenuti in streaming per candela, con
+errore di rango limitato e fondibili tra candele per soglie su finestre mobili
+"""
+
+import math
+import random
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+KLL_K = 200         # errore di rango ~1.3% (vedi rank_error); esatto finche' i trade sono meno di k
+KLL_C = 2.0 / 3.0   # decadimento della capacita' dei livelli inferiori
+
+
+def rank_error(k=KLL_K):
+    """
+    Errore di rango normalizzato di un quantile con confidenza 99% (stima
+    empirica di Apache DataSketches per KLL con c = 2/3): 0.0133 per k=200
+    """
+    return 2.296 / k ** 0.9723
+
+
+class KLLSketch:
+    """
+    Sketch KLL (Karnin-Lang-Liberty): il livello h contiene elementi di peso
+    2^h. Quando un livello e' pieno viene ordinato e ne sopravvive un
+    elemento su due (pari o dispari a caso), promosso al livello successivo.
+    """
+
+    def __init__(self, k=KLL_K, c=KLL_C):
+        self.k = k
+        self.c = c
+        self.levels = [[]]
+        self.size = 0      # elementi trattenuti
+        self.n = 0         # elementi visti
+        self.max_size = self._capacity(0)
+        self._view = None  # (valori ordinati, pesi cumulati), invalidata a ogni update
+
+    def __len__(self):
+        return self.n
+
+    def _capacity(self, h):
+        depth = len(self.levels) - h - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _grow(self):
+        self.levels.append([])
+        self.max_size = sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        for h, level in enumerate(self.levels):
+            if len(level) >= self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self._grow()
+                level.sort()
+                odd = len(level) % 2
+                keep = level[-1:] if odd else []
+                promoted = level[random.random() < 0.5:len(level) - odd:2]
+                self.levels[h + 1].extend(promoted)
+                self.levels[h] = keep
+                self.size = sum(len(l) for l in self.levels)
+                return
+
+    def update(self, value):
+        self.levels[0].append(value)
+        self.size += 1
+        self.n += 1
+        self._view = None
+        if self.size >= self.max_size:
+            self._compress()
+
+    def extend(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def merge(self, other):
+        """Fonde un altro sketch in questo (es. candele di una finestra mobile)"""
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.size = sum(len(l) for l in self.levels)
+        self.n += other.n
+        self._view = None
+        while self.size >= self.max_size:
+            self._compress()
+        return self
+
+    @classmethod
+    def merged(cls, sketches):
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def _sorted_view(self):
+        if self._view is None:
+            items = sorted((v, 1 << h) for h, level in enumerate(self.levels) for v in level)
+            self._view = ([v for v, _ in items], list(accumulate(w for _, w in items)))
+        return self._view
+
+    def quantile(self, q):
+        """
+        Valore di rango int(n * q) (stessa convenzione del filtro percentile
+        su lista ordinata), in O(log n) dopo la prima interrogazione
+        """
+        values, cum = self._sorted_view()
+        if not values:
+            return None
+        rank = int(cum[-1] * q)
+        return values[min(bisect_right(cum, rank), len(values) - 1)]
+
+    def rank(self, value):
+        """Numero stimato di elementi < value"""
+        values, cum = self._sorted_view()
+        i = bisect_left(values, value)
+        return cum[i - 1] if i else 0
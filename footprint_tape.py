@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - TAPE DEI GRANDI TRADE
+Indice dei trade sopra soglie di size, costruito dagli aggTrade gia' ricevuti
+(stream e REST): per ogni soglia una lista ordinata per tempo, interrogabile
+per range temporale e size minima senza scandire tutti i trade
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+TAPE_THRESHOLDS = {
+    "BTCUSDT": (1.0, 5.0, 20.0),
+    "ETHUSDT": (20.0, 100.0, 500.0),
+    "SOLUSDT": (500.0, 2000.0, 10000.0),
+}
+TAPE_RETENTION_MS = 24 * 3600 * 1000   # trade piu' vecchi dell'ultimo di 24h vengono scartati
+TAPE_MAX_TRADES = 100000               # per soglia
+TAPE_RECENT = 200                      # ultimi inserimenti per lo stream
+
+
+class TapeIndex:
+    """Trade con qty >= threshold, ordinati per (tempo, id aggTrade)"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.keys = []      # (T, id) crescenti
+        self.trades = []    # [T, id, prezzo, qty, lato] allineati a keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def insert(self, row):
+        key = (row[0], row[1])
+        if self.keys and key > self.keys[-1]:
+            # Caso comune (stream): in coda senza bisezione
+            self.keys.append(key)
+            self.trades.append(row)
+            return
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.trades.insert(i, row)
+
+    def trim(self, oldest, max_trades=TAPE_MAX_TRADES):
+        drop = max(bisect_left(self.keys, (oldest,)), len(self.keys) - max_trades)
+        if drop > 0:
+            del self.keys[:drop]
+            del self.trades[:drop]
+
+    def between(self, start=None, end=None):
+        lo = 0 if start is None else bisect_left(self.keys, (start,))
+        hi = len(self.keys) if end is None else bisect_right(self.keys, (end, float('inf')))
+        return self.trades[lo:max(lo, hi)]
+
+
+class TradeTape:
+    """
+    Un TapeIndex per soglia (annidati: un trade da 50 BTC sta in tutte).
+    Una query usa la soglia piu' alta <= size minima e filtra solo quella.
+    I trade gia' visti (id aggTrade) vengono ignorati.
+    """
+
+    def __init__(self, thresholds):
+        self.indexes = [TapeIndex(float(t)) for t in sorted(thresholds)]
+        self.ids = set()
+        self.recent = deque(maxlen=TAPE_RECENT)   # (seq, riga) in ordine di arrivo
+        self.seq = 0
+        self.newest = 0
+
+    @property
+    def thresholds(self):
+        return [index.threshold for index in self.indexes]
+
+    def add(self, trade):
+        qty = float(trade['q'])
+        if not self.indexes or qty < self.indexes[0].threshold:
+            return
+        trade_id = int(trade['a'])
+        if trade_id in self.ids:
+            return
+        row = [int(trade['T']), trade_id, float(trade['p']), qty, 'sell' if trade.get('m') else 'buy']
+        self._insert(row)
+
+    def extend(self, trades):
+        for trade in trades:
+            self.add(trade)
+        return self
+
+    def _insert(self, row):
+        if row[0] < self.newest - TAPE_RETENTION_MS:
+            return
+        self.ids.add(row[1])
+        for index in self.indexes:
+            if row[3] < index.threshold:
+                break
+            index.insert(row)
+        self.seq += 1
+        self.recent.append((self.seq, row))
+        if row[0] > self.newest:
+            self.newest = row[0]
+            if len(self.indexes[0]) > TAPE_MAX_TRADES or self.indexes[0].keys[0][0] < self.newest - TAPE_RETENTION_MS:
+                self._trim()
+
+    def _trim(self):
+        oldest = self.newest - TAPE_RETENTION_MS
+        base = self.indexes[0]
+        dropped = base.trades[:max(bisect_left(base.keys, (oldest,)), len(base) - TAPE_MAX_TRADES)]
+        self.ids.difference_update(row[1] for row in dropped)
+        for index in self.indexes:
+            index.trim(oldest)
+
+    def query(self, start=None, end=None, min_size=None, limit=None):
+        """Trade con start <= T <= end (ms) e qty >= min_size, in ordine di tempo"""
+        min_size = self.indexes[0].threshold if min_size is None else float(min_size)
+        usable = [index for index in self.indexes if index.threshold <= min_size]
+        index = usable[-1] if usable else self.indexes[0]
+        rows = index.between(start, end)
+        if min_size > index.threshold:
+            rows = [r for r in rows if r[3] >= min_size]
+        return rows[-limit:] if limit else rows
+
+    def since(self, after=0, limit=50):
+        """Ultimi trade inseriti con seq > after (stream)"""
+        rows = [dict(row_dict(row), seq=seq) for seq, row in self.recent if seq > after]
+        return rows[-limit:] if limit else []
+
+    def rows(self, start=None):
+        """Tutte le righe della soglia piu' bassa (pubblicazione in shared memory)"""
+        return self.indexes[0].between(start) if self.indexes else []
+
+    @classmethod
+    def from_rows(cls, thresholds, rows):
+        tape = cls(thresholds)
+        for row in rows:
+            tape._insert(list(row))
+        return tape
+
+
+def row_dict(row):
+    return {'time': row[0], 'id': row[1], 'price': row[2], 'qty': row[3], 'side': row[4]}
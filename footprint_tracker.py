@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - STORICO FASI E INTENSITA' DEL SEGNALE
+Buffer circolari a dimensione fissa su array numpy, salvati su disco e
+ricaricati al riavvio (stessi dati per tutti i client)
+"""
+
+import os
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+SIGNALS = ('neutral', 'buy', 'sell')
+SIGNAL_CODES = {s: i for i, s in enumerate(SIGNALS)}
+
+INTENSITY_HISTORY_SIZE = 4320   # campioni di intensita' (6 ore a 5s)
+PHASE_HISTORY_SIZE = 50         # fasi chiuse tenute per la distribuzione
+TRACKER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tracker_state")
+
+
+class RingBuffer:
+    """
+    Colonne numpy a capacita' fissa: append O(1) senza shift, la piu'
+    vecchia viene sovrascritta. I timestamp sono crescenti, quindi un
+    range temporale si trova per bisezione sugli indici logici.
+    """
+
+    def __init__(self, capacity, columns):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in columns.items()}
+        self.head = 0    # prossima posizione da scrivere
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _physical(self, i):
+        return (self.head - self.count + i) % self.capacity
+
+    def append(self, **values):
+        for name, value in values.items():
+            self.columns[name][self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def take(self, lo=0, hi=None):
+        """Righe logiche [lo, hi) in ordine di inserimento, come dict di array"""
+        hi = self.count if hi is None else hi
+        idx = (self.head - self.count + np.arange(lo, hi)) % self.capacity
+        return {name: col[idx] for name, col in self.columns.items()}
+
+    def time_range(self, start=None, end=None, key='timestamps'):
+        """Righe con start <= timestamp <= end in O(log n + k)"""
+        ts = self.columns[key]
+        at = lambda i: ts[self._physical(i)]
+        lo = 0 if start is None else bisect_left(range(self.count), start, key=at)
+        hi = self.count if end is None else bisect_right(range(self.count), end, key=at)
+        return self.take(lo, max(lo, hi))
+
+    def state(self, prefix):
+        rows = self.take()
+        return {f"{prefix}{name}": col for name, col in rows.items()}
+
+    def load(self, state, prefix):
+        rows = {name: state[f"{prefix}{name}"] for name in self.columns if f"{prefix}{name}" in state}
+        if len(rows) != len(self.columns):
+            return
+        n = min(len(next(iter(rows.values()))), self.capacity)
+        for name, col in rows.items():
+            self.columns[name][:n] = col[-n:] if n else col[:0]
+        self.count = n
+        self.head = n % self.capacity
+
+
+def weighted_distribution(signals, durations, avg_strengths):
+    """
+    Porting di calculateWeightedDistribution: peso di una fase =
+    durata * intensita' media / 100, sommato per segnale con bincount
+    """
+    signals = np.asarray(signals, dtype=np.int64)
+    durations = np.asarray(durations, dtype=np.float64)
+    weights = durations * np.asarray(avg_strengths, dtype=np.float64) / 100
+    w = np.bincount(signals, weights=weights, minlength=len(SIGNALS))
+    bars = np.bincount(signals, weights=durations, minlength=len(SIGNALS))
+    total_weight, total_bars = w.sum(), bars.sum()
+
+    by_signal = lambda values: {s: float(values[SIGNAL_CODES[s]]) for s in ('buy', 'sell', 'neutral')}
+    if total_weight == 0:
+        zero = {'buy': 0, 'sell': 0, 'neutral': 0}
+        return {'weighted': dict(zero), 'time': dict(zero), 'bars': dict(zero, total=0), 'avgStrength': dict(zero)}
+    return {
+        'weighted': by_signal(w / total_weight * 100),
+        'time': by_signal(bars / total_bars * 100 if total_bars > 0 else bars * 0),
+        'bars': dict({s: int(v) for s, v in by_signal(bars).items()}, total=int(total_bars)),
+        'avgStrength': by_signal(np.divide(w, bars, out=np.zeros_like(w), where=bars > 0) * 100),
+    }
+
+
+class SignalTracker:
+    """
+    Stato di window.strategyPhaseTracker e window.avgIntensityHistory lato
+    server: una fase e' una sequenza di campioni con lo stesso segnale.
+    """
+
+    def __init__(self, symbol, directory=TRACKER_DIR):
+        self.symbol = symbol
+        self.path = os.path.join(directory, f"{symbol.lower()}.npz") if directory else None
+        self.intensity = RingBuffer(INTENSITY_HISTORY_SIZE, {
+            'timestamps': np.int64, 'buyIntensity': np.float32, 'sellIntensity': np.float32, 'signals': np.int8})
+        self.phases = RingBuffer(PHASE_HISTORY_SIZE, {
+            'started': np.int64, 'signal': np.int8, 'duration': np.int32, 'totalStrength': np.float64})
+        self.current = None   # fase in corso: started, signal, duration, totalStrength
+        self.total_bars = 0
+
+    def add_sample(self, timestamp, signal, strength):
+        code = SIGNAL_CODES.get(signal, 0)
+        if self.current is None or self.current['signal'] != code:
+            if self.current is not None:
+                self.phases.append(**self.current)
+            self.current = {'started': timestamp, 'signal': code, 'duration': 1, 'totalStrength': float(strength)}
+        else:
+            self.current['duration'] += 1
+            self.current['totalStrength'] += strength
+        self.total_bars += 1
+        self.intensity.append(timestamps=timestamp, signals=code,
+                              buyIntensity=strength if signal == 'buy' else 0,
+                              sellIntensity=strength if signal == 'sell' else 0)
+
+    def all_phases(self):
+        """Fasi chiuse piu' quella in corso, come colonne"""
+        rows = self.phases.take()
+        if self.current is not None:
+            rows = {name: np.append(col, self.current[name]) for name, col in rows.items()}
+        return rows
+
+    def distribution(self):
+        rows = self.all_phases()
+        avg = np.divide(rows['totalStrength'], rows['duration'], out=np.zeros(len(rows['duration'])), where=rows['duration'] > 0)
+        return weighted_distribution(rows['signal'], rows['duration'], avg)
+
+    def history(self, start=None, end=None):
+        """Campioni di intensita' nel range (ms) e fasi, formato di avgIntensityHistory"""
+        rows = self.intensity.time_range(start, end)
+        phases = self.all_phases()
+        return {
+            'symbol': self.symbol,
+            'intensity': {
+                'timestamps': rows['timestamps'].tolist(),
+                'buyIntensity': rows['buyIntensity'].tolist(),
+                'sellIntensity': rows['sellIntensity'].tolist(),
+                'signals': [SIGNALS[c] for c in rows['signals']],
+            },
+            'phases': [
+                {'signal': SIGNALS[s], 'started': int(t), 'duration': int(d), 'avgStrength': float(total / d) if d else 0.0}
+                for t, s, d, total in zip(phases['started'], phases['signal'], phases['duration'], phases['totalStrength'])
+            ],
+            'totalBars': self.total_bars,
+            'distribution': self.distribution(),
+        }
+
+    # ------------------------------------------------------------------
+    # Persistenza
+    # ------------------------------------------------------------------
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        state = dict(self.intensity.state('intensity_'), **self.phases.state('phase_'))
+        current = self.current or {'started': 0, 'signal': -1, 'duration': 0, 'totalStrength': 0.0}
+        state.update({f"current_{k}": np.asarray(v) for k, v in current.items()}, total_bars=np.asarray(self.total_bars))
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, **state)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as state:
+                state = dict(state)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Storico segnale {self.symbol} non leggibile: {e}")
+            return False
+        self.intensity.load(state, 'intensity_')
+        self.phases.load(state, 'phase_')
+        if int(state.get('current_signal', -1)) >= 0:
+            self.current = {'started': int(state['current_started']), 'signal': int(state['current_signal']),
+                            'duration': int(state['current_duration']), 'totalStrength': float(state['current_totalStrength'])}
+        self.total_bars = int(state.get('total_bars', 0))
+        return True
+
+
+def history_slice(history, start=None, end=None):
+    """Range temporale su uno storico gia' serializzato (worker in shared memory)"""
+    intensity = history['intensity']
+    ts = intensity['timestamps']
+    lo = 0 if start is None else bisect_left(ts, start)
+    hi = len(ts) if end is None else bisect_right(ts, end)
+    return dict(history, intensity={k: v[lo:hi] for k, v in intensity.items()})
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+BTC FOOTPRINT - VWAP INCREMENTALE CON BANDE
+Accumulatori Σpq, Σq e Σp²q per barra con somme prefisse: VWAP di sessione,
+ancorato e mobile con bande a n deviazioni standard per qualsiasi finestra
+"""
+
+import math
+from bisect import bisect_left, bisect_right
+
+VWAP_MAX_BARS = 5000          # barre chiuse tenute per timeframe
+VWAP_ROLLING_BARS = 20        # finestra del VWAP mobile
+VWAP_BANDS = (1.0, 2.0)       # bande a ±1σ e ±2σ
+SESSION_MS = 86400000         # sessione = giorno UTC
+
+
+def bar_sums(k):
+    """
+    (Σpq, Σq, Σp²q) di una kline. Le candele costruite dai trade hanno Σp²q
+    esatto all'indice 12; per le klines REST la varianza interna alla barra
+    non e' nota e si usa (Σpq)²/Σq (tutto il volume al VWAP della barra).
+    """
+    q = float(k[5])
+    pq = float(k[7]) if len(k) > 7 else 0.0
+    if q > 0 and pq <= 0:
+        pq = float(k[4]) * q
+    if len(k) > 12:
+        return pq, q, float(k[12])
+    return pq, q, pq * pq / q if q > 0 else 0.0
+
+
+def vwap_stats(pq, q, p2q, bands=VWAP_BANDS):
+    """VWAP, σ e bande di una finestra dalle sue somme"""
+    if q <= 0:
+        return None
+    vwap = pq / q
+    sigma = math.sqrt(max(0.0, p2q / q - vwap * vwap))
+    result = {'vwap': round(vwap, 2), 'sigma': round(sigma, 2)}
+    for n in bands:
+        result[f"upper_{n:g}"] = round(vwap + n * sigma, 2)
+        result[f"lower_{n:g}"] = round(vwap - n * sigma, 2)
+    return result
+
+
+class VWAPSeries:
+    """
+    Somme prefisse delle barre chiuse (assolute dall'origine, come CVDSeries)
+    piu' la barra aperta tenuta a parte: ogni finestra costa tre sottrazioni.
+    """
+
+    def __init__(self, interval_ms, max_bars=VWAP_MAX_BARS):
+        self.interval_ms = interval_ms
+        self.max_bars = max_bars
+        self.timestamps = []
+        self.cum = [(0.0, 0.0, 0.0)]   # (Σpq, Σq, Σp²q) prima della barra i
+        self.open_bar = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def reset(self):
+        self.__init__(self.interval_ms, self.max_bars)
+
+    def sync(self, klines):
+        """Aggiunge le barre chiuse nuove; un buco nella serie la fa ripartire"""
+        if not klines:
+            return self
+        closed = klines[:-1]
+        if self.timestamps and closed and int(closed[0][0]) > self.timestamps[-1] + self.interval_ms:
+            self.reset()
+        self.open_bar = klines[-1]
+        last = self.timestamps[-1] if self.timestamps else None
+        for k in closed:
+            if last is None or int(k[0]) > last:
+                pq, q, p2q = bar_sums(k)
+                c = self.cum[-1]
+                self.timestamps.append(int(k[0]))
+                self.cum.append((c[0] + pq, c[1] + q, c[2] + p2q))
+        if len(self.timestamps) > self.max_bars:
+            drop = len(self.timestamps) - self.max_bars
+            del self.timestamps[:drop]
+            del self.cum[:drop]
+        return self
+
+    def _live(self):
+        k = self.open_bar
+        if k is None or (self.timestamps and int(k[0]) <= self.timestamps[-1]):
+            return None
+        return int(k[0]), bar_sums(k)
+
+    def _sums(self, a, b, live=None):
+        """Somme delle barre chiuse [a, b) piu' l'eventuale barra aperta"""
+        hi, lo = self.cum[b], self.cum[a]
+        sums = [hi[0] - lo[0], hi[1] - lo[1], hi[2] - lo[2]]
+        if live is not None:
+            sums = [s + x for s, x in zip(sums, live)]
+        return sums
+
+    def _index(self, ts):
+        """Indice della barra ts tra le chiuse, len(timestamps) per la barra aperta, None se assente"""
+        i = bisect_left(self.timestamps, ts)
+        if i < len(self.timestamps) and self.timestamps[i] == ts:
+            return i
+        live = self._live()
+        return len(self.timestamps) if live is not None and live[0] == ts else None
+
+    def window_at(self, start_index, i, bands=VWAP_BANDS):
+        """VWAP delle barre [start_index, i] (i puo' essere la barra aperta)"""
+        n = len(self.timestamps)
+        live = self._live()
+        if i >= n:
+            return vwap_stats(*self._sums(start_index, n, live[1] if live else None), bands)
+        return vwap_stats(*self._sums(start_index, i + 1), bands)
+
+    def session_start(self, ts):
+        return bisect_left(self.timestamps, ts // SESSION_MS * SESSION_MS)
+
+    def annotate(self, bars, rolling=VWAP_ROLLING_BARS):
+        """VWAP di sessione e mobile (con σ) a chiusura di ogni barra del footprint"""
+        for bar in bars:
+            i = self._index(bar['timestamp'])
+            if i is None:
+                bar['vwap'] = bar['rolling_vwap'] = None
+                continue
+            day = bar['timestamp'] // SESSION_MS * SESSION_MS
+            session = self.window_at(self.session_start(day), i)
+            # partial: la serie inizia dopo l'apertura della sessione
+            partial = (self.timestamps[0] if self.timestamps else bar['timestamp']) > day
+            bar['vwap'] = dict(session, partial=partial) if session else None
+            bar['rolling_vwap'] = self.window_at(max(0, i - rolling + 1), i)
+        return bars
+
+    def series(self, mode='session', anchor=None, rolling=VWAP_ROLLING_BARS, start=None, end=None, bands=VWAP_BANDS):
+        """
+        VWAP per barra tra start e end (ms): 'session' riparte a ogni giorno
+        UTC, 'anchored' cumula dalla barra di `anchor`, 'rolling' sulle
+        ultime `rolling` barre
+        """
+        live = self._live()
+        stamps = self.timestamps + ([live[0]] if live else [])
+        a = 0 if start is None else bisect_left(stamps, int(start))
+        b = len(stamps) if end is None else bisect_right(stamps, int(end))
+        if mode == 'anchored':
+            anchor_index = bisect_left(self.timestamps, int(anchor)) if anchor is not None else 0
+            a = max(a, anchor_index)
+        points = []
+        for i in range(a, b):
+            if mode == 'session':
+                first = self.session_start(stamps[i])
+            elif mode == 'anchored':
+                first = anchor_index
+            else:
+                first = max(0, i - int(rolling) + 1)
+            stats = self.window_at(first, i, bands)
+            if stats is not None:
+                points.append(dict(stats, timestamp=stamps[i], open=i >= len(self.timestamps)))
+        return points
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Archivio del book: ricostruzione da keyframe + diff, buchi, record incompleti"""
+
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+
+from footprint_archive import DIFF, QTY_LOT, RECORD, BookArchive, encode, segment_name
+from footprint_book import OrderBook
+
+HOUR = 1_735_693_200_000   # 2025-01-01 01:00 UTC
+SNAPSHOT = {'lastUpdateId': 100, 'bids': [['100.00', '1'], ['99.99', '2']], 'asks': [['100.01', '3'], ['100.02', '4']]}
+
+
+class Recorded:
+    """Book alimentato dagli eventi depth e archiviato come fa on_depth"""
+
+    def __init__(self, path, start_ts):
+        self.archive = BookArchive('BTCUSDT', directory=str(path))
+        self.archive.start()
+        self.book = OrderBook('BTCUSDT')
+        self.book.add_listener(self.archive)
+        self.book.load_snapshot(SNAPSHOT)
+        self.archive.flush(start_ts)
+        self.states = {start_ts: self.state()}
+        self.update_id = 100
+        self.rng = random.Random(50)
+
+    def state(self):
+        return {is_bid: dict(self.book.side(is_bid).levels) for is_bid in (True, False)}
+
+    def step(self, ts):
+        """Evento depth casuale al tempo ts"""
+        bids = [(f"{99 + self.rng.randint(0, 100) * 0.01:.2f}", f"{self.rng.choice((0, 0.5, 1.25, 3)):g}") for _ in range(3)]
+        asks = [(f"{100.01 + self.rng.randint(0, 100) * 0.01:.2f}", f"{self.rng.choice((0, 0.7, 2)):g}") for _ in range(3)]
+        self.update_id += 1
+        assert self.book.apply_diff({'U': self.update_id, 'u': self.update_id, 'E': ts,
+                                     'b': [list(b) for b in bids], 'a': [list(a) for a in asks]})
+        self.archive.flush(ts)
+        self.states[ts] = self.state()
+
+    def expected(self, ts):
+        return self.states[max(t for t in self.states if t <= ts)]
+
+
+def levels(result):
+    assert 'error' not in result, result
+    return {True: {p: q for p, q in result['bids']}, False: {p: q for p, q in result['asks']}}
+
+
+def test_keyframe_and_diffs_round_trip(tmp_path):
+    rec = Recorded(tmp_path, HOUR + 1000)
+    for ts in range(HOUR + 1500, HOUR + 200000, 700):   # piu' keyframe (ogni 60s) nello stesso segmento
+        rec.step(ts)
+    assert rec.archive.counts['keyframes'] >= 4
+    for ts in (HOUR + 1000, HOUR + 1500, HOUR + 61234, HOUR + 61899, HOUR + 150000, HOUR + 199999):
+        result = rec.archive.book_at(ts, limit=1000)
+        assert levels(result) == rec.expected(ts)
+        assert result['keyframe'] <= ts
+
+
+def test_gap_stops_reconstruction(tmp_path):
+    rec = Recorded(tmp_path, HOUR + 1000)
+    for ts in range(HOUR + 2000, HOUR + 10000, 1000):
+        rec.step(ts)
+    rec.archive.mark_gap(HOUR + 10500)
+
+    assert levels(rec.archive.book_at(HOUR + 9999, 1000)) == rec.expected(HOUR + 9999)
+    assert rec.archive.book_at(HOUR + 12000) == {'error': 'Book non sincronizzato all\'istante richiesto', 'gap': HOUR + 10500}
+
+    # Nuovo snapshot dopo il buco: keyframe e ricostruzione di nuovo possibile
+    rec.book.load_snapshot(SNAPSHOT)
+    rec.update_id = 100
+    rec.archive.flush(HOUR + 20000)
+    rec.states[HOUR + 20000] = rec.state()
+    rec.step(HOUR + 21000)
+    assert levels(rec.archive.book_at(HOUR + 21500, 1000)) == rec.expected(HOUR + 21500)
+
+
+@pytest.mark.parametrize('tail', ['header', 'payload', 'index'])
+def test_partially_written_trailing_record_is_ignored(tmp_path, tail):
+    rec = Recorded(tmp_path, HOUR + 1000)
+    for ts in range(HOUR + 2000, HOUR + 10000, 1000):
+        rec.step(ts)
+    rec.archive.close()
+
+    base = os.path.join(rec.archive.path, segment_name(HOUR))
+    payload = encode(np.array([1]), np.array([9999]), np.array([10 ** 8]))
+    header = np.array([(DIFF, HOUR + 9500, 1, len(payload))], RECORD).tobytes()
+    if tail == 'index':
+        with open(base + ".idx", 'ab') as f:
+            f.write(b'\x01\x02\x03')
+    else:
+        with open(base + ".log", 'ab') as f:
+            f.write(header[:5] if tail == 'header' else header + payload[:len(payload) // 2])
+
+    result = rec.archive.book_at(HOUR + 9999, 1000)
+    assert levels(result) == rec.expected(HOUR + 9999)
+    assert result['diffs'] == 8
+
+
+def test_before_first_keyframe_uses_previous_segment(tmp_path):
+    rec = Recorded(tmp_path, HOUR - 100000)
+    for ts in range(HOUR - 90000, HOUR, 3000):   # keyframe a -100s e -40s, poi diff fino alla fine dell'ora
+        rec.step(ts)
+    rec.step(HOUR + 5000)                        # primo evento (keyframe) del nuovo segmento
+    rec.step(HOUR + 6000)
+    assert os.path.exists(os.path.join(rec.archive.path, f"{segment_name(HOUR)}.idx"))
+
+    for ts in (HOUR, HOUR + 2000, HOUR + 4999):
+        result = rec.archive.book_at(ts, 1000)
+        assert levels(result) == rec.expected(ts)
+        assert segment_name(result['keyframe']) == segment_name(HOUR - 1)
+        assert result['diffs'] > 0
+    result = rec.archive.book_at(HOUR + 5500, 1000)
+    assert (result['keyframe'], result['diffs']) == (HOUR + 5000, 0)
+    assert levels(result) == rec.expected(HOUR + 5500)
+
+
+def test_before_first_keyframe_without_previous_segment(tmp_path):
+    rec = Recorded(tmp_path, HOUR + 5000)
+    assert rec.archive.book_at(HOUR + 1000) == {'error': 'Nessun keyframe prima dell\'istante richiesto'}
+    assert rec.archive.book_at(HOUR - 3600000) == {'error': f"Nessun dato archiviato per {segment_name(HOUR - 3600000)}"}
+
+
+# ----------------------------------------------------------------------
+# Tick dei segmenti
+# ----------------------------------------------------------------------
+
+PEPE = {'lastUpdateId': 7, 'bids': [['0.00001234', '5000000'], ['0.00001233', '100']], 'asks': [['0.00001236', '42']]}
+
+
+def pepe_archive(path, tick_size):
+    archive = BookArchive('PEPEUSDT', directory=str(path))
+    book = OrderBook('PEPEUSDT')
+    book.add_listener(archive)
+    assert archive.start(tick_size)
+    book.load_snapshot(PEPE)
+    archive.flush(HOUR + 1000)
+    archive.close()
+    return archive
+
+
+def test_unlisted_symbol_needs_the_exchange_tick(tmp_path, capsys):
+    archive = BookArchive('PEPEUSDT', directory=str(tmp_path))
+    assert not archive.start()   # niente fallback 0.01
+    assert "tick sconosciuto" in capsys.readouterr().out
+
+    pepe_archive(tmp_path, 1e-8)
+    with open(os.path.join(archive.path, f"{segment_name(HOUR)}.meta")) as f:
+        assert json.load(f) == {'tick_size': 1e-8, 'qty_lot': QTY_LOT}
+    result = archive.book_at(HOUR + 2000)
+    assert result['bids'] == [[1.234e-05, 5000000.0], [1.233e-05, 100.0]]
+    assert result['asks'] == [[1.236e-05, 42.0]]
+
+
+def test_replay_uses_the_tick_the_segment_was_written_with(tmp_path):
+    pepe_archive(tmp_path, 1e-8)
+    reader = BookArchive('PEPEUSDT', directory=str(tmp_path), tick_size=1e-9)   # tick cambiato dopo
+    assert reader.book_at(HOUR + 2000)['bids'][0] == [1.234e-05, 5000000.0]
+
+    # Segmento senza .meta (scritto prima dei .meta): tick della tabella
+    rec = Recorded(tmp_path, HOUR + 1000)
+    rec.archive.close()
+    os.remove(os.path.join(rec.archive.path, f"{segment_name(HOUR)}.meta"))
+    legacy = BookArchive('BTCUSDT', directory=str(tmp_path), tick_size=0.1)
+    assert levels(legacy.book_at(HOUR + 2000, 1000)) == rec.expected(HOUR + 2000)
+
+
+def test_segment_written_with_another_tick_is_not_appended(tmp_path, capsys):
+    pepe_archive(tmp_path, 1e-8)
+    log = os.path.join(tmp_path, 'pepeusdt', f"{segment_name(HOUR)}.log")
+    size = os.path.getsize(log)
+
+    other = BookArchive('PEPEUSDT', directory=str(tmp_path))
+    book = OrderBook('PEPEUSDT')
+    book.add_listener(other)
+    other.start(1e-7)
+    book.load_snapshot(PEPE)
+    other.flush(HOUR + 5000)
+    other.mark_gap(HOUR + 6000)
+    other.close()
+    assert "scritto con tick 1e-08 invece di 1e-07" in capsys.readouterr().out
+    assert os.path.getsize(log) == size
+    assert other.book_at(HOUR + 7000)['bids'][0] == [1.234e-05, 5000000.0]
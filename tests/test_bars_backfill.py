@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Backfill delle barre volume/tick/range: paginazione aggTrades e tick reale"""
+
+import asyncio
+
+import footprint_engine
+from footprint_engine import AGG_TRADES_LIMIT, MarketEngine
+
+
+def fake_aggtrades(trades):
+    """fetch_with_retry sopra una lista di aggTrade, con la semantica di /aggTrades"""
+    calls = []
+
+    async def fetch(url, params, max_retries=3, timeout=15):
+        calls.append(dict(params))
+        if url.endswith('/exchangeInfo'):
+            return {'symbols': [{'filters': [{'filterType': 'LOT_SIZE', 'stepSize': '0.001'},
+                                             {'filterType': 'PRICE_FILTER', 'tickSize': '0.10000000'}]}]}
+        if 'fromId' in params:
+            page = [t for t in trades if t['a'] >= params['fromId']]
+        else:
+            page = [t for t in trades if params['startTime'] <= t['T'] <= params['endTime']]
+        return page[:params['limit']]
+    return fetch, calls
+
+
+def minute_trades(minute, count, first_id=1):
+    return [{'a': first_id + i, 'T': minute + i * 60000 // count, 'p': '100.0', 'q': '0.01', 'm': i % 2 == 0}
+            for i in range(count)]
+
+
+def test_fetch_trade_pages_follows_from_id(monkeypatch):
+    trades = minute_trades(0, 2500) + minute_trades(60000, 10, first_id=2501)
+    fetch, calls = fake_aggtrades(trades)
+    monkeypatch.setattr(footprint_engine, 'fetch_with_retry', fetch)
+    engine = MarketEngine('BTCUSDT')
+    result, truncated, failed = asyncio.run(engine.fetch_trade_pages(0, 59999, 5))
+    assert [t['a'] for t in result] == list(range(1, 2501)) and not truncated and not failed
+    assert [('fromId' in c) for c in calls] == [False, True, True]
+
+    result, truncated, failed = asyncio.run(engine.fetch_trade_pages(0, 59999, 2))
+    assert len(result) == 2 * AGG_TRADES_LIMIT and truncated and not failed
+
+
+def test_busy_minute_is_complete_or_flagged(monkeypatch):
+    now_minute = 1_700_000_000_000 // 60000 * 60000
+    monkeypatch.setattr(footprint_engine, 'BAR_SOURCE_MINUTES', 2)
+    monkeypatch.setattr(footprint_engine.time, 'time', lambda: (now_minute + 30000) / 1000)
+    busy = minute_trades(now_minute - 60000, 3 * AGG_TRADES_LIMIT + 1)
+    fetch, _ = fake_aggtrades(busy + minute_trades(now_minute, 5, first_id=len(busy) + 1))
+    monkeypatch.setattr(footprint_engine, 'fetch_with_retry', fetch)
+    engine = MarketEngine('BTCUSDT')
+    engine.cube.path = None
+
+    data = asyncio.run(engine.get_bars('tick', 1000, step=1.0))
+    assert engine.bar_builders[('tick', 1000.0)].last_id == len(busy) + 5
+    assert len(data['bars']) == 4 and not any(b.get('truncated') for b in data['bars'])
+
+    monkeypatch.setattr(footprint_engine, 'BAR_BACKFILL_PAGES', 2)
+    engine = MarketEngine('BTCUSDT')
+    engine.cube.path = None
+    data = asyncio.run(engine.get_bars('tick', 1000, step=1.0))
+    assert [b.get('truncated', False) for b in data['bars']] == [True, True, False]
+
+
+def test_bar_builder_uses_exchange_tick_size(monkeypatch):
+    fetch, _ = fake_aggtrades([])
+    monkeypatch.setattr(footprint_engine, 'fetch_with_retry', fetch)
+    engine = MarketEngine('BTCUSDT')
+    assert asyncio.run(engine.check_tick_size()) == 0.1
+    asyncio.run(engine.get_bars('range', 10, step=1.0))
+    assert engine.bar_builders[('range', 10.0)].price_range == 1.0
+
+
+def test_failed_follow_up_page_is_not_cached_as_complete(monkeypatch):
+    now_minute = 1_700_000_000_000 // 60000 * 60000
+    monkeypatch.setattr(footprint_engine, 'BAR_SOURCE_MINUTES', 2)
+    monkeypatch.setattr(footprint_engine.time, 'time', lambda: (now_minute + 30000) / 1000)
+    busy = minute_trades(now_minute - 60000, 2500)
+    trades = busy + minute_trades(now_minute, 5, first_id=len(busy) + 1)
+    fetch, _ = fake_aggtrades(trades)
+    down = {'from_id': True}
+
+    async def flaky(url, params, max_retries=3, timeout=15):
+        if 'fromId' in params and down['from_id']:
+            return None   # fetch_with_retry dopo i tentativi falliti
+        return await fetch(url, params, max_retries, timeout)
+    monkeypatch.setattr(footprint_engine, 'fetch_with_retry', flaky)
+    engine = MarketEngine('BTCUSDT')
+    engine.cube.path = None
+
+    result, truncated, failed = asyncio.run(engine.fetch_trade_pages(now_minute - 60000, now_minute - 1, 5))
+    assert len(result) == AGG_TRADES_LIMIT and truncated and failed
+
+    asyncio.run(engine.get_bars('tick', 1000, step=1.0))
+    entry = engine.cache['trades'][('1m', now_minute - 60000)]
+    assert not entry['closed'] and engine.trades_truncated('1m', now_minute - 60000)
+    builder = engine.bar_builders[('tick', 1000.0)]
+    assert builder.fed_minute == now_minute - 60000 and builder.last_id == 0
+
+    # Binance di nuovo raggiungibile: la candela si riscarica e le barre si completano
+    down['from_id'] = False
+    monkeypatch.setattr(footprint_engine.time, 'time', lambda: (now_minute + 30000) / 1000 + footprint_engine.OPEN_TRADES_TTL)
+    data = asyncio.run(engine.get_bars('tick', 1000, step=1.0))
+    assert engine.cache['trades'][('1m', now_minute - 60000)]['closed']
+    assert builder.last_id == len(trades) and builder.fed_minute == now_minute
+    assert not any(b.get('truncated') for b in data['bars'])
+
+
+def test_stores_start_only_with_a_known_tick(monkeypatch, tmp_path):
+    answers = [None, {'symbols': [{'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': '0.00000001'}]}]}]
+
+    async def exchange_info(url, params, max_retries=3, timeout=15):
+        return answers.pop(0)
+    monkeypatch.setattr(footprint_engine, 'fetch_with_retry', exchange_info)
+    engine = MarketEngine('PEPEUSDT')
+    engine.cube.path = engine.archive.path = str(tmp_path)
+    assert not asyncio.run(engine.start_stores())   # exchangeInfo giu', simbolo fuori tabella
+    assert engine.cube.tick_size is None and not engine.archive.writing
+    assert asyncio.run(engine.start_stores())
+    assert engine.cube.tick_size == engine.archive.tick_size == engine.tick_size == 1e-8
+    assert engine.archive.writing
+
+    listed = MarketEngine('BTCUSDT')
+    listed.cube.path = listed.archive.path = str(tmp_path)
+    answers.append(None)
+    assert asyncio.run(listed.start_stores()) and listed.cube.tick_size == listed.archive.tick_size == 0.01
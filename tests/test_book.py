@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Order book locale: sincronizzazione snapshot + diff, buchi, listener"""
+
+import asyncio
+
+import pytest
+
+from footprint_book import LargeOrderIndex, OrderBook
+from footprint_engine import MarketEngine
+
+
+SNAPSHOT = {'lastUpdateId': 100, 'bids': [['100.00', '1'], ['99.99', '2']], 'asks': [['100.01', '3'], ['100.02', '4']]}
+
+
+def event(first, last, bids=(), asks=(), ts=0):
+    return {'U': first, 'u': last, 'E': ts, 'b': [list(b) for b in bids], 'a': [list(a) for a in asks]}
+
+
+class Recorder:
+    """Listener che replica il book dagli update (old, new)"""
+
+    def __init__(self):
+        self.levels = {True: {}, False: {}}
+        self.resets = 0
+        self.mismatches = []
+
+    def reset(self, book):
+        self.resets += 1
+        self.levels = {is_bid: dict(book.side(is_bid).levels) for is_bid in (True, False)}
+
+    def update(self, is_bid, price, old, new):
+        if self.levels[is_bid].get(price, 0.0) != old:
+            self.mismatches.append((is_bid, price, old))
+        if new > 0:
+            self.levels[is_bid][price] = new
+        else:
+            self.levels[is_bid].pop(price, None)
+
+
+def synced_book(*listeners):
+    book = OrderBook('BTCUSDT')
+    for listener in listeners:
+        book.add_listener(listener)
+    book.load_snapshot(SNAPSHOT)
+    return book
+
+
+def test_buffered_events_before_snapshot_are_replayed_from_the_straddling_one():
+    book = OrderBook('BTCUSDT')
+    assert not book.apply_diff(event(90, 95, bids=[('100.00', '9')]))          # gia' nello snapshot
+    assert not book.apply_diff(event(96, 102, bids=[('99.98', '5')]))          # U <= lastUpdateId+1 <= u
+    assert not book.apply_diff(event(103, 104, asks=[('100.01', '0')]))
+    assert book.load_snapshot(SNAPSHOT)
+    assert book.last_update_id == 104
+    assert book.bids.levels == {100.0: 1.0, 99.99: 2.0, 99.98: 5.0}
+    assert 100.01 not in book.asks.levels
+
+
+def test_first_live_event_straddling_last_update_id_is_applied():
+    book = synced_book()
+    assert book.apply_diff(event(95, 101, bids=[('100.00', '7')], ts=5))
+    assert book.bids.levels[100.0] == 7.0
+    assert book.last_update_id == 101 and book.updated_at == 5
+    assert book.apply_diff(event(90, 101, bids=[('100.00', '1')]))             # vecchio: ignorato
+    assert book.bids.levels[100.0] == 7.0
+
+
+def test_gap_marks_book_unsynced_and_resync_restores_it():
+    book = synced_book()
+    assert not book.apply_diff(event(105, 106, bids=[('100.00', '8')]))
+    assert not book.synced
+    assert book.bids.levels[100.0] == 1.0
+    book.load_snapshot(dict(SNAPSHOT, lastUpdateId=104))
+    assert book.synced and book.last_update_id == 106
+    assert book.bids.levels[100.0] == 8.0
+
+
+def test_gap_in_engine_writes_archive_gap_and_schedules_resync(tmp_path, monkeypatch):
+    async def run():
+        engine = MarketEngine('BTCUSDT')
+        engine.archive.path = str(tmp_path)
+        engine.archive.start()
+        gaps = []
+        monkeypatch.setattr(engine.archive, 'mark_gap', gaps.append)
+
+        async def no_snapshot():
+            return {}
+        monkeypatch.setattr(engine, 'fetch_orderbook', no_snapshot)
+        engine.book.load_snapshot(SNAPSHOT)
+        engine.on_depth(event(101, 101, bids=[('100.00', '2')], ts=1000))
+        engine.on_depth(event(110, 111, bids=[('100.00', '3')], ts=2000))
+        assert not engine.book.synced
+        assert gaps == [2000]
+        assert engine.sync_task is not None
+        engine.sync_task.cancel()
+        await asyncio.gather(engine.sync_task, return_exceptions=True)
+    asyncio.run(run())
+
+
+def test_zero_quantity_removes_level_and_notifies_once():
+    recorder = Recorder()
+    book = synced_book(recorder)
+    assert book.apply_diff(event(101, 101, bids=[('99.99', '0'), ('98.00', '0')], asks=[('100.01', '0.000')]))
+    assert 99.99 not in book.bids.levels and 99.99 not in book.bids.prices
+    assert 100.01 not in book.asks.levels and book.best_ask() == 100.02
+    assert recorder.levels[True] == book.bids.levels
+    assert recorder.levels[False] == book.asks.levels
+
+
+def test_trimming_far_levels_goes_through_listeners():
+    recorder = Recorder()
+    book = OrderBook('BTCUSDT', max_levels=2)
+    book.add_listener(recorder)
+    book.load_snapshot(SNAPSHOT)
+    assert book.apply_diff(event(101, 101, bids=[('100.005', '1')], asks=[('100.015', '1')]))
+    assert book.bids.prices == [100.0, 100.005]
+    assert book.asks.prices == [100.01, 100.015]
+    assert recorder.levels[True] == book.bids.levels and recorder.levels[False] == book.asks.levels
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_listeners_see_consistent_old_and_new_values(seed):
+    import random
+    rng = random.Random(seed)
+    recorder = Recorder()
+    large = LargeOrderIndex(2.5)
+    book = synced_book(recorder, large)
+    uid = 101
+    for _ in range(2000):
+        bids = [(f"{99 + rng.randint(0, 100) / 100:.2f}", f"{rng.choice([0, rng.random() * 5]):.4f}") for _ in range(3)]
+        asks = [(f"{100.01 + rng.randint(0, 100) / 100:.2f}", f"{rng.choice([0, rng.random() * 5]):.4f}") for _ in range(3)]
+        assert book.apply_diff(event(uid, uid + 1, bids, asks))
+        uid += 2
+    assert recorder.mismatches == []
+    assert recorder.levels[True] == book.bids.levels and recorder.levels[False] == book.asks.levels
+    for is_bid in (True, False):
+        expected = sorted((p, q) for p, q in book.side(is_bid).levels.items() if q > 2.5)
+        assert large.in_range(is_bid, 0, 1e9) == expected
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""Cubo tempo x prezzo: deduplica per id e query confrontate con build_bar"""
+
+import asyncio
+import random
+import threading
+
+import numpy as np
+import pytest
+
+import footprint_cube
+from footprint_cube import DAY_MS, CubeDay, FootprintCube, add_id
+from footprint_engine import build_bar
+
+DAY = 1_735_689_600_000   # 2025-01-01 UTC
+MINUTE = 60000
+
+
+def trade(trade_id, ts, price=100000.0, qty=1.0, sell=False):
+    return {'a': trade_id, 'p': f"{price:.2f}", 'q': f"{qty:.2f}", 'T': ts, 'm': sell}
+
+
+@pytest.fixture
+def hot(monkeypatch):
+    """Giorni dal DAY in poi caldi, qualunque sia la data di oggi"""
+    monkeypatch.setattr(FootprintCube, 'hot_floor', staticmethod(lambda now_ms=None: DAY))
+
+
+def volume(cube, minute_ts):
+    bars = cube.query(minute_ts, minute_ts, MINUTE, 0.01)
+    return bars[0]['volume'] if bars else 0.0
+
+
+# ----------------------------------------------------------------------
+# Deduplica
+# ----------------------------------------------------------------------
+
+def test_add_id_merges_disjoint_ranges():
+    ranges = []
+    for trade_id in (10, 12, 11, 5, 20, 6, 19):
+        assert add_id(ranges, trade_id)
+    assert ranges == [[5, 6], [10, 12], [19, 20]]
+    assert not any(add_id(ranges, i) for i in (5, 6, 10, 11, 12, 19, 20))
+    assert add_id(ranges, 7) and add_id(ranges, 8) and add_id(ranges, 9)
+    assert ranges == [[5, 12], [19, 20]]
+
+
+def test_stream_then_older_rest_trades_counted(hot):
+    cube = FootprintCube('BTCUSDT', directory=None, tick_size=0.01)
+    ts = DAY + 10 * MINUTE
+    for i in range(1500, 1510):
+        cube.on_trade(trade(i, ts + i))
+    cube.extend([trade(i, ts + i) for i in range(100, 110)])
+    assert volume(cube, ts) == 20.0
+
+
+def test_rest_refetch_overlapping_stream_not_double_counted(hot):
+    cube = FootprintCube('BTCUSDT', directory=None, tick_size=0.01)
+    ts = DAY + 10 * MINUTE
+    candle = [trade(i, ts + i) for i in range(100, 130)]
+    for t in candle[10:20]:
+        cube.on_trade(t)
+    cube.extend(candle[:15])
+    cube.extend(candle)
+    cube.extend(candle)   # stessa candela scaricata di nuovo
+    assert volume(cube, ts) == 30.0
+    assert cube.days[DAY].ids[10] == [[100, 129]]
+
+
+def test_id_ranges_persisted(hot, tmp_path):
+    cube = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    ts = DAY + 10 * MINUTE
+    cube.extend([trade(i, ts) for i in (100, 101, 1500, 1501)])
+    cube.save()
+
+    reloaded = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    reloaded.load()
+    assert reloaded.days[DAY].ids[10] == [[100, 101], [1500, 1501]]
+    reloaded.extend([trade(i, ts) for i in (101, 102, 1500)])
+    assert volume(reloaded, ts) == 5.0
+
+
+def test_old_single_range_files_still_load():
+    ids = np.array([(3, 10, 20)], footprint_cube.ID_RANGE)
+    day = CubeDay.from_arrays(DAY, np.zeros(0, footprint_cube.CELL), ids)
+    assert day.ids == {3: [[10, 20]]}
+
+
+# ----------------------------------------------------------------------
+# Query: stesso footprint di build_bar sugli stessi trade
+# ----------------------------------------------------------------------
+
+@pytest.fixture
+def market():
+    """Trade su due giorni: sparsi nel primo, fitti a cavallo della mezzanotte"""
+    rng = random.Random(49)
+    minutes = sorted(set(range(0, 1440, 7)) | set(range(1380, 1440)) | set(range(1440, 1500)) | {2879})
+    trades, trade_id, price = [], 1, 100000.0
+    for m in minutes:
+        for j in range(3):
+            price = round(price + rng.randint(-700, 700) * 0.01, 2)
+            trades.append(trade(trade_id, DAY + m * MINUTE + j * 1000, price,
+                                rng.randint(1, 300) / 100, rng.random() < 0.5))
+            trade_id += 1
+    return trades
+
+
+def expected_bars(trades, start, end, interval_ms, step):
+    """build_bar sui trade di ciascuna barra (kline ricostruita dai trade)"""
+    size = interval_ms or (end - start + 1)
+    groups = {}
+    for t in trades:
+        if start <= t['T'] <= end:
+            groups.setdefault(start + (t['T'] - start) // size * size, []).append(t)
+    bars = {}
+    for ts, group in sorted(groups.items()):
+        prices = [float(t['p']) for t in group]
+        vol = sum(float(t['q']) for t in group)
+        k = [ts, prices[0], max(prices), min(prices), prices[-1], vol]
+        bars[ts] = build_bar(k, group, step)
+    return bars
+
+
+def assert_matches(result, trades, start, end, interval_ms, step):
+    expected = expected_bars(trades, start, end, interval_ms, step)
+    assert [b['timestamp'] for b in result] == list(expected)
+    for bar in result:
+        ref = expected[bar['timestamp']]
+        # build_bar tiene il prezzo come rint * step (errore float), il cubo lo arrotonda
+        ref_levels = [(round(l['price'], 8), l['bid'], l['ask']) for l in ref['levels'] if l['bid'] or l['ask']]
+        levels = [(l['price'], round(l['bid'], 2), round(l['ask'], 2)) for l in bar['levels']]
+        assert levels == ref_levels
+        assert round(bar['volume'], 2) == ref['volume']
+        assert round(bar['delta'], 2) == ref['delta']
+
+
+def loaded_files(monkeypatch):
+    names = []
+    load = np.load
+
+    def spy(path, *args, **kwargs):
+        names.append(f"{path}".rsplit('/', 2)[-2:])
+        return load(path, *args, **kwargs)
+    monkeypatch.setattr(footprint_cube.np, 'load', spy)
+    return names
+
+
+QUERIES = [
+    # (inizio, fine, intervallo, step, file letto dai giorni freddi)
+    (DAY + 60 * MINUTE, DAY + 180 * MINUTE - 1, MINUTE, 0.01, 'base.npy'),
+    (DAY + 60 * MINUTE, DAY + 300 * MINUTE - 1, 5 * MINUTE, 5.0, '5m_5.npy'),
+    (DAY, DAY + DAY_MS - 1, 3600000, 10.0, '60m_10.npy'),
+    (DAY, DAY + 2 * DAY_MS - 1, DAY_MS, 25.0, '1440m_25.npy'),
+    (DAY + 1400 * MINUTE, DAY + 1480 * MINUTE - 1, 5 * MINUTE, 50.0, '5m_50.npy'),   # a cavallo dei giorni
+    (DAY + 23 * 3600000, DAY + DAY_MS + 3600000 - 1, 3600000, 5.0, '60m_5.npy'),
+    (DAY + 1400 * MINUTE, DAY + 1480 * MINUTE - 1, 5 * MINUTE, 7.0, 'base.npy'),      # step non precalcolato
+    (DAY + 17 * MINUTE, DAY + DAY_MS + 33 * MINUTE - 1, None, 10.0, 'base.npy'),     # profilo non allineato
+    (DAY, DAY + 2 * DAY_MS - 1, None, 10.0, '1440m_10.npy'),                         # profilo di giorni interi
+]
+
+
+@pytest.mark.parametrize('start,end,interval_ms,step,tier', QUERIES)
+def test_hot_query_matches_build_bar(hot, market, start, end, interval_ms, step, tier):
+    cube = FootprintCube('BTCUSDT', directory=None, tick_size=0.01)
+    cube.extend(market)
+    assert_matches(cube.query(start, end, interval_ms, step), market, start, end, interval_ms, step)
+
+
+@pytest.mark.parametrize('start,end,interval_ms,step,tier', QUERIES)
+def test_cold_query_reads_tier_and_matches_build_bar(monkeypatch, tmp_path, market, start, end, interval_ms, step, tier):
+    monkeypatch.setattr(FootprintCube, 'hot_floor', staticmethod(lambda now_ms=None: DAY))
+    cube = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    cube.extend(market)
+    cube.save()
+    # Giorni usciti dalla finestra calda: scaricati, le query leggono i file
+    monkeypatch.setattr(FootprintCube, 'hot_floor', staticmethod(lambda now_ms=None: DAY + 10 * DAY_MS))
+    cube.save()
+    assert not cube.days
+
+    files = loaded_files(monkeypatch)
+    result = cube.query(start, end, interval_ms, step)
+    assert {name for _, name in files} == {tier}
+    assert len(files) == len({day for day, _ in files})   # un file per giorno
+    assert_matches(result, market, start, end, interval_ms, step)
+
+
+# ----------------------------------------------------------------------
+# Tick del simbolo
+# ----------------------------------------------------------------------
+
+def test_trades_wait_for_exchange_tick(hot, tmp_path):
+    """Simbolo fuori tabella: niente fallback 0.01, i trade aspettano il tick"""
+    cube = FootprintCube('PEPEUSDT', directory=tmp_path)
+    ts = DAY + 10 * MINUTE
+    prices = ('0.00001234', '0.00001235', '0.00001236')
+    for i, p in enumerate(prices):
+        assert not cube.add({'a': i + 1, 'p': p, 'q': '1000000', 'T': ts, 'm': False})
+    assert not cube.days and len(cube.pending) == 3
+
+    cube.set_tick_size(1e-8)
+    bars = cube.query(ts, ts, MINUTE, 1e-8)
+    assert [l['price'] for l in bars[0]['levels']] == [1.236e-05, 1.235e-05, 1.234e-05]
+    cube.save()
+    assert cube._day_tick(DAY) == 1e-8
+
+
+def test_saved_hot_day_loaded_before_pending_trades(hot, tmp_path):
+    ts = DAY + 10 * MINUTE
+    cube = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    cube.extend([trade(i, ts) for i in range(1, 4)])
+    cube.save()
+
+    restarted = FootprintCube('BTCUSDT', directory=tmp_path)
+    restarted.on_trade(trade(4, ts + 1000))   # stream partito prima del tick
+    restarted.set_tick_size(0.01)
+    assert volume(restarted, ts) == 4.0
+
+
+def test_day_saved_with_other_tick_is_not_rewritten(hot, tmp_path, capsys):
+    ts = DAY + 10 * MINUTE
+    cube = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    cube.extend([trade(1, ts, 100000.01), trade(2, ts, 100000.02)])
+    cube.save()
+    base = tmp_path / 'btcusdt' / '2025-01-01' / 'base.npy'
+    before = base.read_bytes()
+
+    other = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.1)
+    assert not other.add(trade(3, ts, 100000.5))
+    other.save()
+    assert "salvato con tick 0.01 invece di 0.1" in capsys.readouterr().out
+    assert base.read_bytes() == before
+    # Le query sul giorno usano il tick con cui e' stato scritto
+    assert [l['price'] for l in other.query(ts, ts, MINUTE, 0.01)[0]['levels']] == [100000.02, 100000.01]
+
+
+# ----------------------------------------------------------------------
+# Salvataggio incrementale
+# ----------------------------------------------------------------------
+
+def test_incremental_saves_match_full_build(monkeypatch, tmp_path, market):
+    """Trade in ordine sparso (anche tardivi su minuti gia' salvati), un save per blocco"""
+    monkeypatch.setattr(FootprintCube, 'hot_floor', staticmethod(lambda now_ms=None: DAY))
+    shuffled = market[:]
+    random.Random(7).shuffle(shuffled)
+    cube = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    for i in range(0, len(shuffled), 150):
+        cube.extend(shuffled[i:i + 150])
+        cube.save()
+    monkeypatch.setattr(FootprintCube, 'hot_floor', staticmethod(lambda now_ms=None: DAY + 10 * DAY_MS))
+    cube.save()
+    assert not cube.days
+    for start, end, interval_ms, step, _ in QUERIES:
+        assert_matches(cube.query(start, end, interval_ms, step), market, start, end, interval_ms, step)
+
+
+def test_save_rewrites_only_from_the_changed_minute(hot, tmp_path, monkeypatch):
+    cube = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    cube.extend([trade(i, DAY + i * MINUTE) for i in range(1, 800, 3)])
+    cube.save()
+    base = tmp_path / 'btcusdt' / '2025-01-01' / 'base.npy'
+    before = base.read_bytes()
+
+    writes = []
+    write_tail = footprint_cube.write_tail
+
+    def spy(path, rows, t0):
+        writes.append((path.rsplit('/', 1)[-1], t0))
+        return write_tail(path, rows, t0)
+    monkeypatch.setattr(footprint_cube, 'write_tail', spy)
+    cube.extend([trade(5000, DAY + 700 * MINUTE + 1, qty=2.0)])   # tardivo su un minuto gia' salvato
+    cube.save()
+    assert dict(writes) == {'base.npy': 700, **{f"{m}m_{s:g}.npy": 700 // m * m
+                                                for m in (5, 60, 1440) for s in cube.steps}}
+    after = base.read_bytes()
+    offset = len(footprint_cube.npy_header(0, footprint_cube.CELL))
+    prefix = offset + np.count_nonzero(np.load(base)['t'] < 700) * footprint_cube.CELL.itemsize
+    assert after[offset:prefix] == before[offset:prefix] and after[prefix:] != before[prefix:]
+
+    writes.clear()
+    cube.save()   # niente di nuovo: nessun file riscritto
+    assert writes == []
+
+    reloaded = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    assert reloaded.load()
+    assert volume(reloaded, DAY + 700 * MINUTE) == 3.0
+
+
+def test_hub_writes_the_cube_off_the_event_loop(hot, tmp_path, monkeypatch):
+    from footprint_engine import MarketHub
+    hub = MarketHub(['BTCUSDT'])
+    engine = hub.engines['BTCUSDT']
+    monkeypatch.setattr(engine.tracker, 'save', lambda: None)
+    engine.cube = FootprintCube('BTCUSDT', directory=tmp_path, tick_size=0.01)
+    engine.cube.extend([trade(i, DAY + 10 * MINUTE) for i in range(1, 4)])
+
+    threads = []
+    write = engine.cube.write
+
+    def spy(changes):
+        threads.append(threading.current_thread())
+        return write(changes)
+    monkeypatch.setattr(engine.cube, 'write', spy)
+    asyncio.run(hub.save_state())
+    assert threads and threads[0] is not threading.main_thread()
+    assert (tmp_path / 'btcusdt' / '2025-01-01' / 'base.npy').exists()
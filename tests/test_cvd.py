@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""CVD: serie a somme prefisse e CVD di sessione"""
+
+import asyncio
+
+import footprint_engine
+from footprint_cvd import CVDSeries
+from footprint_engine import MarketEngine
+
+NOW = 1_760_000_000_000 // 86400000 * 86400000 + 20 * 3600000 + 30000   # 20:00:30 UTC
+DAY = NOW // 86400000 * 86400000
+
+
+def kline(ts, volume=2.0, taker_buy=1.5):
+    return [ts, '100', '101', '99', '100', str(volume), ts + 59999, '200', 10, str(taker_buy), '150', '0']
+
+
+def history(end_minute, count):
+    return [kline(end_minute - (count - 1 - i) * 60000) for i in range(count)]
+
+
+def test_longer_history_rebuilds_series():
+    series = CVDSeries(60000).sync(history(NOW // 60000 * 60000, 150))
+    assert len(series) == 149
+    series.sync(history(NOW // 60000 * 60000, 1000))
+    assert len(series) == 999
+    assert series.window()['cvd'] == 1000 * 1.0   # 999 chiuse + aperta, delta 1 ciascuna
+
+
+def test_session_cvd_fetches_whole_session_or_flags_partial(monkeypatch):
+    monkeypatch.setattr(footprint_engine.time, 'time', lambda: NOW / 1000)
+    limits = []
+    engine = MarketEngine('BTCUSDT')
+
+    async def klines(interval, limit=150, max_age=None):
+        limits.append(limit)
+        interval_ms = footprint_engine.get_interval_ms(interval)
+        return [kline(t) for t in range(NOW // interval_ms * interval_ms - (limit - 1) * interval_ms,
+                                        NOW + 1, interval_ms)]
+    monkeypatch.setattr(engine, 'get_klines', klines)
+
+    # 1m: 1201 barre dall'inizio del giorno, oltre le 1000 klines disponibili
+    data = asyncio.run(engine.get_cvd('1m', session=True, bars=False))
+    assert limits[-1] == footprint_engine.MAX_KLINES and data['partial'] is True
+
+    # 5m: 241 barre, coperte dalle 1000 klines
+    data = asyncio.run(engine.get_cvd('5m', session=True))
+    assert limits[-1] == footprint_engine.MAX_KLINES and data['partial'] is False
+    assert data['start'] == DAY and data['bars_count'] == 241
+
+    # 1h: 21 barre, bastano le 150 di default
+    data = asyncio.run(engine.get_cvd('1h', session=True, bars=False))
+    assert limits[-1] == 150 and data['partial'] is False and data['bars_count'] == 21
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""DepthLadder: bucket incrementali e profondita' cumulata dal touch"""
+
+import random
+
+import pytest
+
+from footprint_book import DepthLadder, OrderBook
+
+
+def random_book(seed):
+    rng = random.Random(seed)
+    book = OrderBook('BTCUSDT')
+    book.load_snapshot({
+        'lastUpdateId': 1,
+        'bids': [[f"{100 - i * 0.01:.2f}", f"{rng.random() * 3:.4f}"] for i in range(400)],
+        'asks': [[f"{100.01 + i * 0.01:.2f}", f"{rng.random() * 3:.4f}"] for i in range(400)],
+    })
+    return book, rng
+
+
+def expected_window(book, step, min_price, max_price):
+    """Somme per bucket e cumulate calcolate direttamente dai livelli del book"""
+    bucket = lambda p: round(p / step) * step
+    bids, asks = {}, {}
+    for p, q in book.bids.levels.items():
+        bids[bucket(p)] = bids.get(bucket(p), 0.0) + q
+    for p, q in book.asks.levels.items():
+        asks[bucket(p)] = asks.get(bucket(p), 0.0) + q
+    rows = sorted((b for b in set(bids) | set(asks) if min_price <= b <= max_price), reverse=True)
+    return [(b, bids.get(b, 0.0), asks.get(b, 0.0),
+             sum(q for x, q in bids.items() if x >= b), sum(q for x, q in asks.items() if x <= b)) for b in rows]
+
+
+@pytest.mark.parametrize('window', [(99.0, 101.0), (99.5, 99.9), (100.2, 101.0)])
+def test_cumulative_depth_starts_at_touch(window):
+    book, rng = random_book(7)
+    ladder = book.add_listener(DepthLadder(0.1))
+    uid = 2
+    for _ in range(500):
+        book.apply_diff({'U': uid, 'u': uid, 'E': 0,
+                         'b': [[f"{99 + rng.randint(0, 100) / 100:.2f}", f"{rng.choice([0, rng.random() * 3]):.4f}"]],
+                         'a': [[f"{100.01 + rng.randint(0, 100) / 100:.2f}", f"{rng.choice([0, rng.random() * 3]):.4f}"]]})
+        uid += 1
+    result = ladder.window(*window)
+    expected = expected_window(book, 0.1, *window)
+    assert [l['price'] for l in result['levels']] == pytest.approx([e[0] for e in expected])
+    for level, (_, bid, ask, cum_bid, cum_ask) in zip(result['levels'], expected):
+        assert level['bid'] == pytest.approx(bid) and level['ask'] == pytest.approx(ask)
+        assert level['cum_bid'] == pytest.approx(cum_bid) and level['cum_ask'] == pytest.approx(cum_ask)
+
+
+def test_cumulative_depth_grows_away_from_mid():
+    book, _ = random_book(3)
+    levels = book.add_listener(DepthLadder(0.05)).window(99.5, 100.5)['levels']
+    bid_rows = [l['cum_bid'] for l in levels if l['price'] <= 100.0]
+    ask_rows = [l['cum_ask'] for l in levels if l['price'] > 100.0]
+    assert bid_rows == sorted(bid_rows) and ask_rows == sorted(ask_rows, reverse=True)
+    assert all(l['cum_bid'] == 0 for l in levels if l['price'] > 100.01)
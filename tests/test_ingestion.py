@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Ingestion in shared memory: errori isolati per passo e stato per i worker"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+import footprint_async
+from footprint_engine import MarketHub
+from footprint_shm import SharedCache
+
+
+class Stop(Exception):
+    pass
+
+
+class Shared:
+    """Shared memory finta: uno slot troppo piccolo per la chiave `oversized`"""
+
+    def __init__(self, oversized=()):
+        self.published = {}
+        self.oversized = set(oversized)
+
+    def publish(self, key, value):
+        if key in self.oversized:
+            raise ValueError(f"payload oltre la capacita' dello slot {key}")
+        self.published[key] = value
+
+
+@pytest.fixture
+def one_round(monkeypatch):
+    async def stop(seconds):
+        raise Stop()
+    monkeypatch.setattr(footprint_async.asyncio, 'sleep', stop)
+
+    def run(loop, hub, shared, status):
+        with pytest.raises(Stop):
+            asyncio.run(loop(hub, shared, status))
+    return run
+
+
+def test_failing_engine_and_oversized_payload_do_not_stop_the_loop(monkeypatch, one_round, capsys):
+    hub = MarketHub(['BTCUSDT', 'ETHUSDT'])
+
+    async def broken():
+        raise RuntimeError("REST non raggiungibile")
+    monkeypatch.setattr(hub.engines['BTCUSDT'], 'get_orderbook', broken)
+
+    async def snapshot():
+        return {'lastUpdateId': 1, 'bids': [['3000', '1']], 'asks': [['3001', '1']]}
+    monkeypatch.setattr(hub.engines['ETHUSDT'], 'get_orderbook', snapshot)
+
+    shared, status = Shared(), footprint_async.new_status()
+    one_round(footprint_async.publish_orderbook_loop, hub, shared, status)
+    assert 'orderbook_ETHUSDT' in shared.published
+    assert status['errors'] == 1
+    assert status['last_error']['symbol'] == 'BTCUSDT'
+    assert 'orderbook' in status['loops']
+    assert shared.published[footprint_async.INGESTION_STATUS_KEY] is status
+    assert "[WARN] Ingestion orderbook BTCUSDT: RuntimeError" in capsys.readouterr().out
+
+    shared = Shared(oversized={'tape_updates_BTCUSDT'})
+    one_round(footprint_async.publish_events_loop, hub, shared, status)
+    assert {'absorption_BTCUSDT', 'sweeps_BTCUSDT', 'tape_updates_ETHUSDT'} <= set(shared.published)
+    assert status['errors'] == 2
+    assert status['last_error']['error'].startswith('ValueError')
+
+
+def test_workers_see_ingestion_staleness():
+    prefix = f"fptest{os.getpid()}"
+    writer, reader = SharedCache(prefix, create=True), SharedCache(prefix)
+    try:
+        assert footprint_async.ingestion_health(writer)['stale']
+
+        status = footprint_async.new_status()
+        footprint_async.loop_done(writer, status, 'footprints')
+        health = footprint_async.ingestion_health(reader)
+        assert not health['stale']
+        assert health['age'] < 5 and health['loops']['footprints'] < 5
+
+        later = time.time() + footprint_async.SHARED_MAX_AGE + 1
+        health = footprint_async.ingestion_health(reader, now=later)
+        assert health['stale'] and health['age'] > footprint_async.SHARED_MAX_AGE
+    finally:
+        reader.close()
+        writer.close()
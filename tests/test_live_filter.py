@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Filtri sull'ultima candela: soglia dagli sketch dello stream senza ordinare per richiesta"""
+
+import asyncio
+import random
+
+import pytest
+
+import footprint_engine
+from footprint_cube import FootprintCube
+from footprint_engine import MarketEngine, TradeView, build_bar, compute_stats
+
+NOW = 1_760_000_000_000 // 60000 * 60000 + 30000   # a meta' del minuto aperto
+OPEN = NOW // 60000 * 60000
+
+
+def live_engine(monkeypatch, count=120):
+    monkeypatch.setattr(footprint_engine.time, 'time', lambda: NOW / 1000)
+    engine = MarketEngine('BTCUSDT')
+    engine.cube = FootprintCube('BTCUSDT', directory=None)
+    rng = random.Random(35)
+    engine.on_trade({'a': 1, 'p': '100000', 'q': '1', 'T': OPEN - 30000, 'm': False})   # minuto parziale: avvia lo stream
+    for i in range(count):
+        engine.on_trade({'a': 2 + i, 'p': f"{100000 + rng.randint(-300, 300) * 0.1:.1f}",
+                         'q': f"{rng.lognormvariate(-2, 1.5):.5f}", 'T': OPEN + i * 100, 'm': rng.random() < 0.5})
+    trades = engine.live_trades_between(OPEN, OPEN + 59999)
+    prices = [float(t['p']) for t in trades]
+    k = [OPEN, prices[0], max(prices), min(prices), prices[-1], sum(float(t['q']) for t in trades)]
+    engine.last_candles['1m'] = (k, trades)
+    bars = [build_bar(k, trades, 10.0)]
+    return engine, k, trades, {'bars': bars, 'stats': compute_stats(bars)}
+
+
+def levels(data):
+    return [(l['price'], l['bid'], l['ask']) for l in data['bars'][-1]['levels']]
+
+
+@pytest.mark.parametrize('filters', [('percentile', 75, 0.5, 300), ('percentile', 90, 0.5, 300),
+                                     ('min_qty', 75, 0.5, 300), ('top_n', 75, 0.5, 20)])
+def test_open_live_candle_filtered_without_sorting(monkeypatch, filters):
+    engine, k, trades, data = live_engine(monkeypatch)
+    expected = footprint_engine.filtered_footprint(data, k, TradeView(trades), 10.0, filters)
+
+    def no_sort(trades):
+        raise AssertionError("TradeView ordinata per la candela aperta")
+    monkeypatch.setattr(footprint_engine, 'TradeView', no_sort)
+    result = asyncio.run(engine.apply_filters(data, '1m', 10.0, *filters))
+    # Sotto la capacita' dello sketch la soglia e' esatta: stesso footprint della vista ordinata
+    assert levels(result) == levels(expected)
+    assert result['bars'][-1]['volume'] == expected['bars'][-1]['volume']
+
+
+def test_closed_candle_keeps_sorted_view(monkeypatch):
+    engine, k, trades, data = live_engine(monkeypatch)
+    monkeypatch.setattr(footprint_engine.time, 'time', lambda: (OPEN + 60000) / 1000)
+    asyncio.run(engine.apply_filters(data, '1m', 10.0, 'percentile', 75))
+    assert ('1m', OPEN) in engine.trade_views
+
+
+def test_rolled_over_candle_refetched_or_flagged(monkeypatch):
+    engine, k, trades, data = live_engine(monkeypatch)
+    # Footprint in cache ancora sulla candela precedente: last_candles e' gia' sulla nuova
+    previous = [OPEN - 60000, '100000', '100010', '99990', '100000', '2']
+    older = [{'a': 1, 'p': '100000', 'q': '0.5', 'T': OPEN - 30000, 'm': False},
+             {'a': 9, 'p': '100005', 'q': '1.5', 'T': OPEN - 20000, 'm': True}]
+    stale = {'bars': [build_bar(previous, older, 10.0)], 'stats': {}}
+
+    async def klines(interval, limit=150, max_age=None):
+        return [previous, k]
+
+    async def candle_trades(interval, ts, max_pages=1):
+        assert ts == OPEN - 60000
+        return older
+    monkeypatch.setattr(engine, 'get_klines', klines)
+    monkeypatch.setattr(engine, 'get_trades', candle_trades)
+    result = asyncio.run(engine.apply_filters(stale, '1m', 10.0, 'min_qty', 75, 50.0, 300))
+    assert result['filtered']
+    assert [(l['bid'], l['ask']) for l in result['bars'][-1]['levels'] if l['bid'] or l['ask']] == [(1.5, 0.0)]
+
+    async def no_klines(interval, limit=150, max_age=None):
+        return [k]
+    monkeypatch.setattr(engine, 'get_klines', no_klines)
+    result = asyncio.run(engine.apply_filters(stale, '1m', 10.0, 'min_qty', 75, 50.0, 300))
+    assert result['filtered'] is False
+    assert result['bars'] == stale['bars']
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""/api/relevant_orders: stessa soglia per simbolo su ogni percorso"""
+
+import asyncio
+
+import pytest
+
+import footprint_async
+from footprint_engine import LARGE_ORDER_THRESHOLDS, MarketEngine, MarketHub
+
+KLINES = [[1700000000000 + i * 900000, '3000', '3010', '2990', '3000', '10'] for i in range(60)]
+SNAPSHOT = {'lastUpdateId': 1, 'bids': [['2999.00', '60'], ['2998.00', '10']], 'asks': [['3001.00', '5'], ['3002.00', '250']]}
+
+
+class Stop(Exception):
+    pass
+
+
+def eth_engine(monkeypatch, synced):
+    engine = MarketEngine('ETHUSDT')
+
+    async def klines(interval, limit=150, max_age=None):
+        return KLINES
+
+    async def orderbook():
+        return SNAPSHOT
+    monkeypatch.setattr(engine, 'get_klines', klines)
+    monkeypatch.setattr(engine, 'fetch_orderbook', orderbook)
+    if synced:
+        engine.book.load_snapshot(SNAPSHOT)
+        engine.last_price = 3000.0
+    return engine
+
+
+@pytest.mark.parametrize('synced', [True, False])
+def test_engine_uses_symbol_threshold(monkeypatch, synced):
+    engine = eth_engine(monkeypatch, synced)
+    data = asyncio.run(engine.get_relevant_orders('15m'))
+    assert data['summary']['min_btc_threshold'] == min(LARGE_ORDER_THRESHOLDS['ETHUSDT'])
+    assert [o['price'] for o in data['asks']] == [2999.0]          # ask del payload = bid del book
+    assert [o['price'] for o in data['bids']] == [3002.0]
+
+
+def test_ingestion_publishes_hub_result_for_workers(monkeypatch):
+    hub = MarketHub(['ETHUSDT'])
+    hub.engines['ETHUSDT'] = eth_engine(monkeypatch, True)
+    published = {}
+
+    class Shared:
+        def publish(self, key, value):
+            published[key] = value
+
+    async def stop(seconds):
+        raise Stop()
+    monkeypatch.setattr(footprint_async.asyncio, 'sleep', stop)
+    with pytest.raises(Stop):
+        asyncio.run(footprint_async.publish_orderbook_loop(hub, Shared()))
+    expected = asyncio.run(hub.engines['ETHUSDT'].get_relevant_orders('15m'))
+    assert published['relevant_orders_ETHUSDT_15m']['summary'] == expected['summary']
+    assert set(footprint_async.SHARED_RELEVANT_TFS) <= {k.rsplit('_', 1)[1] for k in published if k.startswith('relevant_orders_')}
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Sharding: assegnazione bilanciata e uguale tra web e shard"""
+
+import pytest
+
+from footprint_engine import SYMBOLS
+from footprint_shards import ShardRouter, assign_symbols, shard_for
+
+
+@pytest.mark.parametrize('shards', [1, 2, 3, 4, 8])
+def test_default_symbols_balanced_without_empty_shards(shards):
+    groups = assign_symbols(SYMBOLS, shards)
+    assert len(groups) == min(shards, len(SYMBOLS))
+    assert all(groups)
+    sizes = [len(g) for g in groups]
+    assert max(sizes) - min(sizes) <= 1
+    assert sorted(s for g in groups for s in g) == sorted(SYMBOLS)
+
+
+def test_assignment_independent_of_order_and_case():
+    symbols = ['solusdt', 'BTCUSDT', 'ETHUSDT', 'XRPUSDT', 'DOGEUSDT']
+    assert assign_symbols(symbols, 2) == assign_symbols(sorted(s.upper() for s in symbols), 2)
+    assert shard_for('solusdt', symbols, 2) == shard_for('SOLUSDT', list(reversed(symbols)), 2)
+
+
+def test_router_uses_the_shard_assignment():
+    symbols = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'XRPUSDT']
+    router = ShardRouter(symbols, 3)
+    groups = assign_symbols(symbols, 3)
+    assert len(router.clients) == 3
+    for symbol in symbols:
+        assert router.client(symbol).index == shard_for(symbol, symbols, 3)
+        assert symbol in groups[router.client(symbol).index]
+
+    # Piu' shard che simboli: nessun client verso shard mai avviati
+    assert len(ShardRouter(['BTCUSDT'], 4).clients) == 1
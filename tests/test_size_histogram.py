@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Istogramma delle size: stessi trade della scala del footprint"""
+
+from footprint_engine import build_bar
+
+
+def test_histogram_totals_match_ladder():
+    k = [60000, '100', '101', '99', '100', '6', 119999, '600', 3, '3', '300', '0']
+    trades = [
+        {'a': 1, 'p': '100', 'q': '1', 'T': 60001, 'm': False},
+        {'a': 2, 'p': '101', 'q': '2', 'T': 60002, 'm': True},
+        {'a': 3, 'p': '99', 'q': '3', 'T': 60003, 'm': False},
+        {'a': 4, 'p': '150', 'q': '50', 'T': 60004, 'm': False},   # fuori da high/low: escluso dalla scala
+    ]
+    bar = build_bar(k, trades, 1.0)
+    hist = bar['size_histogram']
+    assert round(sum(hist['ask_qty']), 4) == sum(level['ask'] for level in bar['levels']) == 4.0
+    assert round(sum(hist['bid_qty']), 4) == sum(level['bid'] for level in bar['levels']) == 2.0
+    assert sum(hist['ask_count']) + sum(hist['bid_count']) == 3
+
+
+def test_no_inside_trades_no_histogram():
+    k = [60000, '100', '101', '99', '100', '0', 119999, '0', 0, '0', '0', '0']
+    bar = build_bar(k, [{'a': 1, 'p': '150', 'q': '1', 'T': 60001, 'm': False}], 1.0)
+    assert bar['size_histogram'] is None
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""KLLSketch: errore di rango, compattazione e merge"""
+
+import random
+
+import numpy as np
+import pytest
+
+from footprint_sketch import KLLSketch, rank_error
+
+QUANTILES = np.linspace(0.01, 0.99, 99)
+
+
+def max_rank_error(sketch, data):
+    ordered = np.sort(data)
+    return max(abs(np.searchsorted(ordered, sketch.quantile(q)) / len(data) - q) for q in QUANTILES)
+
+
+@pytest.fixture(autouse=True)
+def seeded():
+    random.seed(12345)   # scelta pari/dispari delle compattazioni riproducibile
+
+
+def test_exact_below_capacity():
+    data = [float(x) for x in np.random.default_rng(0).permutation(150)]
+    sketch = KLLSketch().extend(data)
+    ordered = sorted(data)
+    for q in QUANTILES:
+        assert sketch.quantile(q) == ordered[int(len(data) * q)]
+    assert sketch.rank(75.0) == 75
+
+
+@pytest.mark.parametrize('k', [50, 200])
+@pytest.mark.parametrize('seed', range(5))
+def test_rank_error_within_bound(k, seed):
+    data = np.random.default_rng(seed).lognormal(0, 2, 50000)
+    sketch = KLLSketch(k).extend(data.tolist())
+    assert max_rank_error(sketch, data) <= rank_error(k)
+
+
+@pytest.mark.parametrize('k', [50, 200])
+@pytest.mark.parametrize('seed', range(5))
+def test_rank_error_within_bound_after_merge(k, seed):
+    data = np.random.default_rng(100 + seed).exponential(1.0, 50000)
+    parts = [KLLSketch(k).extend(chunk.tolist()) for chunk in np.array_split(data, 37)]
+    merged = KLLSketch(k)
+    for part in parts:
+        merged.merge(part)
+    assert len(merged) == len(data)
+    assert max_rank_error(merged, data) <= rank_error(k)
+    pairwise = KLLSketch(k).extend(data[:20000].tolist()).merge(KLLSketch(k).extend(data[20000:].tolist()))
+    assert max_rank_error(pairwise, data) <= rank_error(k)
+
+
+def test_compaction_bounds_memory_and_preserves_weight():
+    sketch = KLLSketch(100)
+    for i, value in enumerate(np.random.default_rng(1).random(200000).tolist()):
+        sketch.update(value)
+        if i % 997 == 0:
+            assert sketch.size < sketch.max_size
+    assert sketch.size == sum(len(level) for level in sketch.levels)
+    assert sketch.size < 400
+    _, cum = sketch._sorted_view()
+    assert cum[-1] == len(sketch) == 200000   # ogni compattazione conserva il peso totale
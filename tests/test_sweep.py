@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Sweep: livelli come prezzi distinti e conteggi per candela chiusa in cache"""
+
+import footprint_engine
+from footprint_engine import MarketEngine
+from footprint_sweep import SweepDetector, sweep_counts
+
+NOW = 1_760_000_000_000
+
+
+def trade(price, ts, qty=1.0, sell=False, trade_id=0):
+    return {'a': trade_id, 'p': str(price), 'q': str(qty), 'T': ts, 'm': sell}
+
+
+def test_ping_pong_counts_distinct_prices():
+    detector = SweepDetector().extend([trade(p, 1000 + i) for i, p in enumerate((100, 101, 100, 101))])
+    assert not detector.events   # due prezzi: sotto SWEEP_MIN_LEVELS
+
+
+def test_sweep_levels_are_distinct_prices():
+    prices = (100, 101, 102, 101, 102, 103)
+    detector = SweepDetector().extend([trade(p, 1000 + i) for i, p in enumerate(prices)])
+    event, = detector.events
+    assert event['levels'] == 4
+    assert (event['low'], event['high'], event['trades']) == (100, 103, 6)
+
+
+def test_closed_candle_sweeps_computed_once(monkeypatch):
+    monkeypatch.setattr(footprint_engine.time, 'time', lambda: NOW / 1000)
+    calls = []
+
+    def counting(trades):
+        calls.append(len(trades))
+        return sweep_counts(trades)
+    monkeypatch.setattr(footprint_engine, 'sweep_counts', counting)
+
+    engine = MarketEngine('BTCUSDT')
+    closed_ts = NOW // 60000 * 60000 - 60000
+    trades = [trade(100 + i, closed_ts + i, trade_id=i) for i in range(3)]
+    first = engine.candle_sweeps('1m', closed_ts, trades)
+    assert engine.candle_sweeps('1m', closed_ts, trades) == first == {'buy': 1, 'sell': 0, 'buy_qty': 3.0, 'sell_qty': 0.0}
+    assert calls == [3]
+
+    # Fetch piu' completo della stessa candela: ricalcolato
+    more = trades + [trade(99, closed_ts + 100, sell=True, trade_id=3)]
+    assert engine.candle_sweeps('1m', closed_ts, more)['buy'] == 1
+    assert calls == [3, 4]
+
+    # Candela aperta: ricalcolata a ogni richiesta
+    open_ts = NOW // 60000 * 60000
+    engine.candle_sweeps('1m', open_ts, trades)
+    engine.candle_sweeps('1m', open_ts, trades)
+    assert calls == [3, 4, 3, 3]